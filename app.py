@@ -2,9 +2,19 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import timedelta
-import numpy as np
 import json
+import threading
+from dashboard_data import (
+    read_predictions, read_aggregates, data_version, available_dates, window_start, geojson_path,
+    DASHBOARD_COLUMNS, MAP_QUALITY, DashboardStore, FigureCache, figure_nbytes,
+    get_alert_level, target_dates, calculate_metrics, map_frame, department_series, top_departments, national_timeline,
+    error_histogram, global_metrics
+)
+
+# Données partagées entre sessions (st.cache_resource) : une tranche modifiée est copiée, jamais le store
+# (Copy-on-Write, comportement par défaut à partir de pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # Configuration de la page
 st.set_page_config(
@@ -32,95 +42,96 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Fonction de chargement des données avec cache
-@st.cache_data
-def load_predictions():
-    """Charge les prédictions depuis le fichier parquet"""
+# Chargement des données : une seule instance par processus serveur, partagée par toutes les sessions
+# sans copie, remplacée quand les fichiers de prédictions changent (version)
+@st.cache_resource(max_entries=1)
+def load_aggregates(version):
+    """Charge les tables d'agrégats écrites par predict.py (None si absentes)"""
+    try:
+        return read_aggregates()
+    except Exception:
+        return None
+
+@st.cache_resource(max_entries=1)
+def load_date_range(version):
+    """Première et dernière date disponibles, lues dans les métadonnées Parquet"""
     try:
-        df = pd.read_parquet('data/predictions/predictions.parquet')
-        df['date'] = pd.to_datetime(df['date'])
-        df['target_date'] = pd.to_datetime(df['target_date'])
-        df['prediction_date'] = pd.to_datetime(df['prediction_date'])
-        return df
+        return available_dates()
     except Exception as e:
         st.error(f"Erreur lors du chargement des données : {e}")
         return None
 
-@st.cache_data
-def load_geojson():
-    """Charge le GeoJSON des départements français"""
+@st.cache_resource(max_entries=1)
+def shared_store(version):
+    """Emplacement du store unique du processus serveur pour une version des données"""
+    return {'store': None, 'start': None, 'performance': None, 'lock': threading.Lock()}
+
+def load_predictions(version, start):
+    """
+    Store des prédictions depuis start (colonnes du dashboard), indexé par date et par département.
+    Un seul store par processus : il est réutilisé tant qu'il couvre start, et remplacé par un
+    store couvrant depuis la date la plus ancienne demandée sinon (la période chargée ne fait que s'étendre)
+    """
+    holder = shared_store(version)
+    with holder['lock']:
+        if holder['store'] is not None and holder['start'] <= start:
+            return holder['store']
+        try:
+            aggregates = load_aggregates(version)
+            national = aggregates['national'] if aggregates is not None else None
+            holder['store'] = DashboardStore(read_predictions(columns=DASHBOARD_COLUMNS, start=start), national)
+            holder['start'], holder['performance'] = start, None
+            return holder['store']
+        except Exception as e:
+            st.error(f"Erreur lors du chargement des données : {e}")
+            return holder['store']
+
+def load_performance(version, store):
+    """Métriques globales de la période chargée, calculées une fois par store"""
+    holder = shared_store(version)
+    with holder['lock']:
+        if holder['store'] is not store or holder['performance'] is None:
+            performance = global_metrics(store)
+            if holder['store'] is not store:
+                return performance
+            holder['performance'] = performance
+        return holder['performance']
+
+@st.cache_resource
+def load_geojson(tier):
+    """Charge le GeoJSON des départements français (une fois par processus serveur et par niveau)"""
     try:
-        with open('data/departements.geojson', 'r', encoding='utf-8') as f:
+        with open(geojson_path(tier), 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
         st.warning(f"Impossible de charger la carte de France : {e}")
         return None
 
-# Fonction pour calculer le niveau d'alerte
-def get_alert_level(value):
-    """Retourne le niveau d'alerte basé sur le nombre de cas"""
-    if value > 150:
-        return "Rouge", "#dc3545"
-    elif value > 100:
-        return "Orange", "#fd7e14"
-    elif value > 50:
-        return "Jaune", "#ffc107"
-    else:
-        return "Vert", "#28a745"
-
-# Fonction pour calculer les métriques globales
-def calculate_metrics(df, selected_date):
-    """Calcule les métriques KPI pour une date donnée"""
-    # Filtrer les données pour la date sélectionnée
-    df_date = df[df['date'] == selected_date].copy()
-
-    if len(df_date) == 0:
-        return None
-
-    # Métrique 1 : Total national des cas
-    total_cases = df_date['y_target'].sum()
+@st.cache_resource
+def figure_cache():
+    """Cache des figures, commun à toutes les sessions du processus serveur"""
+    return FigureCache()
 
-    # Métrique 2 : Nombre de départements en alerte rouge
-    red_alert_count = len(df_date[df_date['y_target'] > 150])
-
-    # Métrique 3 : Tendance hebdomadaire
-    week_ago = selected_date - timedelta(days=7)
-    df_week_ago = df[df['date'] == week_ago]
-
-    if len(df_week_ago) > 0:
-        total_week_ago = df_week_ago['y_target'].sum()
-        trend_pct = ((total_cases - total_week_ago) / total_week_ago * 100) if total_week_ago > 0 else 0
-
-        if trend_pct > 5:
-            trend = "↗️ Hausse"
-            trend_color = "inverse"
-        elif trend_pct < -5:
-            trend = "↘️ Baisse"
-            trend_color = "normal"
-        else:
-            trend = "→ Stable"
-            trend_color = "off"
-    else:
-        trend = "→ N/A"
-        trend_color = "off"
-        trend_pct = 0
-
-    # Métrique 4 : Précision du modèle (MAE sur les 30 derniers jours)
-    date_30_days_ago = selected_date - timedelta(days=30)
-    df_recent = df[(df['date'] >= date_30_days_ago) & (df['date'] <= selected_date)]
-    mae = df_recent['abs_error'].mean() if len(df_recent) > 0 else 0
-
-    return {
-        'total_cases': total_cases,
-        'red_alert_count': red_alert_count,
-        'trend': trend,
-        'trend_pct': trend_pct,
-        'trend_color': trend_color,
-        'mae': mae
-    }
+def cached_figure(section, inputs, build, extra_bytes=0):
+    """Figure d'une section pour la version des données et ses entrées, reconstruite seulement si absente"""
+    return figure_cache().get_or_build((section, version, store.dates[0]) + inputs, build,
+                                       lambda fig: figure_nbytes(fig, extra_bytes))
 
 # Chargement des données
-df = load_predictions()
+version = data_version()
+date_range = load_date_range(version)
+store = None
+if date_range is not None:
+    # Période chargée : la dernière année, étendue quand la date choisie dans la sidebar est plus ancienne
+    first_date, last_date = date_range
+    requested_date = pd.Timestamp(st.session_state.get('selected_date', last_date))
+    start = window_start(requested_date, first_date, last_date)
+    store = load_predictions(version, start)
+df = store.df if store is not None else None
+aggregates = load_aggregates(version)
+# Les agrégats ne servent que s'ils couvrent les mêmes dates que les prédictions chargées
+if aggregates is not None and df is not None and aggregates['national'].index.max() != store.dates[-1]:
+    aggregates = None
 
 if df is not None:
     # Titre principal
@@ -132,16 +143,21 @@ if df is not None:
         st.header("Filtres")
 
         # Sélecteur de date
-        min_date = df['date'].min().date()
-        max_date = df['date'].max().date()
+        min_date = first_date.date()
+        max_date = last_date.date()
 
         selected_date = st.date_input(
             "Date de référence",
             value=max_date,
             min_value=min_date,
-            max_value=max_date
+            max_value=max_date,
+            key='selected_date'
         )
         selected_date = pd.Timestamp(selected_date)
+        st.caption(f"Historique chargé depuis le {store.dates[0].strftime('%d/%m/%Y')}")
+
+        # Niveau de détail de la carte (contours simplifiés, plus légers à transmettre)
+        map_quality = st.selectbox("Qualité de la carte", list(MAP_QUALITY))
 
         st.markdown("---")
         st.markdown("### À propos")
@@ -157,7 +173,7 @@ if df is not None:
         """)
 
     # Calcul des métriques
-    metrics = calculate_metrics(df, selected_date)
+    metrics = calculate_metrics(store, selected_date)
 
     if metrics:
         # Section 1 : Dashboard KPI
@@ -200,48 +216,51 @@ if df is not None:
         st.header("🗺️ Carte de France Interactive")
 
         # Charger le GeoJSON
-        geojson_data = load_geojson()
+        geojson_data = load_geojson(MAP_QUALITY[map_quality])
 
         if geojson_data:
-            # Filtrer les données pour la date sélectionnée
-            df_map = df[df['date'] == selected_date].copy()
-
-            # Ajouter les niveaux d'alerte
-            df_map['alert_level'] = df_map['y_target'].apply(lambda x: get_alert_level(x)[0])
-
-            # Créer la carte choroplèthe
-            fig_map = px.choropleth(
-                df_map,
-                geojson=geojson_data,
-                locations='department',
-                featureidkey='properties.code',
-                color='y_target',
-                color_continuous_scale=[
-                    [0, '#28a745'],      # Vert
-                    [0.33, '#ffc107'],   # Jaune
-                    [0.66, '#fd7e14'],   # Orange
-                    [1, '#dc3545']       # Rouge
-                ],
-                range_color=[0, 200],
-                labels={'y_target': 'Cas d\'urgences'},
-                hover_name='department',
-                hover_data={
-                    'department': False,
-                    'y_target': ':.0f',
-                    'prediction': ':.0f'
-                }
-            )
-
-            fig_map.update_geos(
-                fitbounds="locations",
-                visible=False
-            )
-
-            fig_map.update_layout(
-                title=f"Carte des alertes par département - {selected_date.strftime('%d/%m/%Y')}",
-                height=700,
-                margin={"r": 0, "t": 50, "l": 0, "b": 0}
-            )
+            def build_map():
+                # Données de la date sélectionnée, avec les niveaux d'alerte
+                df_map = map_frame(store, selected_date)
+
+                # Créer la carte choroplèthe
+                fig_map = px.choropleth(
+                    df_map,
+                    geojson=geojson_data,
+                    locations='department',
+                    featureidkey='properties.code',
+                    color='y_target',
+                    color_continuous_scale=[
+                        [0, '#28a745'],      # Vert
+                        [0.33, '#ffc107'],   # Jaune
+                        [0.66, '#fd7e14'],   # Orange
+                        [1, '#dc3545']       # Rouge
+                    ],
+                    range_color=[0, 200],
+                    labels={'y_target': 'Cas d\'urgences'},
+                    hover_name='department',
+                    hover_data={
+                        'department': False,
+                        'y_target': ':.0f',
+                        'prediction': ':.0f'
+                    }
+                )
+
+                fig_map.update_geos(
+                    fitbounds="locations",
+                    visible=False
+                )
+
+                fig_map.update_layout(
+                    title=f"Carte des alertes par département - {selected_date.strftime('%d/%m/%Y')}",
+                    height=700,
+                    margin={"r": 0, "t": 50, "l": 0, "b": 0}
+                )
+                return fig_map
+
+            # Le GeoJSON embarqué compte pour la taille de son fichier
+            fig_map = cached_figure('map', (selected_date, map_quality), build_map,
+                                    geojson_path(MAP_QUALITY[map_quality]).stat().st_size)
 
             st.plotly_chart(fig_map, use_container_width=True)
 
@@ -260,36 +279,40 @@ if df is not None:
             # Fallback si le GeoJSON n'est pas disponible
             st.warning("Carte GeoJSON non disponible. Affichage du Top 20 des départements.")
 
-            df_map = df[df['date'] == selected_date].copy()
-            df_map_sorted = df_map.sort_values('y_target', ascending=True).tail(20)
-
-            fig_map = go.Figure()
-
-            for idx, row in df_map_sorted.iterrows():
-                alert_level, color = get_alert_level(row['y_target'])
-                fig_map.add_trace(go.Bar(
-                    y=[row['department']],
-                    x=[row['y_target']],
-                    orientation='h',
-                    name=row['department'],
-                    marker=dict(color=color),
-                    hovertemplate=(
-                        f"<b>Département {row['department']}</b><br>" +
-                        f"Cas réels: {row['y_target']:.0f}<br>" +
-                        f"Prédiction J+7: {row['prediction']:.0f}<br>" +
-                        f"Niveau: {alert_level}<br>" +
-                        "<extra></extra>"
-                    ),
-                    showlegend=False
-                ))
-
-            fig_map.update_layout(
-                title=f"Top 20 départements les plus touchés - {selected_date.strftime('%d/%m/%Y')}",
-                xaxis_title="Nombre de cas d'urgences",
-                yaxis_title="Département",
-                height=600,
-                hovermode='closest'
-            )
+            def build_top20():
+                df_map = map_frame(store, selected_date)
+                df_map_sorted = df_map.sort_values('y_target', ascending=True).tail(20)
+
+                fig_map = go.Figure()
+
+                for idx, row in df_map_sorted.iterrows():
+                    alert_level, color = get_alert_level(row['y_target'])
+                    fig_map.add_trace(go.Bar(
+                        y=[row['department']],
+                        x=[row['y_target']],
+                        orientation='h',
+                        name=row['department'],
+                        marker=dict(color=color),
+                        hovertemplate=(
+                            f"<b>Département {row['department']}</b><br>" +
+                            f"Cas réels: {row['y_target']:.0f}<br>" +
+                            f"Prédiction J+7: {row['prediction']:.0f}<br>" +
+                            f"Niveau: {alert_level}<br>" +
+                            "<extra></extra>"
+                        ),
+                        showlegend=False
+                    ))
+
+                fig_map.update_layout(
+                    title=f"Top 20 départements les plus touchés - {selected_date.strftime('%d/%m/%Y')}",
+                    xaxis_title="Nombre de cas d'urgences",
+                    yaxis_title="Département",
+                    height=600,
+                    hovermode='closest'
+                )
+                return fig_map
+
+            fig_map = cached_figure('top20', (selected_date,), build_top20)
 
             st.plotly_chart(fig_map, use_container_width=True)
 
@@ -299,7 +322,8 @@ if df is not None:
         st.header("📈 Évolution Temporelle et Prédictions")
 
         # Sélecteur de département
-        departments = sorted(df['department'].unique())
+        # Codes triés pour la liste (le store les range dans l'ordre des features du GeoJSON)
+        departments = sorted(store.departments)
         selected_dept = st.selectbox(
             "Sélectionnez un département",
             departments,
@@ -307,120 +331,125 @@ if df is not None:
         )
 
         # Filtrer les données pour le département sélectionné
-        df_dept = df[df['department'] == selected_dept].sort_values('date')
-
-        # Créer le graphique temporel
-        fig_time = go.Figure()
-
-        # Ligne des valeurs réelles
-        fig_time.add_trace(go.Scatter(
-            x=df_dept['date'],
-            y=df_dept['y_target'],
-            mode='lines',
-            name='Valeurs réelles',
-            line=dict(color='#0066cc', width=2),
-            hovertemplate='Date: %{x|%d/%m/%Y}<br>Cas réels: %{y:.0f}<extra></extra>'
-        ))
-
-        # Ligne des prédictions
-        fig_time.add_trace(go.Scatter(
-            x=df_dept['date'],
-            y=df_dept['prediction'],
-            mode='lines',
-            name='Prédictions J+7',
-            line=dict(color='#ff6b35', width=2, dash='dot'),
-            hovertemplate='Date: %{x|%d/%m/%Y}<br>Prédiction: %{y:.0f}<extra></extra>'
-        ))
-
-        # Ajouter une ligne verticale pour la date sélectionnée avec add_shape
-        y_max = max(df_dept['y_target'].max(), df_dept['prediction'].max())
-        fig_time.add_shape(
-            type="line",
-            x0=selected_date, x1=selected_date,
-            y0=0, y1=y_max * 1.1,
-            line=dict(color="green", width=2, dash="dash")
-        )
-        fig_time.add_annotation(
-            x=selected_date,
-            y=y_max * 1.1,
-            text="Aujourd'hui",
-            showarrow=False,
-            yshift=10,
-            font=dict(color="green")
-        )
+        df_dept = department_series(store, selected_dept)
 
-        # Ajouter les seuils d'alerte avec add_shape
-        fig_time.add_shape(
-            type="line",
-            x0=df_dept['date'].min(), x1=df_dept['date'].max(),
-            y0=150, y1=150,
-            line=dict(color="#dc3545", width=1, dash="dash")
-        )
-        fig_time.add_annotation(
-            x=df_dept['date'].max(),
-            y=150,
-            text="Seuil rouge",
-            showarrow=False,
-            xshift=50,
-            font=dict(color="#dc3545", size=10)
-        )
+        def build_time():
+            # Créer le graphique temporel
+            fig_time = go.Figure()
 
-        fig_time.add_shape(
-            type="line",
-            x0=df_dept['date'].min(), x1=df_dept['date'].max(),
-            y0=100, y1=100,
-            line=dict(color="#fd7e14", width=1, dash="dash")
-        )
-        fig_time.add_annotation(
-            x=df_dept['date'].max(),
-            y=100,
-            text="Seuil orange",
-            showarrow=False,
-            xshift=50,
-            font=dict(color="#fd7e14", size=10)
-        )
+            # Ligne des valeurs réelles
+            fig_time.add_trace(go.Scatter(
+                x=df_dept['date'],
+                y=df_dept['y_target'],
+                mode='lines',
+                name='Valeurs réelles',
+                line=dict(color='#0066cc', width=2),
+                hovertemplate='Date: %{x|%d/%m/%Y}<br>Cas réels: %{y:.0f}<extra></extra>'
+            ))
 
-        fig_time.add_shape(
-            type="line",
-            x0=df_dept['date'].min(), x1=df_dept['date'].max(),
-            y0=50, y1=50,
-            line=dict(color="#ffc107", width=1, dash="dash")
-        )
-        fig_time.add_annotation(
-            x=df_dept['date'].max(),
-            y=50,
-            text="Seuil jaune",
-            showarrow=False,
-            xshift=50,
-            font=dict(color="#ffc107", size=10)
-        )
+            # Ligne des prédictions
+            fig_time.add_trace(go.Scatter(
+                x=df_dept['date'],
+                y=df_dept['prediction'],
+                mode='lines',
+                name='Prédictions J+7',
+                line=dict(color='#ff6b35', width=2, dash='dot'),
+                hovertemplate='Date: %{x|%d/%m/%Y}<br>Prédiction: %{y:.0f}<extra></extra>'
+            ))
 
-        fig_time.update_layout(
-            title=f"Département {selected_dept} - Cas réels vs Prédictions",
-            xaxis_title="Date",
-            yaxis_title="Nombre de cas d'urgences",
-            height=500,
-            hovermode='x unified',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
+            # Ajouter une ligne verticale pour la date sélectionnée avec add_shape
+            y_max = max(df_dept['y_target'].max(), df_dept['prediction'].max())
+            fig_time.add_shape(
+                type="line",
+                x0=selected_date, x1=selected_date,
+                y0=0, y1=y_max * 1.1,
+                line=dict(color="green", width=2, dash="dash")
+            )
+            fig_time.add_annotation(
+                x=selected_date,
+                y=y_max * 1.1,
+                text="Aujourd'hui",
+                showarrow=False,
+                yshift=10,
+                font=dict(color="green")
+            )
+
+            # Ajouter les seuils d'alerte avec add_shape
+            fig_time.add_shape(
+                type="line",
+                x0=df_dept['date'].min(), x1=df_dept['date'].max(),
+                y0=150, y1=150,
+                line=dict(color="#dc3545", width=1, dash="dash")
+            )
+            fig_time.add_annotation(
+                x=df_dept['date'].max(),
+                y=150,
+                text="Seuil rouge",
+                showarrow=False,
+                xshift=50,
+                font=dict(color="#dc3545", size=10)
+            )
+
+            fig_time.add_shape(
+                type="line",
+                x0=df_dept['date'].min(), x1=df_dept['date'].max(),
+                y0=100, y1=100,
+                line=dict(color="#fd7e14", width=1, dash="dash")
+            )
+            fig_time.add_annotation(
+                x=df_dept['date'].max(),
+                y=100,
+                text="Seuil orange",
+                showarrow=False,
+                xshift=50,
+                font=dict(color="#fd7e14", size=10)
             )
-        )
+
+            fig_time.add_shape(
+                type="line",
+                x0=df_dept['date'].min(), x1=df_dept['date'].max(),
+                y0=50, y1=50,
+                line=dict(color="#ffc107", width=1, dash="dash")
+            )
+            fig_time.add_annotation(
+                x=df_dept['date'].max(),
+                y=50,
+                text="Seuil jaune",
+                showarrow=False,
+                xshift=50,
+                font=dict(color="#ffc107", size=10)
+            )
+
+            fig_time.update_layout(
+                title=f"Département {selected_dept} - Cas réels vs Prédictions",
+                xaxis_title="Date",
+                yaxis_title="Nombre de cas d'urgences",
+                height=500,
+                hovermode='x unified',
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="right",
+                    x=1
+                )
+            )
+            return fig_time
+
+        fig_time = cached_figure('department', (selected_dept, selected_date), build_time)
 
         st.plotly_chart(fig_time, use_container_width=True)
 
         # Afficher la prédiction J+7 pour ce département
-        latest_prediction = df_dept[df_dept['date'] == selected_date]['prediction'].values
-        if len(latest_prediction) > 0:
-            pred_value = latest_prediction[0]
+        # Série triée par date : recherche dichotomique de la date sélectionnée
+        position = df_dept['date'].searchsorted(selected_date)
+        if position < len(df_dept) and df_dept['date'].iloc[position] == selected_date:
+            pred_value = df_dept['prediction'].iloc[position]
             alert_level, color = get_alert_level(pred_value)
 
             st.markdown(f"""
             <div style='background-color: {color}; color: white; padding: 15px; border-radius: 10px; text-align: center;'>
-                <h3>Prédiction J+7 pour le département {selected_dept}</h3>
+                <h3>Prédiction J+7 pour le département {selected_dept} ({target_dates(selected_date).strftime('%d/%m/%Y')})</h3>
                 <h2>{pred_value:.0f} cas attendus</h2>
                 <h3>Niveau d'alerte : {alert_level}</h3>
             </div>
@@ -435,34 +464,42 @@ if df is not None:
 
         with col_top1:
             st.subheader("Les plus touchés actuellement")
-            df_top = df[df['date'] == selected_date].nlargest(10, 'y_target')[['department', 'y_target']]
-
-            fig_top = px.bar(
-                df_top,
-                x='y_target',
-                y='department',
-                orientation='h',
-                color='y_target',
-                color_continuous_scale=['#28a745', '#ffc107', '#fd7e14', '#dc3545'],
-                labels={'y_target': 'Cas', 'department': 'Département'}
-            )
-            fig_top.update_layout(height=400, showlegend=False)
+            def build_top():
+                df_top = top_departments(store, selected_date, 'y_target')
+
+                fig_top = px.bar(
+                    df_top,
+                    x='y_target',
+                    y='department',
+                    orientation='h',
+                    color='y_target',
+                    color_continuous_scale=['#28a745', '#ffc107', '#fd7e14', '#dc3545'],
+                    labels={'y_target': 'Cas', 'department': 'Département'}
+                )
+                fig_top.update_layout(height=400, showlegend=False)
+                return fig_top
+
+            fig_top = cached_figure('top_cases', (selected_date,), build_top)
             st.plotly_chart(fig_top, use_container_width=True)
 
         with col_top2:
             st.subheader("Prédictions J+7 les plus élevées")
-            df_pred_top = df[df['date'] == selected_date].nlargest(10, 'prediction')[['department', 'prediction']]
-
-            fig_pred_top = px.bar(
-                df_pred_top,
-                x='prediction',
-                y='department',
-                orientation='h',
-                color='prediction',
-                color_continuous_scale=['#28a745', '#ffc107', '#fd7e14', '#dc3545'],
-                labels={'prediction': 'Prédiction', 'department': 'Département'}
-            )
-            fig_pred_top.update_layout(height=400, showlegend=False)
+            def build_pred_top():
+                df_pred_top = top_departments(store, selected_date, 'prediction')
+
+                fig_pred_top = px.bar(
+                    df_pred_top,
+                    x='prediction',
+                    y='department',
+                    orientation='h',
+                    color='prediction',
+                    color_continuous_scale=['#28a745', '#ffc107', '#fd7e14', '#dc3545'],
+                    labels={'prediction': 'Prédiction', 'department': 'Département'}
+                )
+                fig_pred_top.update_layout(height=400, showlegend=False)
+                return fig_pred_top
+
+            fig_pred_top = cached_figure('top_predictions', (selected_date,), build_pred_top)
             st.plotly_chart(fig_pred_top, use_container_width=True)
 
         st.markdown("---")
@@ -470,26 +507,24 @@ if df is not None:
         # Section 5 : Timeline des épidémies
         st.header("⏱️ Timeline des Épidémies")
 
-        # Agréger les données par date pour voir l'évolution nationale
-        df_timeline = df.groupby('date').agg({
-            'y_target': 'sum',
-            'prediction': 'sum'
-        }).reset_index()
-
-        # Séparer par année
-        df_timeline['year'] = df_timeline['date'].dt.year
-
-        fig_timeline = px.area(
-            df_timeline,
-            x='date',
-            y='y_target',
-            color='year',
-            title="Évolution des cas d'urgences au niveau national",
-            labels={'y_target': 'Total cas', 'date': 'Date', 'year': 'Année'},
-            color_discrete_sequence=['#0066cc', '#ff6b35']
-        )
+        def build_timeline():
+            # Totaux nationaux par date : tout l'historique si la table d'agrégats est disponible
+            df_timeline = national_timeline(store, aggregates['national'] if aggregates is not None else None)
+
+            fig_timeline = px.area(
+                df_timeline,
+                x='date',
+                y='y_target',
+                color='year',
+                title="Évolution des cas d'urgences au niveau national",
+                labels={'y_target': 'Total cas', 'date': 'Date', 'year': 'Année'},
+                color_discrete_sequence=['#0066cc', '#ff6b35']
+            )
 
-        fig_timeline.update_layout(height=400)
+            fig_timeline.update_layout(height=400)
+            return fig_timeline
+
+        fig_timeline = cached_figure('timeline', (), build_timeline)
         st.plotly_chart(fig_timeline, use_container_width=True)
 
         st.markdown("---")
@@ -497,76 +532,109 @@ if df is not None:
         # Section 6 : Performance du modèle
         st.header("🎯 Performance du Modèle")
 
+        # La section porte sur la période chargée ; seule la dernière ligne de métriques couvre l'historique complet
+        st.caption(f"Période évaluée : du {store.dates[0].strftime('%d/%m/%Y')} au "
+                   f"{store.dates[-1].strftime('%d/%m/%Y')} (période chargée, étendue en choisissant "
+                   f"une date de référence plus ancienne)")
+
         col_perf1, col_perf2 = st.columns(2)
 
         with col_perf1:
             st.subheader("Distribution des erreurs")
 
-            # Histogramme des erreurs
-            fig_error_dist = px.histogram(
-                df,
-                x='error',
-                nbins=50,
-                title="Distribution des erreurs de prédiction",
-                labels={'error': 'Erreur', 'count': 'Fréquence'},
-                color_discrete_sequence=['#0066cc']
-            )
-            fig_error_dist.update_layout(height=400)
+            errors_department = selected_dept if st.checkbox(f"Département {selected_dept} uniquement") else None
+
+            def build_error_dist():
+                # Histogramme des erreurs (intervalles calculés une fois par version des données)
+                df_bins = error_histogram(store, errors_department)
+                fig_error_dist = go.Figure(go.Bar(
+                    x=df_bins['bin_center'],
+                    y=df_bins['count'],
+                    width=store.histogram_edges[1] - store.histogram_edges[0],
+                    marker=dict(color='#0066cc'),
+                    hovertemplate='Erreur: %{x:.1f}<br>Fréquence: %{y}<extra></extra>'
+                ))
+                fig_error_dist.update_layout(
+                    title="Distribution des erreurs de prédiction",
+                    xaxis_title="Erreur",
+                    yaxis_title="Fréquence",
+                    bargap=0,
+                    height=400
+                )
+                return fig_error_dist
+
+            fig_error_dist = cached_figure('errors', (errors_department,), build_error_dist)
             st.plotly_chart(fig_error_dist, use_container_width=True)
 
         with col_perf2:
             st.subheader("Valeurs réelles vs Prédictions")
 
-            # Scatter plot
-            df_sample = df.sample(min(1000, len(df)))  # Échantillon pour performance
-
-            fig_scatter = px.scatter(
-                df_sample,
-                x='y_target',
-                y='prediction',
-                color='abs_error',
-                color_continuous_scale='Reds',
-                title="Prédictions vs Valeurs réelles",
-                labels={'y_target': 'Valeur réelle', 'prediction': 'Prédiction', 'abs_error': 'Erreur absolue'}
-            )
+            def build_scatter():
+                # Scatter plot sur l'échantillon stratifié fixe du store
+                df_sample = store.sample
+
+                fig_scatter = px.scatter(
+                    df_sample,
+                    x='y_target',
+                    y='prediction',
+                    color='abs_error',
+                    color_continuous_scale='Reds',
+                    title="Prédictions vs Valeurs réelles",
+                    labels={'y_target': 'Valeur réelle', 'prediction': 'Prédiction', 'abs_error': 'Erreur absolue'}
+                )
+
+                # Ligne de référence parfaite
+                max_val = max(df_sample['y_target'].max(), df_sample['prediction'].max())
+                fig_scatter.add_trace(go.Scatter(
+                    x=[0, max_val],
+                    y=[0, max_val],
+                    mode='lines',
+                    name='Prédiction parfaite',
+                    line=dict(color='red', dash='dash')
+                ))
 
-            # Ligne de référence parfaite
-            max_val = max(df_sample['y_target'].max(), df_sample['prediction'].max())
-            fig_scatter.add_trace(go.Scatter(
-                x=[0, max_val],
-                y=[0, max_val],
-                mode='lines',
-                name='Prédiction parfaite',
-                line=dict(color='red', dash='dash')
-            ))
+                fig_scatter.update_layout(height=400)
+                return fig_scatter
 
-            fig_scatter.update_layout(height=400)
+            fig_scatter = cached_figure('scatter', (), build_scatter)
             st.plotly_chart(fig_scatter, use_container_width=True)
 
         # Métriques de performance globale
         st.subheader("Métriques globales")
         col_m1, col_m2, col_m3, col_m4 = st.columns(4)
 
-        mae_global = df['abs_error'].mean()
-        rmse_global = np.sqrt((df['error'] ** 2).mean())
-
-        # R² calculation
-        ss_res = ((df['y_target'] - df['prediction']) ** 2).sum()
-        ss_tot = ((df['y_target'] - df['y_target'].mean()) ** 2).sum()
-        r2 = 1 - (ss_res / ss_tot) if ss_tot != 0 else 0
+        performance = load_performance(version, store)
 
         with col_m1:
-            st.metric("MAE (Erreur Absolue Moyenne)", f"{mae_global:.2f}")
+            st.metric("MAE (Erreur Absolue Moyenne)", f"{performance['mae']:.2f}")
 
         with col_m2:
-            st.metric("RMSE (Erreur Quadratique)", f"{rmse_global:.2f}")
+            st.metric("RMSE (Erreur Quadratique)", f"{performance['rmse']:.2f}")
 
         with col_m3:
-            st.metric("R² Score", f"{r2:.3f}")
+            st.metric("R² Score", f"{performance['r2']:.3f}")
 
         with col_m4:
-            precision_pct = (1 - (mae_global / df['y_target'].mean())) * 100
-            st.metric("Précision", f"{precision_pct:.1f}%")
+            st.metric("Précision", f"{performance['precision_pct']:.1f}%")
+
+        # Mêmes métriques sur tout l'historique, déduites des sommes suffisantes (sufficient_stats)
+        if aggregates is not None:
+            history = global_metrics(store, aggregates)
+            st.caption(f"Historique complet : du {aggregates['national'].index.min().strftime('%d/%m/%Y')} au "
+                       f"{aggregates['national'].index.max().strftime('%d/%m/%Y')}")
+            col_h1, col_h2, col_h3, col_h4 = st.columns(4)
+
+            with col_h1:
+                st.metric("MAE (historique)", f"{history['mae']:.2f}")
+
+            with col_h2:
+                st.metric("RMSE (historique)", f"{history['rmse']:.2f}")
+
+            with col_h3:
+                st.metric("R² (historique)", f"{history['r2']:.3f}")
+
+            with col_h4:
+                st.metric("Précision (historique)", f"{history['precision_pct']:.1f}%")
 
     else:
         st.warning("Aucune donnée disponible pour la date sélectionnée")
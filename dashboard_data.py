@@ -0,0 +1,584 @@
+"""
+Préparation des données du dashboard LUMEN, sans dépendance à Streamlit :
+app.py affiche, ce module calcule. Les fonctions sont aussi mesurées par
+scripts/benchmark_pipeline.py.
+
+Le DashboardStore est construit une fois par version des prédictions et
+partagé par toutes les sessions : les fonctions ne le modifient jamais et
+renvoient des tranches ou des copies.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+PREDICTIONS_PATH = Path('data/predictions/predictions.parquet')
+DATASET_DIR = Path('data/predictions/dataset')
+AGGREGATES_DIR = Path('data/predictions/aggregates')
+GEOJSON_PATH = Path('data/departements.geojson')
+GEOJSON_DIR = Path('data/geojson')
+
+# Colonnes utilisées par le dashboard (target_date et prediction_date ne sont pas lues)
+DASHBOARD_COLUMNS = ['date', 'department', 'y_target', 'prediction', 'error', 'abs_error']
+
+# Colonnes de valeurs, gardées en float32 en mémoire (les sommes sont faites en float64)
+VALUE_COLUMNS = ['y_target', 'prediction', 'error', 'abs_error']
+
+# Horizon de prédiction : target_date = date + 7 jours, comme target_date et prediction_date écrites
+# par make_features.py et predict.py (calculée à la demande ; seules les données de démonstration
+# ont prediction_date = date)
+PREDICTION_HORIZON = timedelta(days=7)
+
+# Seuils de cas (strictement supérieurs) des niveaux Jaune, Orange, Rouge : seule définition,
+# importée aussi par scripts/prediction_aggregates.py pour les tables d'alertes
+ALERT_THRESHOLDS = (50, 100, 150)
+ALERT_LEVELS = ['Vert', 'Jaune', 'Orange', 'Rouge']
+RED_ALERT = 3
+
+# Période chargée par défaut (jours avant la dernière date), étendue à la demande
+RECENT_DAYS = 365
+
+# Histogramme des erreurs et échantillon du nuage de points, calculés une fois par version des données
+HISTOGRAM_BINS = 50
+SAMPLE_SIZE = 1000
+SAMPLE_SEED = 42
+
+# Mémoire maximale des figures en cache (taille estimée de leurs tableaux de données)
+FIGURE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Propriétés de trace portant les données d'une figure, comptées par figure_nbytes
+FIGURE_ARRAY_PROPERTIES = ('x', 'y', 'z', 'locations', 'customdata', 'text', 'hovertext',
+                           'values', 'labels')
+
+# Qualité de la carte → niveau de détail écrit par scripts/simplify_geojson.py (None : GeoJSON d'origine)
+MAP_QUALITY = {
+    'Standard': 'medium',
+    'Rapide': 'low',
+    'Haute': 'high',
+    'Originale': None
+}
+
+
+def partition_date(path):
+    """Date d'une partition date=AAAA-MM-JJ du dataset incrémental"""
+    return pd.Timestamp(path.name.split('=', 1)[1])
+
+
+def new_partitions(dataset_dir, last_date):
+    """Partitions ajoutées par `predict.py --incremental` après last_date"""
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.exists():
+        return []
+    last_name = f"date={last_date:%Y-%m-%d}"
+    return sorted(p for p in dataset_dir.iterdir() if p.name.startswith('date=') and p.name > last_name)
+
+
+def parquet_date_range(path):
+    """Première et dernière date d'un Parquet, d'après les statistiques de ses row groups"""
+    metadata = pq.ParquetFile(path).metadata
+    column = metadata.schema.to_arrow_schema().get_field_index('date')
+    stats = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+    if stats and all(s is not None and s.has_min_max for s in stats):
+        return pd.Timestamp(min(s.min for s in stats)), pd.Timestamp(max(s.max for s in stats))
+    dates = pd.to_datetime(pd.read_parquet(path, columns=['date'])['date'])
+    return dates.min(), dates.max()
+
+
+def available_dates(predictions_path=PREDICTIONS_PATH, dataset_dir=DATASET_DIR):
+    """Période couverte par les prédictions, sans les charger"""
+    first_date, last_date = parquet_date_range(predictions_path)
+    parts = new_partitions(dataset_dir, last_date)
+    if parts:
+        last_date = partition_date(parts[-1])
+    return first_date, last_date
+
+
+def window_start(selected_date, first_date, last_date, recent_days=RECENT_DAYS):
+    """
+    Début de la période chargée : les recent_days derniers jours, étendue au
+    1er janvier de l'année nécessaire quand la date choisie (et ses 30 jours
+    de MAE glissante) sort de cette période
+    """
+    start = max(first_date, last_date - timedelta(days=recent_days))
+    needed = selected_date - timedelta(days=30)
+    if needed < start:
+        start = max(first_date, pd.Timestamp(needed.year, 1, 1))
+    return start
+
+
+def read_predictions(predictions_path=PREDICTIONS_PATH, dataset_dir=DATASET_DIR, columns=None, start=None,
+                     end=None, departments=None):
+    """
+    Prédictions complètes, plus les partitions ajoutées depuis par `predict.py --incremental`.
+    columns limite les colonnes lues ; start, end (inclus) et departments sont
+    passés en filtres à pyarrow, qui saute les row groups hors période.
+    """
+    filters = []
+    if start is not None:
+        filters.append(('date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('date', '<=', pd.Timestamp(end)))
+    if departments is not None:
+        filters.append(('department', 'in', list(departments)))
+
+    df = pd.read_parquet(predictions_path, columns=columns, filters=filters or None)
+    df['date'] = pd.to_datetime(df['date'])
+
+    parts = [p for p in new_partitions(dataset_dir, parquet_date_range(predictions_path)[1])
+             if (start is None or partition_date(p) >= pd.Timestamp(start))
+             and (end is None or partition_date(p) <= pd.Timestamp(end))]
+    if parts:
+        # La date des partitions est dans le nom du dossier, pas dans les fichiers
+        part_columns = [c for c in columns if c != 'date'] if columns is not None else None
+        part_filters = [f for f in filters if f[0] != 'date'] or None
+        new_df = pd.concat(
+            [pd.read_parquet(p, columns=part_columns, filters=part_filters).assign(date=partition_date(p))
+             for p in parts],
+            ignore_index=True
+        )
+        df = pd.concat([df, new_df], ignore_index=True)
+
+    for column in ('target_date', 'prediction_date'):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def department_categories(values, geojson=GEOJSON_PATH):
+    """
+    Codes département dans l'ordre des features du GeoJSON, puis les codes
+    absents du GeoJSON (données synthétiques) par ordre alphabétique
+    """
+    codes = []
+    if Path(geojson).exists():
+        with open(geojson, 'r', encoding='utf-8') as f:
+            codes = [feature['properties']['code'] for feature in json.load(f)['features']]
+    known = set(codes)
+    return codes + sorted(set(values) - known)
+
+
+def alert_codes(values):
+    """Code de niveau d'alerte (0=Vert … 3=Rouge) pour un tableau de cas, Vert si la valeur manque"""
+    values = np.asarray(values, dtype=np.float64)
+    # searchsorted range NaN après tous les seuils (Rouge) : masqué comme dans get_alert_level
+    codes = np.searchsorted(ALERT_THRESHOLDS, values, side='left')
+    return np.where(np.isnan(values), 0, codes).astype(np.uint8)
+
+
+def check_alert_codes(values=None):
+    """
+    Compare alert_codes à get_alert_level, seuils, valeurs voisines et NaN compris.
+    Renvoie la liste des (valeur, code, niveau attendu) en désaccord (vide si tout concorde).
+    """
+    if values is None:
+        values = [np.nan, -1.0, 0.0]
+        for threshold in ALERT_THRESHOLDS:
+            values += [np.nextafter(threshold, -np.inf), float(threshold), np.nextafter(threshold, np.inf)]
+        values += [1e6, np.inf]
+    codes = alert_codes(values)
+    return [(value, ALERT_LEVELS[code], get_alert_level(value)[0])
+            for value, code in zip(values, codes) if ALERT_LEVELS[code] != get_alert_level(value)[0]]
+
+
+def compact_frame(df):
+    """
+    Prédictions en mémoire compacte : département catégoriel (ordre du GeoJSON),
+    valeurs en float32, une seule colonne de date et niveau d'alerte (uint8)
+    calculé une fois sur les cas réels
+    """
+    departments = df['department'].astype(str)
+    compact = pd.DataFrame({
+        'date': pd.to_datetime(df['date']).to_numpy(),
+        'department': pd.Categorical(departments, categories=department_categories(departments.unique()))
+    })
+    for column in VALUE_COLUMNS:
+        if column in df.columns:
+            compact[column] = df[column].to_numpy(np.float32)
+    compact['alert_level'] = alert_codes(df['y_target'])
+    return compact
+
+
+def target_dates(dates):
+    """Dates visées par les prédictions faites à dates (J+7)"""
+    return dates + PREDICTION_HORIZON
+
+
+def data_version(predictions_path=PREDICTIONS_PATH, dataset_dir=DATASET_DIR, aggregates_dir=AGGREGATES_DIR):
+    """Identifiant de version des prédictions (fichier complet, dossier des partitions, agrégats)"""
+    version = []
+    for path in (Path(predictions_path), Path(dataset_dir), Path(aggregates_dir) / 'national_daily.parquet'):
+        if path.exists():
+            stat = path.stat()
+            version.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+class DashboardStore:
+    """
+    Prédictions compactes (compact_frame) triées par (date, département), avec les bornes de chaque date
+    et de chaque département : une date, une période ou un département est une
+    tranche de lignes contiguës, sans masque booléen sur tout l'historique.
+
+    Les sommes nationales par date (table d'agrégats de predict.py si elle
+    couvre les mêmes dates, sinon calculées une fois) sont cumulées : le total
+    d'une période est la différence de deux sommes cumulées.
+    """
+
+    # Colonnes de la copie triée par département (graphique temporel)
+    DEPARTMENT_COLUMNS = ['date', 'department', 'y_target', 'prediction']
+
+    # Sommes nationales par date (colonnes de national_daily.parquet)
+    DAILY_COLUMNS = ['n_departments', 'total_target', 'total_prediction', 'sum_abs_error', 'red_alert_count']
+
+    def __init__(self, df, national=None):
+        # Tri par date puis par code catégoriel (ordre du GeoJSON)
+        self.df = compact_frame(df).sort_values(['date', 'department'], kind='stable', ignore_index=True)
+
+        # Bornes par date : lignes [date_offsets[i], date_offsets[i + 1]) pour dates[i]
+        date_values = self.df['date'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, date_values[1:] != date_values[:-1]]) if len(date_values) else []
+        self.dates = pd.DatetimeIndex(date_values[starts])
+        self.date_offsets = np.append(starts, len(self.df)).astype(np.int64)
+
+        # Bornes par département, dans une copie triée par (département, date)
+        codes, departments = pd.factorize(self.df['department'].cat.codes, sort=True)
+        self.department_order = np.argsort(codes, kind='stable')
+        self.departments = list(self.df['department'].cat.categories[departments])
+        self.department_positions = {dept: i for i, dept in enumerate(self.departments)}
+        self.department_offsets = np.append(0, np.cumsum(np.bincount(codes, minlength=len(departments))))
+        self.by_department = self.df[self.DEPARTMENT_COLUMNS].take(self.department_order).reset_index(drop=True)
+
+        self.histogram_edges, self.histogram_counts = self.error_bins()
+        self.sample = self.stratified_sample()
+
+        # Sommes cumulées : la somme des dates [i, j) vaut cumulative[colonne][j] - cumulative[colonne][i]
+        self.daily = self.national_daily(national)
+        self.cumulative = {
+            column: np.concatenate([[0], np.cumsum(self.daily[column].to_numpy(np.float64))])
+            for column in self.DAILY_COLUMNS
+        }
+        self.freeze()
+
+    def freeze(self):
+        """
+        Tableaux d'index en lecture seule : le store est partagé par toutes les
+        sessions du serveur. Les DataFrames sont protégés par le Copy-on-Write de
+        pandas (une tranche modifiée par une session est copiée).
+        """
+        arrays = [self.date_offsets, self.department_offsets, self.department_order,
+                  self.histogram_edges, self.histogram_counts] + list(self.cumulative.values())
+        for array in arrays:
+            array.flags.writeable = False
+
+    def national_daily(self, national=None):
+        """Sommes nationales par date, depuis la table d'agrégats ou par réduction sur les bornes de date"""
+        if national is not None and len(self.dates):
+            national = national.loc[self.dates[0]:self.dates[-1]]
+            if national.index.equals(self.dates):
+                return national[self.DAILY_COLUMNS]
+        starts = self.date_offsets[:-1]
+        if len(starts) == 0:
+            return pd.DataFrame(columns=self.DAILY_COLUMNS, index=self.dates, dtype=np.float64)
+        # Sommes en float64 sur les colonnes float32
+        return pd.DataFrame({
+            'n_departments': np.diff(self.date_offsets),
+            'total_target': np.add.reduceat(self.df['y_target'].to_numpy(np.float64), starts),
+            'total_prediction': np.add.reduceat(self.df['prediction'].to_numpy(np.float64), starts),
+            'sum_abs_error': np.add.reduceat(self.df['abs_error'].to_numpy(np.float64), starts),
+            'red_alert_count': np.add.reduceat((self.df['alert_level'].to_numpy() == RED_ALERT).astype(np.int64),
+                                               starts)
+        }, index=self.dates)
+
+    def error_bins(self, bins=HISTOGRAM_BINS):
+        """Bornes communes et effectifs des erreurs par département (ligne = département)"""
+        error = self.df['error'].to_numpy(np.float64)[self.department_order]
+        if len(error) == 0:
+            return np.linspace(0, 1, bins + 1), np.zeros((len(self.departments), bins), dtype=np.int64)
+        low, high = float(error.min()), float(error.max())
+        if high <= low:
+            high = low + 1
+        edges = np.linspace(low, high, bins + 1)
+        bin_index = np.clip(((error - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+        department_index = np.repeat(np.arange(len(self.departments)), np.diff(self.department_offsets))
+        counts = np.bincount(department_index * bins + bin_index, minlength=len(self.departments) * bins)
+        return edges, counts.reshape(len(self.departments), bins)
+
+    def stratified_sample(self, size=SAMPLE_SIZE, seed=SAMPLE_SEED):
+        """Échantillon fixe, réparti entre départements au prorata de leurs lignes"""
+        n_rows = len(self.df)
+        if n_rows <= size:
+            return self.df
+        sizes = np.diff(self.department_offsets)
+        # Répartition proportionnelle, arrondie par les plus forts restes
+        quotas = sizes * size / n_rows
+        allocation = np.floor(quotas).astype(np.int64)
+        remaining = size - allocation.sum()
+        allocation[np.argsort(allocation - quotas, kind='stable')[:remaining]] += 1
+
+        rng = np.random.default_rng(seed)
+        picked = [
+            self.department_order[start + rng.choice(count, size=k, replace=False)]
+            for start, count, k in zip(self.department_offsets[:-1], sizes, allocation) if k > 0
+        ]
+        return self.df.take(np.sort(np.concatenate(picked)))
+
+    def has_date(self, date):
+        i = self.dates.searchsorted(date)
+        return i < len(self.dates) and self.dates[i] == date
+
+    def window(self, start, end):
+        """Sommes nationales des dates comprises entre start et end (inclus)"""
+        first = self.dates.searchsorted(start, side='left')
+        last = self.dates.searchsorted(end, side='right')
+        return {column: values[last] - values[first] for column, values in self.cumulative.items()}
+
+    def rows_between(self, start, end):
+        """Lignes des dates comprises entre start et end (inclus)"""
+        first = self.dates.searchsorted(start, side='left')
+        last = self.dates.searchsorted(end, side='right')
+        return self.df.iloc[self.date_offsets[first]:self.date_offsets[last]]
+
+    def on_date(self, date):
+        """Lignes d'une date (vide si la date est absente)"""
+        return self.rows_between(date, date)
+
+    def department(self, department):
+        """Série d'un département, triée par date"""
+        i = self.department_positions.get(department)
+        if i is None:
+            return self.by_department.iloc[0:0]
+        return self.by_department.iloc[self.department_offsets[i]:self.department_offsets[i + 1]]
+
+
+def geojson_path(tier=None):
+    """GeoJSON simplifié du niveau demandé, le GeoJSON d'origine s'il n'a pas été généré"""
+    if tier is not None:
+        path = GEOJSON_DIR / f"departements_{tier}.geojson"
+        if path.exists():
+            return path
+    return GEOJSON_PATH
+
+
+def read_aggregates(aggregates_dir=AGGREGATES_DIR):
+    """Tables d'agrégats écrites par predict.py : table nationale par date et sommes suffisantes"""
+    aggregates_dir = Path(aggregates_dir)
+    national = pd.read_parquet(aggregates_dir / 'national_daily.parquet')
+    national['date'] = pd.to_datetime(national['date'])
+    stats = pd.read_parquet(aggregates_dir / 'sufficient_stats.parquet').set_index('department')
+    return {'national': national.set_index('date'), 'stats': stats}
+
+
+# Fonction pour calculer le niveau d'alerte
+def get_alert_level(value):
+    """Retourne le niveau d'alerte basé sur le nombre de cas"""
+    if value > ALERT_THRESHOLDS[2]:
+        return "Rouge", "#dc3545"
+    elif value > ALERT_THRESHOLDS[1]:
+        return "Orange", "#fd7e14"
+    elif value > ALERT_THRESHOLDS[0]:
+        return "Jaune", "#ffc107"
+    else:
+        return "Vert", "#28a745"
+
+
+# Fonction pour calculer les métriques globales
+def calculate_metrics(store, selected_date):
+    """Calcule les métriques KPI pour une date donnée (sommes nationales cumulées du store)"""
+    week_ago = selected_date - timedelta(days=7)
+    date_30_days_ago = selected_date - timedelta(days=30)
+
+    if not store.has_date(selected_date):
+        return None
+
+    # Métrique 1 : Total national des cas
+    # Métrique 2 : Nombre de départements en alerte rouge
+    today = store.window(selected_date, selected_date)
+    total_cases = today['total_target']
+    red_alert_count = int(today['red_alert_count'])
+
+    has_week_ago = store.has_date(week_ago)
+    total_week_ago = store.window(week_ago, week_ago)['total_target']
+
+    # Métrique 4 : Précision du modèle (MAE sur les 30 derniers jours)
+    recent = store.window(date_30_days_ago, selected_date)
+    mae = recent['sum_abs_error'] / recent['n_departments'] if recent['n_departments'] > 0 else 0
+
+    # Métrique 3 : Tendance hebdomadaire
+    if has_week_ago:
+        trend_pct = ((total_cases - total_week_ago) / total_week_ago * 100) if total_week_ago > 0 else 0
+
+        if trend_pct > 5:
+            trend = "↗️ Hausse"
+            trend_color = "inverse"
+        elif trend_pct < -5:
+            trend = "↘️ Baisse"
+            trend_color = "normal"
+        else:
+            trend = "→ Stable"
+            trend_color = "off"
+    else:
+        trend = "→ N/A"
+        trend_color = "off"
+        trend_pct = 0
+
+    return {
+        'total_cases': total_cases,
+        'red_alert_count': red_alert_count,
+        'trend': trend,
+        'trend_pct': trend_pct,
+        'trend_color': trend_color,
+        'mae': mae
+    }
+
+
+def map_frame(store, selected_date):
+    """Lignes de la date sélectionnée avec le nom de leur niveau d'alerte (carte et Top 20)"""
+    df_map = store.on_date(selected_date).copy()
+    df_map['alert_level'] = pd.Categorical.from_codes(df_map['alert_level'].to_numpy(), ALERT_LEVELS)
+    return df_map
+
+
+def department_series(store, department):
+    """Série temporelle d'un département, triée par date"""
+    return store.department(department)
+
+
+def top_departments(store, selected_date, column, n=10):
+    """Les n départements aux valeurs les plus élevées de column à la date sélectionnée"""
+    return store.on_date(selected_date).nlargest(n, column)[['department', column]]
+
+
+def national_timeline(store, national=None):
+    """
+    Totaux nationaux (cas réels et prédictions) par date, avec l'année pour la
+    coloration : tout l'historique depuis la table d'agrégats si elle est
+    fournie, sinon la période chargée dans le store
+    """
+    daily = national if national is not None else store.daily
+    df_timeline = daily[['total_target', 'total_prediction']].rename(
+        columns={'total_target': 'y_target', 'total_prediction': 'prediction'}
+    ).rename_axis('date').reset_index()
+
+    # Séparer par année
+    df_timeline['year'] = df_timeline['date'].dt.year
+    return df_timeline
+
+
+def error_histogram(store, department=None):
+    """Effectifs des erreurs par intervalle (tous départements ou un seul)"""
+    edges = store.histogram_edges
+    if department is None:
+        counts = store.histogram_counts.sum(axis=0)
+    else:
+        counts = store.histogram_counts[store.department_positions[department]]
+    return pd.DataFrame({
+        'bin_start': edges[:-1],
+        'bin_center': (edges[:-1] + edges[1:]) / 2,
+        'count': counts
+    })
+
+
+def global_metrics(store, aggregates=None):
+    """
+    MAE, RMSE, R² et précision : sur la période chargée (store), ou sur tout
+    l'historique à partir des sommes suffisantes des agrégats si aggregates est donné
+    """
+    if aggregates is not None:
+        # Sommes suffisantes : n, Σ|e|, Σe², Σy, Σy²
+        totals = aggregates['stats'].loc['ALL']
+        n = totals['n']
+        mae_global = totals['abs_error'] / n
+        rmse_global = np.sqrt(totals['sq_error'] / n)
+        mean_target = totals['y_target'] / n
+        ss_res = totals['sq_error']
+        ss_tot = totals['sq_y_target'] - n * mean_target ** 2
+    else:
+        # Calculs en float64 sur les colonnes float32 du store
+        df = store.df[VALUE_COLUMNS].astype(np.float64)
+        mae_global = df['abs_error'].mean()
+        rmse_global = np.sqrt((df['error'] ** 2).mean())
+        mean_target = df['y_target'].mean()
+
+        # R² calculation
+        ss_res = ((df['y_target'] - df['prediction']) ** 2).sum()
+        ss_tot = ((df['y_target'] - mean_target) ** 2).sum()
+    r2 = 1 - (ss_res / ss_tot) if ss_tot != 0 else 0
+
+    return {
+        'mae': mae_global,
+        'rmse': rmse_global,
+        'r2': r2,
+        'precision_pct': (1 - (mae_global / mean_target)) * 100
+    }
+
+
+def figure_nbytes(figure, extra_bytes=0):
+    """
+    Taille estimée d'une figure : octets des tableaux de ses traces, plus extra_bytes
+    pour ce qui n'est pas un tableau (le fichier GeoJSON embarqué par la carte).
+    Ne sérialise pas la figure : l'estimation coûte peu devant sa construction.
+    """
+    size = extra_bytes
+    for trace in figure.data:
+        for name in FIGURE_ARRAY_PROPERTIES:
+            value = getattr(trace, name, None)
+            if value is not None and not isinstance(value, str):
+                size += np.asarray(value).nbytes
+    return size
+
+
+class FigureCache:
+    """
+    Cache LRU des figures du dashboard, partagé par les sessions d'un processus
+    serveur et borné par la taille estimée des figures (figure_nbytes). La clé
+    d'une figure réunit la section, la version des données et les seules entrées
+    dont elle dépend.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(self, key, build, sizeof=figure_nbytes):
+        """Figure en cache pour key, sinon build() ajoutée au cache (sizeof en octets)"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        # Construction hors verrou : deux sessions peuvent construire la même figure, la seconde remplace la première
+        figure = build()
+        size = sizeof(figure)
+        if size > self.max_bytes:
+            return figure
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (figure, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+        return figure
+
+
+if __name__ == "__main__":
+    # Vérification rapide : python dashboard_data.py
+    mismatches = check_alert_codes()
+    for value, code, expected in mismatches:
+        print(f"❌ alert_codes({value}) = {code}, get_alert_level = {expected}")
+    if mismatches:
+        raise SystemExit(1)
+    print("✅ alert_codes concorde avec get_alert_level (NaN compris)")
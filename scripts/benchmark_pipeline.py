@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout du pipeline et du dashboard à plusieurs échelles.
+
+Pour chaque échelle (1x, 10x, 100x par défaut), un processus dédié génère la
+charge synthétique dans bench/scale_<N>x/, exécute chaque étape du pipeline
+puis les fonctions de préparation du dashboard, et mesure temps réel, CPU,
+pic de RSS et débit (lignes/s). Un processus par échelle isole la mémoire :
+une échelle tuée par le système (mémoire insuffisante) ou hors délai est
+signalée sans interrompre les suivantes.
+
+L'échelle 1x correspond aux données réelles (96 départements × 2 ans) ; elle
+multiplie les années (--scale-by years) ou les départements (--scale-by
+departments, qui élargit aussi le One-Hot).
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+
+from synthetic_workload import SyntheticWorkload, DEPARTMENTS
+from pipeline_telemetry import ResourceSampler, StageMonitor, parquet_rows
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# dashboard_data.py est à la racine du dépôt, à côté d'app.py
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+class PipelineBenchmark:
+    def __init__(self, output_dir="bench", scales=(1, 10, 100), scale_by="years", departments=len(DEPARTMENTS),
+                 years=2, extra_features=0, seed=42, timeout=3600):
+        self.output_dir = Path(output_dir).resolve()
+        self.report_path = self.output_dir / "benchmark_report.json"
+        self.scales = scales
+        self.scale_by = scale_by
+        self.departments = departments
+        self.years = years
+        self.extra_features = extra_features
+        self.seed = seed
+        self.timeout = timeout
+
+    def workspace(self, scale):
+        return self.output_dir / f"scale_{scale:g}x"
+
+    def workload(self, scale):
+        """Charge synthétique d'une échelle (départements ou années multipliés)"""
+        departments, years = self.departments, self.years
+        if self.scale_by == "departments":
+            departments = int(round(departments * scale))
+        else:
+            years = years * scale
+        return SyntheticWorkload(self.workspace(scale), departments, years, self.extra_features, self.seed)
+
+    def measure(self, records, sampler, name, step, rows=None):
+        """Exécute step() sous mesure et ajoute son enregistrement, renvoie (succès, résultat)"""
+        monitor = StageMonitor(name, sampler)
+        monitor.start()
+        try:
+            result = step()
+            success = result is not False and not (hasattr(result, 'empty') and result.empty)
+        except Exception as e:
+            logger.error(f"❌ Erreur {name}: {e}")
+            result, success = None, False
+        record = {"step": name, "status": "success" if success else "failed", **monitor.stop()}
+        rows = rows() if callable(rows) else rows
+        record["rows"] = rows
+        record["rows_per_s"] = round(rows / record["wall_s"], 1) if rows and record["wall_s"] > 0 else None
+        records.append(record)
+        return success, result
+
+    def run_scale(self, scale, records=None):
+        """Mesure une échelle dans le processus courant (dossier de travail de l'échelle)"""
+        records = [] if records is None else records
+        workload = self.workload(scale)
+        workload.output_dir.mkdir(parents=True, exist_ok=True)
+        summary = workload.generate()
+        os.chdir(workload.output_dir)
+
+        # Import après le chdir : les étapes résolvent data/ par rapport au dossier courant
+        from run_pipeline import MLPipeline
+        sys.path.insert(0, str(REPO_DIR))
+        import dashboard_data
+
+        records.append({"step": "workload", "status": "success", "wall_s": summary["wall_s"],
+                        "rows": summary["rows"], "rows_per_s": summary["rows_per_s"]})
+        sampler = ResourceSampler()
+        sampler.start()
+
+        pipeline = MLPipeline(force=True)
+        results = {}
+        for name, stage in pipeline.pipeline_steps.items():
+            if any(results.get(dep) is not True for dep in stage.deps):
+                records.append({"step": name, "status": "blocked"})
+                results[name] = False
+                continue
+            success, telemetry = pipeline.run_stage(stage, sampler)
+            rows_in, rows_out = parquet_rows(stage.rows_in), parquet_rows(stage.rows_out)
+            rows = rows_in if rows_in is not None else rows_out
+            records.append({
+                "step": name,
+                "status": "success" if success else "failed",
+                **telemetry,
+                "rows": rows,
+                "rows_per_s": round(rows / telemetry["wall_s"], 1) if rows and telemetry["wall_s"] > 0 else None
+            })
+            results[name] = success
+
+        if results.get("predict"):
+            ok, df = self.measure(records, sampler, "dashboard:read_predictions", dashboard_data.read_predictions,
+                                  rows=lambda: parquet_rows(dashboard_data.PREDICTIONS_PATH))
+            if ok:
+                n = len(df)
+                _, aggregates = self.measure(records, sampler, "dashboard:read_aggregates",
+                                             dashboard_data.read_aggregates, rows=n)
+                national = aggregates['national'] if aggregates is not None else None
+                self.measure(records, sampler, "dashboard:build_store_raw",
+                             lambda: dashboard_data.DashboardStore(df), rows=n)
+                _, store = self.measure(records, sampler, "dashboard:build_store",
+                                        lambda: dashboard_data.DashboardStore(df, national), rows=n)
+                last_date = store.dates[-1]
+                self.measure(records, sampler, "dashboard:read_recent_window",
+                             lambda: dashboard_data.read_predictions(
+                                 columns=dashboard_data.DASHBOARD_COLUMNS,
+                                 start=dashboard_data.window_start(last_date, *dashboard_data.available_dates())),
+                             rows=n)
+                steps = [
+                    ("dashboard:calculate_metrics", lambda: dashboard_data.calculate_metrics(store, last_date)),
+                    ("dashboard:map_frame", lambda: dashboard_data.map_frame(store, last_date)),
+                    ("dashboard:department_series", lambda: dashboard_data.department_series(store, store.departments[0])),
+                    ("dashboard:top_departments", lambda: dashboard_data.top_departments(store, last_date, 'prediction')),
+                    ("dashboard:national_timeline", lambda: dashboard_data.national_timeline(store)),
+                    ("dashboard:error_histogram", lambda: dashboard_data.error_histogram(store)),
+                    ("dashboard:global_metrics", lambda: dashboard_data.global_metrics(store, aggregates)),
+                    ("dashboard:global_metrics_raw", lambda: dashboard_data.global_metrics(store))
+                ]
+                for name, step in steps:
+                    self.measure(records, sampler, name, step, rows=n)
+
+        sampler.stop()
+        return {"scale": scale, "workload": summary, "steps": list(records)}
+
+    def run_scale_process(self, scale):
+        """Lance une échelle dans un processus dédié et relit son résultat"""
+        workspace = self.workspace(scale)
+        result_path = workspace / "benchmark_scale.json"
+        if result_path.exists():
+            result_path.unlink()
+        command = [sys.executable, str(Path(__file__).resolve()), "--worker", str(scale),
+                   "--output-dir", str(self.output_dir), "--scale-by", self.scale_by,
+                   "--departments", str(self.departments), "--years", str(self.years),
+                   "--extra-features", str(self.extra_features), "--seed", str(self.seed)]
+
+        logger.info(f"🚀 ÉCHELLE {scale:g}x")
+        logger.info("=" * 60)
+        try:
+            completed = subprocess.run(command, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f"❌ Échelle {scale:g}x hors délai ({self.timeout}s)")
+            return {"scale": scale, "status": "timeout", "steps": self.partial_steps(result_path)}
+
+        if completed.returncode != 0 or not result_path.exists():
+            status = "killed" if completed.returncode < 0 else "failed"
+            logger.error(f"❌ Échelle {scale:g}x: {status} (code {completed.returncode})")
+            return {"scale": scale, "status": status, "returncode": completed.returncode,
+                    "steps": self.partial_steps(result_path)}
+
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        result["status"] = "success"
+        return result
+
+    def partial_steps(self, result_path):
+        """Étapes déjà mesurées par un processus interrompu (écrites au fil de l'eau)"""
+        partial_path = result_path.with_suffix('.partial.jsonl')
+        if not partial_path.exists():
+            return []
+        with open(partial_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def report(self, results):
+        """Tableau étape × échelle (temps, débit, pic de RSS) et rapport JSON"""
+        logger.info("=" * 80)
+        logger.info("📊 RÉSULTATS DU BENCHMARK")
+        logger.info("=" * 80)
+        for result in results:
+            logger.info(f"⚖️ {result['scale']:g}x ({result['status']})"
+                        + (f" - {result['workload']['rows']:,} lignes" if 'workload' in result else ""))
+            for step in result['steps']:
+                if step['status'] in ('success', 'failed') and 'wall_s' in step:
+                    rate = f"{step['rows_per_s']:>12,.0f} lignes/s" if step.get('rows_per_s') else " " * 20
+                    rss = f"{step['peak_rss_mb']:>8,.0f} Mo" if step.get('peak_rss_mb') is not None else ""
+                    icon = '✅' if step['status'] == 'success' else '❌'
+                    logger.info(f"  {icon} {step['step']:<34} {step['wall_s']:>9.2f}s {rate} {rss}")
+                else:
+                    logger.info(f"  ⛔ {step['step']:<34} {step['status']}")
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump({"scale_by": self.scale_by, "departments": self.departments, "years": self.years,
+                       "extra_features": self.extra_features, "seed": self.seed, "results": results},
+                      f, indent=2, ensure_ascii=False)
+        logger.info(f"📋 Rapport sauvegardé: {self.report_path}")
+
+    def run(self):
+        """Exécute toutes les échelles puis écrit le rapport"""
+        results = [self.run_scale_process(scale) for scale in self.scales]
+        self.report(results)
+        return all(result['status'] == 'success' for result in results)
+
+
+class _PartialRecords(list):
+    """Liste d'enregistrements recopiée ligne à ligne sur disque (survit à un arrêt brutal)"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text('')
+
+    def append(self, record):
+        super().append(record)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline et du dashboard à plusieurs échelles")
+    parser.add_argument("--scales", default="1,10,100", help="Échelles séparées par des virgules")
+    parser.add_argument("--scale-by", choices=["years", "departments"], default="years",
+                        help="Dimension multipliée par l'échelle")
+    parser.add_argument("--departments", type=int, default=len(DEPARTMENTS), help="Départements à l'échelle 1x")
+    parser.add_argument("--years", type=float, default=2, help="Années à l'échelle 1x")
+    parser.add_argument("--extra-features", type=int, default=0, help="Colonnes numériques supplémentaires")
+    parser.add_argument("--seed", type=int, default=42, help="Graine de la charge synthétique")
+    parser.add_argument("--output-dir", default="bench", help="Dossier des données et du rapport")
+    parser.add_argument("--timeout", type=int, default=3600, help="Durée maximale par échelle (s)")
+    parser.add_argument("--worker", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    benchmark = PipelineBenchmark(args.output_dir, [float(s) for s in args.scales.split(',')], args.scale_by,
+                                  args.departments, args.years, args.extra_features, args.seed, args.timeout)
+    if args.worker is not None:
+        # Processus d'une échelle : résultat écrit dans le dossier de travail
+        result_path = benchmark.workspace(args.worker) / "benchmark_scale.json"
+        partial = _PartialRecords(result_path.with_suffix('.partial.jsonl'))
+        result = benchmark.run_scale(args.worker, partial)
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    else:
+        benchmark.run()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Matrice de features float32 en ordre colonne, mappée en mémoire.
+
+Chaque features.parquet est accompagné d'un features.npy (mêmes colonnes, même
+ordre de lignes). Les lecteurs le mappent avec np.load(mmap_mode='r') : les
+pages sont partagées via le cache de l'OS entre le trainer, les workers et le
+predictor, et sklearn reçoit directement la matrice float32 sans copie.
+
+Les Parquet de features et de target sont écrits par groupes de ROW_GROUP_SIZE
+lignes pour pouvoir être relus partiellement (entraînement hors mémoire).
+
+make_features écrit features.parquet, select_features en écrit une version
+réduite à côté (features_selected.parquet) : l'entraînement et la prédiction
+lisent celle que renvoie model_feature_paths.
+"""
+
+import os
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Taille des row groups Parquet : granularité des lectures partielles
+ROW_GROUP_SIZE = 65536
+
+# Matrice réduite et liste de features écrites par select_features.py
+SELECTED_FEATURES_NAME = "features_selected.parquet"
+SELECTED_FEATURE_LIST_NAME = "feature_list_selected.json"
+
+
+def matrix_path_for(parquet_path):
+    """Chemin du .npy associé à un fichier de features Parquet"""
+    return Path(parquet_path).with_suffix('.npy')
+
+
+def model_feature_paths(features_dir, handoff=None):
+    """
+    (features, liste de features) à utiliser pour le modèle : la sélection de
+    select_features.py si elle est publiée en mémoire ou n'est pas plus ancienne
+    que features.parquet, sinon la matrice complète de make_features.
+    """
+    features_dir = Path(features_dir)
+    full = (features_dir / "features.parquet", features_dir / "feature_list.json")
+    selected = (features_dir / SELECTED_FEATURES_NAME, features_dir / SELECTED_FEATURE_LIST_NAME)
+
+    if handoff is not None and handoff.in_memory and handoff.available(selected[0]):
+        return selected
+    if selected[0].exists():
+        if not full[0].exists() or selected[0].stat().st_mtime >= full[0].stat().st_mtime:
+            return selected
+        logger.warning(f"⚠️ {selected[0].name} plus ancienne que {full[0].name} "
+                       f"(relancer select_features.py), matrice complète utilisée")
+    return full
+
+
+def as_feature_matrix(features_df):
+    """DataFrame float32 en ordre colonne, identique à celui rendu par load_feature_matrix"""
+    matrix = np.asfortranarray(features_df.to_numpy(dtype=np.float32))
+    return pd.DataFrame(matrix, columns=features_df.columns, copy=False)
+
+
+def save_feature_matrix(features_df, parquet_path):
+    """Écrit la matrice float32 en ordre colonne à côté du Parquet (écriture atomique)"""
+    path = matrix_path_for(parquet_path)
+    matrix = np.asfortranarray(features_df.to_numpy(dtype=np.float32))
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(tmp_path, path)
+
+    logger.info(f"✅ Matrice mappable sauvegardée: {path} ({matrix.nbytes / 1e6:.1f} Mo)")
+    return path
+
+
+def load_feature_matrix(parquet_path):
+    """
+    Charge les features en DataFrame adossé au .npy mappé en mémoire.
+
+    Le DataFrame est en lecture seule et partage la mémoire du mapping. Retombe
+    sur la lecture Parquet si le .npy est absent, plus ancien que le Parquet ou
+    incohérent avec son schéma.
+    """
+    parquet_path = Path(parquet_path)
+    path = matrix_path_for(parquet_path)
+
+    if path.exists() and path.stat().st_mtime >= parquet_path.stat().st_mtime:
+        metadata = pq.read_metadata(parquet_path)
+        columns = metadata.schema.to_arrow_schema().names
+        matrix = np.load(path, mmap_mode='r')
+        if matrix.shape == (metadata.num_rows, len(columns)) and matrix.flags.f_contiguous:
+            logger.info(f"🗺️ Features mappées en mémoire: {path}")
+            return pd.DataFrame(matrix, columns=columns, copy=False)
+        logger.warning(f"⚠️ Matrice incohérente avec {parquet_path.name}, lecture Parquet")
+    elif path.exists():
+        logger.warning(f"⚠️ Matrice plus ancienne que {parquet_path.name}, lecture Parquet")
+
+    return pd.read_parquet(parquet_path)
+
+
+def row_group_offsets(parquet_file):
+    """Indices de première ligne de chaque row group (plus le nombre total de lignes)"""
+    metadata = parquet_file.metadata
+    sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+
+
+def gather_parquet_rows(parquet_file, row_idx, columns=None, dtype=np.float32):
+    """
+    Lit les lignes row_idx (triées) en ne décodant que les row groups concernés.
+
+    Le résultat est une matrice en ordre colonne pré-allouée : la mémoire reste
+    bornée par len(row_idx) lignes plus un row group.
+    """
+    columns = columns or parquet_file.schema_arrow.names
+    offsets = row_group_offsets(parquet_file)
+    bounds = np.searchsorted(row_idx, offsets)
+    out = np.empty((len(row_idx), len(columns)), dtype=dtype, order='F')
+
+    for group in range(len(offsets) - 1):
+        lo, hi = bounds[group], bounds[group + 1]
+        if lo == hi:
+            continue
+        table = parquet_file.read_row_group(group, columns=columns)
+        local = row_idx[lo:hi] - offsets[group]
+        out[lo:hi] = table.take(local).to_pandas().to_numpy(dtype=dtype)
+
+    return pd.DataFrame(out, columns=columns, copy=False)
+
+
+def iter_parquet_rows(parquet_file, start, stop, columns=None):
+    """Parcourt les lignes [start, stop) row group par row group, renvoie (offset, DataFrame)"""
+    offsets = row_group_offsets(parquet_file)
+    for group in range(len(offsets) - 1):
+        lo, hi = max(start, offsets[group]), min(stop, offsets[group + 1])
+        if lo >= hi:
+            continue
+        table = parquet_file.read_row_group(group, columns=columns)
+        yield int(lo), table.slice(int(lo - offsets[group]), int(hi - lo)).to_pandas()
+
+
+def iter_aligned_rows(features_file, target_file, target_columns=None):
+    """
+    Parcourt features et target en parallèle, bloc par bloc suivant les row
+    groups des features : renvoie (offset, X_bloc, y_bloc) de mêmes lignes.
+    """
+    n_rows = features_file.metadata.num_rows
+    if target_file.metadata.num_rows != n_rows:
+        raise ValueError(f"Features ({n_rows}) et target ({target_file.metadata.num_rows}) non alignées")
+
+    for offset, X_chunk in iter_parquet_rows(features_file, 0, n_rows):
+        stop = offset + len(X_chunk)
+        # Row groups alignés (même ROW_GROUP_SIZE) : un seul groupe de target relu
+        y_parts = [chunk for _, chunk in iter_parquet_rows(target_file, offset, stop, target_columns)]
+        y_chunk = y_parts[0] if len(y_parts) == 1 else pd.concat(y_parts, ignore_index=True)
+        yield offset, X_chunk, y_chunk
@@ -10,14 +10,17 @@ from pathlib import Path
 import logging
 import json
 from datetime import datetime
+from stage_handoff import StageHandoff, write_json
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class StatsFitter:
-    def __init__(self):
+    def __init__(self, handoff=None):
         self.base_dir = Path("data")
+        # Sorties publiées en mémoire pour l'étape suivante (mode pipeline --in-memory)
+        self.handoff = handoff or StageHandoff()
         self.processed_dir = self.base_dir / "processed"
         self.timeseries_dir = self.processed_dir / "timeseries"
         self.stats_dir = self.base_dir / "config"
@@ -134,13 +137,11 @@ class StatsFitter:
         
         try:
             # Sauvegarder les médianes
-            with open(self.medians_path, 'w', encoding='utf-8') as f:
-                json.dump(medians, f, indent=2, ensure_ascii=False)
+            self.handoff.publish(self.medians_path, medians, lambda: write_json(medians, self.medians_path))
             logger.info(f"✅ Médianes sauvegardées: {self.medians_path}")
             
             # Sauvegarder les catégories
-            with open(self.cats_path, 'w', encoding='utf-8') as f:
-                json.dump(cats, f, indent=2, ensure_ascii=False)
+            self.handoff.publish(self.cats_path, cats, lambda: write_json(cats, self.cats_path))
             logger.info(f"✅ Catégories sauvegardées: {self.cats_path}")
             
             # Créer un résumé
@@ -153,8 +154,7 @@ class StatsFitter:
             }
             
             summary_path = self.stats_dir / "stats_summary.json"
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                json.dump(summary, f, indent=2, ensure_ascii=False)
+            self.handoff.persist(lambda: write_json(summary, summary_path), summary_path)
             
             logger.info(f"📋 Résumé sauvegardé: {summary_path}")
             return True
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Moteur d'inférence pour les forêts aléatoires : évalue tous les arbres sur un
+lot de lignes, par blocs de lignes et avec un pool de threads sur les groupes
+d'arbres, sans la validation d'entrée ni le dispatch joblib de model.predict.
+
+Le gain porte sur les petits lots (service, micro-lots), où ce surcoût fixe
+domine : ~10 ms pour sklearn contre moins d'1 ms ici. Sur les gros lots, le
+temps est celui des noyaux compilés des arbres, comme pour sklearn : le gain
+se limite au surcoût évité (voir docs/forest_inference_calibration.json).
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import logging
+import time
+import joblib
+import json
+from feature_matrix import model_feature_paths
+from sklearn.base import clone
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import warnings
+warnings.filterwarnings('ignore')
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16384
+
+# La descente NumPy niveau par niveau ne bat le noyau compilé de chaque arbre que
+# sur des forêts peu profondes et des petits lots. Seuils tirés des mesures de
+# `forest_inference.py --calibrate` sur le modèle livré, versionnées dans CALIBRATION_PATH
+VECTORIZED_MAX_MEAN_DEPTH = 5.77
+VECTORIZED_MAX_ROWS = 100
+
+CALIBRATION_PATH = Path("docs") / "forest_inference_calibration.json"
+CALIBRATION_DEPTHS = (2, 4, 6, 8)
+CALIBRATION_BATCHES = (1, 10, 100, 1000, 2048, 4096, 16384)
+
+# Écart absolu maximal toléré avec model.predict : mêmes seuils float32, mêmes feuilles,
+# seul l'ordre de sommation des arbres peut différer
+PARITY_TOLERANCE = 1e-9
+
+class ForestInference:
+    def __init__(self, model, n_jobs=-1, chunk_size=DEFAULT_CHUNK_SIZE, backend='auto'):
+        """Aplatit les arbres d'un RandomForestRegressor entraîné
+
+        backend='vectorized' : descente NumPy sur les tableaux de nœuds aplatis
+        backend='native' : noyau compilé de chaque arbre (tree_.predict), sans la
+        validation d'entrée ni le dispatch joblib de model.predict
+        backend='auto' : 'vectorized' pour les petits lots sur une forêt peu profonde, 'native' sinon
+        (seuils VECTORIZED_MAX_MEAN_DEPTH / VECTORIZED_MAX_ROWS, mesurés par --calibrate)
+        """
+        estimators = model.estimators_
+        self.n_trees = len(estimators)
+        self.n_features = model.n_features_in_
+        self.feature_names = list(getattr(model, 'feature_names_in_', []))
+        self.chunk_size = chunk_size
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs in (None, -1) else max(1, n_jobs)
+
+        # Arbres triés par profondeur : à chaque niveau, les arbres terminés sortent du calcul
+        order = np.argsort([est.tree_.max_depth for est in estimators], kind='stable')
+        estimators = [estimators[i] for i in order]
+        self.tree_order = order
+        self.trees = [est.tree_ for est in estimators]
+
+        node_counts = np.array([est.tree_.node_count for est in estimators], dtype=np.int64)
+        self.roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.int64)
+        self.depths = np.array([est.tree_.max_depth for est in estimators], dtype=np.int64)
+
+        children, feature, threshold, value, missing_left = [], [], [], [], []
+        for offset, est in zip(self.roots, estimators):
+            tree = est.tree_
+            nodes = np.arange(tree.node_count, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+            # Les feuilles bouclent sur elles-mêmes : une itération de plus ne les déplace pas
+            left = np.where(is_leaf, nodes, tree.children_left) + offset
+            right = np.where(is_leaf, nodes, tree.children_right) + offset
+            children.append(np.column_stack([left, right]).ravel())
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            value.append(tree.value[:, 0, 0])
+            missing = getattr(tree, 'missing_go_to_left', None)
+            missing_left.append(np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool))
+
+        # children[2 * nœud] = fils gauche, children[2 * nœud + 1] = fils droit
+        self.index_dtype = np.int32 if 2 * node_counts.sum() < np.iinfo(np.int32).max else np.int64
+        self.roots = self.roots.astype(self.index_dtype)
+        self.children = np.concatenate(children).astype(self.index_dtype)
+        self.feature = np.concatenate(feature).astype(self.index_dtype)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.value = np.concatenate(value).astype(np.float64)
+        self.missing_left = np.concatenate(missing_left)
+
+        if backend not in ('auto', 'vectorized', 'native'):
+            raise ValueError(f"Backend inconnu: {backend}")
+        self.backend = backend
+
+        # Groupes d'arbres contigus, un par worker
+        n_groups = max(1, min(self.n_jobs, self.n_trees))
+        bounds = np.linspace(0, self.n_trees, n_groups + 1).astype(int)
+        self.tree_groups = [(bounds[i], bounds[i + 1]) for i in range(n_groups) if bounds[i] < bounds[i + 1]]
+
+    def prepare_input(self, X):
+        """Convertit l'entrée en matrice float32 en ordre colonne (sans copie si c'est déjà le cas)"""
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names and list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy(dtype=np.float32)
+        X = np.asfortranarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X doit avoir {self.n_features} colonnes, reçu {X.shape}")
+        return X
+
+    def chunk_backend(self, n_rows):
+        """Backend utilisé pour un bloc de n_rows lignes"""
+        if self.backend != 'auto':
+            return self.backend
+        shallow = self.depths.mean() <= VECTORIZED_MAX_MEAN_DEPTH
+        return 'vectorized' if shallow and n_rows <= VECTORIZED_MAX_ROWS else 'native'
+
+    def _evaluate_group_native(self, X_chunk, start, stop):
+        """Évalue les arbres [start, stop) avec leur noyau compilé, renvoie (n_arbres, n_lignes)"""
+        values = np.empty((stop - start, len(X_chunk)), dtype=np.float64)
+        for i, tree in enumerate(self.trees[start:stop]):
+            values[i] = tree.predict(X_chunk).reshape(-1)
+        return values
+
+    def _evaluate_group(self, X_T, has_nan, row_start, row_stop, start, stop):
+        """Évalue les arbres [start, stop) sur les lignes [row_start, row_stop), renvoie (n_arbres, n_lignes)"""
+        depths = self.depths[start:stop]
+        roots = self.roots[start:stop]
+        n_rows = row_stop - row_start
+        values = np.empty((len(roots), n_rows), dtype=np.float64)
+
+        # Arbres réduits à une feuille
+        first_split = int(np.searchsorted(depths, 1))
+        values[:first_split] = self.value[roots[:first_split], np.newaxis]
+        if first_split == len(roots):
+            return values
+
+        # Niveau 1 : toutes les lignes sont à la racine, feature et seuil sont constants par arbre
+        split_roots = roots[first_split:]
+        x = X_T[self.feature[split_roots], row_start:row_stop]
+        go_left = x <= self.threshold[split_roots, np.newaxis]
+        if has_nan:
+            go_left |= np.isnan(x) & self.missing_left[split_roots, np.newaxis]
+        left = self.children[2 * split_roots, np.newaxis]
+        right = self.children[2 * split_roots + 1, np.newaxis]
+
+        # Souches (profondeur 1) : la feuille est atteinte, on lit directement sa valeur
+        n_stumps = int(np.searchsorted(depths, 2)) - first_split
+        stumps = values[first_split:first_split + n_stumps]
+        stumps[:] = self.value[right[:n_stumps]]
+        np.copyto(stumps, self.value[left[:n_stumps]], where=go_left[:n_stumps])
+        if first_split + n_stumps == len(roots):
+            return values
+
+        # Arbres plus profonds : descente niveau par niveau, gather sur la matrice aplatie
+        deep = slice(first_split + n_stumps, len(roots))
+        nodes = right[n_stumps:].repeat(n_rows, axis=1)
+        np.copyto(nodes, left[n_stumps:], where=go_left[n_stumps:])
+        deep_depths = depths[deep]
+        X_flat = X_T.ravel()
+        rows = np.arange(row_start, row_stop, dtype=np.int64)
+        for level in range(2, int(deep_depths[-1]) + 1):
+            first = int(np.searchsorted(deep_depths, level))
+            active = nodes[first:]
+            x = X_flat[self.feature[active] * np.int64(X_T.shape[1]) + rows]
+            go_left = x <= self.threshold[active]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[active]
+            nodes[first:] = self.children[2 * active + ~go_left]
+
+        values[deep] = self.value[nodes]
+        return values
+
+    def iter_tree_predictions(self, X):
+        """Itère par blocs de lignes sur les prédictions de chaque arbre : (début, tableau n_arbres × n_lignes)
+
+        Les arbres sont triés par profondeur, l'ordre ne correspond donc pas à model.estimators_.
+        """
+        X = self.prepare_input(X)
+        # Vue transposée (features × lignes) contiguë : chaque feature est une ligne du tableau
+        X_T = X.T
+
+        with ThreadPoolExecutor(max_workers=len(self.tree_groups)) as executor:
+            for row_start in range(0, X.shape[0], self.chunk_size):
+                row_stop = min(row_start + self.chunk_size, X.shape[0])
+                if self.chunk_backend(row_stop - row_start) == 'native':
+                    X_chunk = X[row_start:row_stop]
+                    evaluate = lambda group: self._evaluate_group_native(X_chunk, *group)
+                else:
+                    has_nan = bool(np.isnan(X_T[:, row_start:row_stop]).any())
+                    evaluate = lambda group: self._evaluate_group(X_T, has_nan, row_start, row_stop, *group)
+                if len(self.tree_groups) == 1:
+                    yield row_start, evaluate(self.tree_groups[0])
+                else:
+                    yield row_start, np.concatenate(list(executor.map(evaluate, self.tree_groups)), axis=0)
+
+    def predict(self, X):
+        """Prédiction moyenne de la forêt, équivalente à model.predict(X)"""
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start, tree_preds in self.iter_tree_predictions(X):
+            predictions[start:start + tree_preds.shape[1]] = tree_preds.mean(axis=0)
+        return predictions
+
+    def predict_with_quantiles(self, X, quantiles=(0.1, 0.5, 0.9)):
+        """Moyenne et quantiles des prédictions par arbre, en une seule passe
+
+        Renvoie (moyenne (n_lignes,), quantiles (n_lignes, n_quantiles)).
+        """
+        predictions = np.empty(len(X), dtype=np.float64)
+        bands = np.empty((len(X), len(quantiles)), dtype=np.float64)
+        for start, tree_preds in self.iter_tree_predictions(X):
+            stop = start + tree_preds.shape[1]
+            predictions[start:stop] = tree_preds.mean(axis=0)
+            bands[start:stop] = np.quantile(tree_preds, quantiles, axis=0).T
+        return predictions, bands
+
+def load_inputs(rows=None):
+    """Modèle entraîné et matrice de features (répliquée jusqu'à rows lignes), None si absents"""
+    model_path = Path("data") / "artifacts" / "rf.joblib"
+    features_path, _ = model_feature_paths(Path("data") / "features")
+    if not model_path.exists() or not features_path.exists():
+        logger.error(f"❌ Modèle ou features introuvables: {model_path}, {features_path}")
+        return None, None
+
+    model = joblib.load(model_path)
+    X = pd.read_parquet(features_path)
+    if rows and rows > len(X):
+        X = pd.concat([X] * int(np.ceil(rows / len(X))), ignore_index=True)
+    if rows:
+        X = X.iloc[:rows]
+    return model, X
+
+def timed(fn, repeat):
+    """Résultat de fn() et meilleur temps (s) sur repeat exécutions"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+def calibrate(repeat=3, output_path=CALIBRATION_PATH):
+    """Mesure sklearn, 'vectorized' et 'native' par profondeur de forêt et taille de lot
+
+    Les forêts peu profondes sont réentraînées (mêmes hyperparamètres, max_depth borné)
+    sur les prédictions du modèle ; le modèle entraîné lui-même sert de forêt profonde.
+    Écrit les mesures et les seuils qui en découlent pour backend='auto'.
+    """
+    logger.info("📏 CALIBRATION DES BACKENDS D'INFÉRENCE")
+    logger.info("=" * 50)
+
+    model, X = load_inputs()
+    if model is None:
+        return None
+    y = model.predict(X)
+    _, X_batches = load_inputs(max(CALIBRATION_BATCHES))
+
+    forests = [clone(model).set_params(max_depth=depth).fit(X, y) for depth in CALIBRATION_DEPTHS]
+    forests.append(model)
+
+    measures = []
+    for forest in forests:
+        mean_depth = float(np.mean([est.tree_.max_depth for est in forest.estimators_]))
+        engines = {backend: ForestInference(forest, backend=backend) for backend in ('vectorized', 'native')}
+        for n_rows in CALIBRATION_BATCHES:
+            batch = X_batches.iloc[:n_rows]
+            measure = {"max_depth": forest.max_depth, "mean_depth": round(mean_depth, 2), "rows": n_rows,
+                       "sklearn_ms": timed(lambda: forest.predict(batch), repeat)[1] * 1000}
+            for backend, engine in engines.items():
+                measure[f"{backend}_ms"] = timed(lambda: engine.predict(batch), repeat)[1] * 1000
+            measures.append({k: round(v, 3) if isinstance(v, float) else v for k, v in measure.items()})
+            logger.info(f"  - profondeur moyenne {mean_depth:5.2f}, {n_rows:6d} lignes: sklearn {measure['sklearn_ms']:.2f} ms, "
+                        f"vectorized {measure['vectorized_ms']:.2f} ms, native {measure['native_ms']:.2f} ms")
+
+    # Seuils (profondeur moyenne, lignes) de backend='auto' : chaque mesure compte pour son
+    # surcoût relatif au meilleur backend, un petit lot pèse autant qu'un gros
+    def auto_cost(max_mean_depth, max_rows):
+        cost = 0.0
+        for m in measures:
+            chosen = m["vectorized_ms"] if m["mean_depth"] <= max_mean_depth and m["rows"] <= max_rows else m["native_ms"]
+            cost += chosen / max(min(m["vectorized_ms"], m["native_ms"]), 1e-6)
+        return cost
+
+    candidates = [(0.0, 0)] + [(m["mean_depth"], m["rows"]) for m in measures]
+    max_mean_depth, max_rows = min(candidates, key=lambda c: (round(auto_cost(*c), 3), c))
+    thresholds = {"vectorized_max_mean_depth": max_mean_depth, "vectorized_max_rows": max_rows,
+                  "auto_relative_cost": round(auto_cost(max_mean_depth, max_rows) / len(measures), 3),
+                  "native_relative_cost": round(auto_cost(0.0, 0) / len(measures), 3)}
+    logger.info(f"📌 Seuils 'auto': profondeur moyenne <= {thresholds['vectorized_max_mean_depth']}, "
+                f"lots <= {thresholds['vectorized_max_rows']} lignes")
+
+    report = {"cpu_count": os.cpu_count(), "n_estimators": len(model.estimators_),
+              "n_features": model.n_features_in_, "repeat": repeat,
+              "thresholds": thresholds, "measures": measures}
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"💾 Mesures sauvegardées: {output_path}")
+    return report
+
+def check_parity(model, X, tolerance=PARITY_TOLERANCE, reference=None):
+    """Compare les prédictions des backends 'vectorized' et 'native' à model.predict
+
+    reference : prédictions sklearn déjà calculées sur X (recalculées sinon).
+    Renvoie True si l'écart absolu maximal de chaque backend est <= tolerance.
+    """
+    if reference is None:
+        reference = model.predict(X)
+
+    parity = True
+    for backend in ('vectorized', 'native'):
+        predictions = ForestInference(model, backend=backend).predict(X)
+        max_diff = float(np.max(np.abs(reference - predictions))) if len(X) else 0.0
+        if max_diff <= tolerance:
+            logger.info(f"  ✅ Parité {backend}/sklearn (écart max: {max_diff:.2e}, tolérance {tolerance:.0e})")
+        else:
+            logger.error(f"  ❌ Écart {backend}/sklearn: {max_diff:.2e} > tolérance {tolerance:.0e}")
+            parity = False
+    return parity
+
+def benchmark(rows=None, repeat=3, tolerance=PARITY_TOLERANCE):
+    """Vérifie la parité avec sklearn (check_parity) et mesure le débit (lignes/s)"""
+    logger.info("⏱️ BENCHMARK DU MOTEUR D'INFÉRENCE")
+    logger.info("=" * 50)
+
+    model, X = load_inputs(rows)
+    if model is None:
+        return False
+    logger.info(f"📊 {len(X)} lignes × {X.shape[1]} features, {len(model.estimators_)} arbres")
+
+    def best_time(fn):
+        return timed(fn, repeat)
+
+    sk_pred, sk_time = best_time(lambda: model.predict(X))
+    logger.info(f"  - sklearn: {len(X) / sk_time:,.0f} lignes/s ({sk_time:.3f}s)")
+
+    small_batch = X.iloc[:100]
+    _, sk_small = best_time(lambda: model.predict(small_batch))
+    for backend in ('vectorized', 'native'):
+        engine = ForestInference(model, backend=backend)
+        _, fi_time = best_time(lambda: engine.predict(X))
+        _, fi_small = best_time(lambda: engine.predict(small_batch))
+
+        logger.info(f"  - ForestInference[{backend}]: {len(X) / fi_time:,.0f} lignes/s ({fi_time:.3f}s), "
+                    f"accélération x{sk_time / fi_time:.2f}")
+        logger.info(f"    lot de {len(small_batch)} lignes: {fi_small * 1000:.2f} ms (sklearn {sk_small * 1000:.2f} ms)")
+
+    parity = check_parity(model, X, tolerance, reference=sk_pred)
+
+    auto = ForestInference(model)
+    logger.info(f"📌 Backend automatique: {auto.chunk_backend(len(small_batch))} (petits lots), "
+                f"{auto.chunk_backend(auto.chunk_size)} (gros lots)")
+    return parity
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du moteur d'inférence vectorisé")
+    parser.add_argument("--rows", type=int, default=None, help="Nombre de lignes à scorer (features répliquées)")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre de répétitions par mesure")
+    parser.add_argument("--check-parity", action="store_true",
+                        help="Vérifie seulement la parité avec sklearn, sans mesure de débit")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Mesure les backends par profondeur et taille de lot (seuils de backend='auto')")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE,
+                        help="Écart absolu maximal toléré avec model.predict")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        ok = calibrate(repeat=args.repeat) is not None
+    elif args.check_parity:
+        model, X = load_inputs(args.rows)
+        ok = model is not None and check_parity(model, X, args.tolerance)
+    else:
+        ok = benchmark(rows=args.rows, repeat=args.repeat, tolerance=args.tolerance)
+    if not ok:
+        sys.exit(1)
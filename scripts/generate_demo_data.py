@@ -2,15 +2,33 @@
 """
 Script pour générer des données de démonstration réalistes
 pour le dashboard LUMEN
+
+Les séries sont calculées en matrice département × date, sans boucle par
+jour. Par défaut, le tirage aléatoire suit la séquence historique
+(np.random.seed(42), département par département) : predictions.parquet est
+identique à celui des versions précédentes.
+
+Pour les tests de charge (--dataset), les départements sont répartis en blocs
+tirés chacun avec son propre générateur, dérivé de (seed, numéro de bloc), et
+répartis entre plusieurs processus : chaque processus écrit un fichier
+part-XXXXX.parquet du dataset, lisible d'un bloc avec pd.read_parquet(dossier).
+Le contenu ne dépend que de la graine, pas du nombre de processus.
 """
 
+import os
+import time
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Configuration
-np.random.seed(42)
+SEED = 42
 START_DATE = datetime(2023, 1, 1)
 END_DATE = datetime(2024, 12, 30)
 DEPARTMENTS = [f"{i:02d}" for i in range(1, 96)] + ['2A', '2B']
@@ -21,11 +39,21 @@ BASE_CASES = {
     'medium': 60,
     'high': 120
 }
+HIGH_DEPARTMENTS = ['75', '13', '69', '59', '44', '33', '31']
+MEDIUM_DEPARTMENTS = ['06', '83', '34', '67', '76', '92', '93', '94']
+
+# Pics épidémiques : 2 à 4 par département, fenêtre [centre - 14, centre + 14[
+MIN_PEAKS, MAX_PEAKS = 2, 4
+PEAK_OFFSETS = np.arange(-14, 14)
+PEAK_KERNEL = np.exp(-np.abs(PEAK_OFFSETS) / 5)
+
+# Lignes par bloc de départements en mode dataset (unité de tirage et row group)
+BLOCK_ROWS = 1 << 20
+
 
 def generate_seasonal_pattern(dates):
     """Génère un pattern saisonnier (pic en hiver)"""
-    # Convertir en nombre de jours depuis le début
-    day_of_year = np.array([d.timetuple().tm_yday for d in dates])
+    day_of_year = dates.dayofyear.to_numpy().astype(np.int64)
 
     # Pattern sinusoïdal avec pic en janvier/février (jour 30-60)
     # et creux en été (jour 180-210)
@@ -33,46 +61,82 @@ def generate_seasonal_pattern(dates):
     seasonal = -np.sin((day_of_year - 45) * 2 * np.pi / 365) * 0.5 + 0.5
     return seasonal
 
-def generate_department_data(dept_code, dates):
-    """Génère les données pour un département"""
 
-    # Classifier les départements par population (simplifié)
-    if dept_code in ['75', '13', '69', '59', '44', '33', '31']:
-        base = BASE_CASES['high']  # Grandes villes
-        variability = 40
-    elif dept_code in ['06', '83', '34', '67', '76', '92', '93', '94']:
-        base = BASE_CASES['medium']  # Villes moyennes
-        variability = 25
-    else:
-        base = BASE_CASES['low']  # Zones rurales
-        variability = 15
+def department_codes(n_departments=len(DEPARTMENTS)):
+    """Codes réels, puis codes synthétiques à trois chiffres ou plus au-delà"""
+    extra = [f"{i:03d}" for i in range(101, 101 + max(0, n_departments - len(DEPARTMENTS)))]
+    return (DEPARTMENTS + extra)[:n_departments]
+
+
+def department_profiles(codes):
+    """Niveau de base et variabilité de chaque département (classés par population, simplifié)"""
+    base = np.full(len(codes), BASE_CASES['low'], dtype=np.int64)  # Zones rurales
+    variability = np.full(len(codes), 15, dtype=np.int64)
+    medium = np.isin(codes, MEDIUM_DEPARTMENTS)  # Villes moyennes
+    base[medium], variability[medium] = BASE_CASES['medium'], 25
+    high = np.isin(codes, HIGH_DEPARTMENTS)  # Grandes villes
+    base[high], variability[high] = BASE_CASES['high'], 40
+    return base, variability
+
+
+def draw_sequential(variability, n_dates, rng):
+    """
+    Tirages dans l'ordre historique (RandomState) : pour chaque département,
+    bruit, nombre de pics, (centre, intensité) de chaque pic, bruit de prédiction
+    """
+    n_dept = len(variability)
+    noise = np.empty((n_dept, n_dates))
+    prediction_noise = np.empty((n_dept, n_dates))
+    num_peaks = np.empty(n_dept, dtype=np.int64)
+    centers = np.zeros((n_dept, MAX_PEAKS), dtype=np.int64)
+    intensities = np.zeros((n_dept, MAX_PEAKS))
+    for i, v in enumerate(variability):
+        noise[i] = rng.normal(0, v * 0.2, n_dates)
+        num_peaks[i] = rng.randint(MIN_PEAKS, MAX_PEAKS + 1)
+        for k in range(num_peaks[i]):
+            centers[i, k] = rng.randint(0, n_dates)
+            intensities[i, k] = rng.uniform(0.5, 1.5)
+        prediction_noise[i] = rng.normal(0, v * 0.1, n_dates)
+    return noise, num_peaks, centers, intensities, prediction_noise
+
+
+def draw_block(variability, n_dates, rng):
+    """Mêmes tirages, en un appel par grandeur pour tout le bloc (Generator)"""
+    n_dept = len(variability)
+    noise = rng.normal(0, (variability * 0.2)[:, None], (n_dept, n_dates))
+    num_peaks = rng.integers(MIN_PEAKS, MAX_PEAKS, size=n_dept, endpoint=True)
+    centers = rng.integers(0, n_dates, size=(n_dept, MAX_PEAKS))
+    intensities = rng.uniform(0.5, 1.5, size=(n_dept, MAX_PEAKS))
+    prediction_noise = rng.normal(0, (variability * 0.1)[:, None], (n_dept, n_dates))
+    return noise, num_peaks, centers, intensities, prediction_noise
 
-    # Pattern saisonnier
-    seasonal = generate_seasonal_pattern(dates)
+
+def generate_block(codes, dates, draws):
+    """Génère les données d'un ensemble de départements (matrice département × date)"""
+    noise, num_peaks, centers, intensities, prediction_noise = draws
+    base, _ = department_profiles(codes)
+    n_dept, n_dates = len(codes), len(dates)
 
     # Tendance de base avec variation saisonnière
-    trend = base * (0.5 + seasonal)
-
-    # Ajouter du bruit réaliste
-    noise = np.random.normal(0, variability * 0.2, len(dates))
-
-    # Ajouter des pics épidémiques occasionnels
-    epidemic_peaks = np.zeros(len(dates))
-    num_peaks = np.random.randint(2, 5)
-    for _ in range(num_peaks):
-        peak_center = np.random.randint(0, len(dates))
-        peak_width = 14  # 2 semaines
-        peak_intensity = np.random.uniform(0.5, 1.5)
-        for i in range(max(0, peak_center - peak_width), min(len(dates), peak_center + peak_width)):
-            distance = abs(i - peak_center)
-            epidemic_peaks[i] += peak_intensity * base * np.exp(-distance / 5)
+    trend = base[:, None] * (0.5 + generate_seasonal_pattern(dates))
+
+    # Pics épidémiques : un décalage du noyau à la fois pour tous les départements,
+    # pic par pic (chaque jour reçoit ses contributions dans l'ordre des pics)
+    epidemic_peaks = np.zeros((n_dept, n_dates))
+    rows = np.arange(n_dept)
+    for k in range(MAX_PEAKS):
+        active = k < num_peaks
+        amplitude = intensities[:, k] * base
+        for offset, weight in zip(PEAK_OFFSETS, PEAK_KERNEL):
+            day = centers[:, k] + offset
+            valid = active & (day >= 0) & (day < n_dates)
+            epidemic_peaks[rows[valid], day[valid]] += amplitude[valid] * weight
 
     # Valeurs réelles (y_target)
     y_target = trend + noise + epidemic_peaks
     y_target = np.maximum(10, y_target)  # Minimum 10 cas
 
     # Prédictions (légèrement différentes des valeurs réelles)
-    prediction_noise = np.random.normal(0, variability * 0.1, len(dates))
     prediction = y_target + prediction_noise
     prediction = np.maximum(10, prediction)
 
@@ -81,55 +145,117 @@ def generate_department_data(dept_code, dates):
     abs_error = np.abs(error)
     relative_error = abs_error / y_target
 
-    # Créer le DataFrame
-    df = pd.DataFrame({
-        'date': dates,
-        'department': dept_code,
-        'y_target': y_target,
-        'target_date': dates + timedelta(days=7),
-        'prediction': prediction,
-        'prediction_date': dates,
-        'error': error,
-        'abs_error': abs_error,
-        'relative_error': relative_error
+    # Créer le DataFrame (ordre département puis date)
+    date = np.tile(dates.to_numpy(), n_dept)
+    return pd.DataFrame({
+        'date': date,
+        'department': np.repeat(np.array(codes, dtype=object), n_dates),
+        'y_target': y_target.ravel(),
+        'target_date': np.tile((dates + timedelta(days=7)).to_numpy(), n_dept),
+        'prediction': prediction.ravel(),
+        'prediction_date': date,
+        'error': error.ravel(),
+        'abs_error': abs_error.ravel(),
+        'relative_error': relative_error.ravel()
     })
 
-    return df
 
-def main():
+def department_blocks(codes, n_dates):
+    """Découpage des départements en blocs d'environ BLOCK_ROWS lignes"""
+    size = max(1, BLOCK_ROWS // n_dates)
+    return [codes[i:i + size] for i in range(0, len(codes), size)]
+
+
+def write_shard(shard, blocks, dates, seed, output_dir):
+    """Écrit les blocs (numéro, codes) d'un processus dans part-XXXXX.parquet"""
+    path = Path(output_dir) / f"part-{shard:05d}.parquet"
+    rows = 0
+    writer = None
+    try:
+        for block, codes in blocks:
+            _, variability = department_profiles(codes)
+            draws = draw_block(variability, len(dates), np.random.default_rng([seed, block]))
+            table = pa.Table.from_pandas(generate_block(codes, dates, draws), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def generate_dataset(output_dir, codes, dates, seed=SEED, workers=None):
+    """Dataset Parquet partitionné par blocs de départements, généré par plusieurs processus"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for old in output_dir.glob('part-*.parquet'):
+        old.unlink()
+
+    blocks = list(enumerate(department_blocks(codes, len(dates))))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(blocks)))
+    shards = [blocks[i::workers] for i in range(workers)]
+    if workers == 1:
+        return write_shard(0, shards[0], dates, seed, output_dir)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_shard, shard, shard_blocks, dates, seed, output_dir)
+                   for shard, shard_blocks in enumerate(shards)]
+        return sum(future.result() for future in futures)
+
+
+def main(output_path='data/predictions/predictions.parquet', dataset_dir=None, n_departments=len(DEPARTMENTS),
+         start_date=START_DATE, end_date=END_DATE, seed=SEED, workers=None):
     print("🎲 Génération de données de démonstration pour LUMEN")
     print("=" * 60)
 
     # Générer la liste des dates
-    dates = pd.date_range(START_DATE, END_DATE, freq='D')
-    print(f"📅 Période: {START_DATE.date()} à {END_DATE.date()}")
-    print(f"📊 {len(dates)} jours × {len(DEPARTMENTS)} départements")
+    dates = pd.date_range(start_date, end_date, freq='D')
+    codes = department_codes(n_departments)
+    print(f"📅 Période: {dates[0].date()} à {dates[-1].date()}")
+    print(f"📊 {len(dates)} jours × {len(codes)} départements")
 
-    # Générer les données pour chaque département
-    all_data = []
-    for i, dept in enumerate(DEPARTMENTS, 1):
-        df_dept = generate_department_data(dept, dates)
-        all_data.append(df_dept)
+    start = time.perf_counter()
+    if dataset_dir is not None:
+        # Test de charge : blocs répartis entre processus, un fichier par processus
+        rows = generate_dataset(dataset_dir, codes, dates, seed, workers)
+        elapsed = time.perf_counter() - start
+        print(f"\n📦 Total: {rows:,} lignes générées en {elapsed:.1f}s ({rows / elapsed:,.0f} lignes/s)")
+        print(f"✅ Dataset sauvegardé: {dataset_dir}")
+        return
 
-        if i % 10 == 0:
-            print(f"✅ {i}/{len(DEPARTMENTS)} départements générés...")
+    # Tirages dans l'ordre historique, calcul vectorisé sur tous les départements
+    _, variability = department_profiles(codes)
+    draws = draw_sequential(variability, len(dates), np.random.RandomState(seed))
+    df_final = generate_block(codes, dates, draws)
+    elapsed = time.perf_counter() - start
 
-    # Combiner toutes les données
-    df_final = pd.concat(all_data, ignore_index=True)
-
-    print(f"\n📦 Total: {len(df_final):,} lignes générées")
+    print(f"\n📦 Total: {len(df_final):,} lignes générées en {elapsed:.1f}s")
     print(f"📈 Statistiques:")
     print(f"  - y_target: {df_final['y_target'].min():.1f} - {df_final['y_target'].max():.1f}")
     print(f"  - prediction: {df_final['prediction'].min():.1f} - {df_final['prediction'].max():.1f}")
     print(f"  - MAE moyenne: {df_final['abs_error'].mean():.2f}")
 
     # Sauvegarder
-    output_path = Path('data/predictions/predictions.parquet')
+    output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     df_final.to_parquet(output_path, index=False)
 
     print(f"\n✅ Données sauvegardées: {output_path}")
     print("🚀 Vous pouvez maintenant relancer le dashboard!")
 
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Génération de données de démonstration pour le dashboard")
+    parser.add_argument("--output", default="data/predictions/predictions.parquet", help="Fichier Parquet de sortie")
+    parser.add_argument("--dataset", default=None,
+                        help="Dossier du dataset partitionné (test de charge, génération multi-processus)")
+    parser.add_argument("--departments", type=int, default=len(DEPARTMENTS),
+                        help="Nombre de départements (codes synthétiques au-delà des départements réels)")
+    parser.add_argument("--start-date", default=START_DATE.strftime('%Y-%m-%d'), help="Première date")
+    parser.add_argument("--end-date", default=END_DATE.strftime('%Y-%m-%d'), help="Dernière date")
+    parser.add_argument("--seed", type=int, default=SEED, help="Graine aléatoire")
+    parser.add_argument("--workers", type=int, default=None, help="Processus du mode dataset (défaut: nombre de CPU)")
+    args = parser.parse_args()
+
+    main(args.output, args.dataset, args.departments, args.start_date, args.end_date, args.seed, args.workers)
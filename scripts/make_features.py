@@ -10,6 +10,8 @@ from pathlib import Path
 import logging
 import json
 from datetime import datetime, timedelta
+from feature_matrix import as_feature_matrix, save_feature_matrix, ROW_GROUP_SIZE
+from stage_handoff import StageHandoff, read_json, write_json
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -18,8 +20,10 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 class FeatureMaker:
-    def __init__(self):
+    def __init__(self, handoff=None):
         self.base_dir = Path("data")
+        # Config reçue de fit_stats et features publiées en mémoire (mode pipeline --in-memory)
+        self.handoff = handoff or StageHandoff()
         self.processed_dir = self.base_dir / "processed"
         self.timeseries_dir = self.processed_dir / "timeseries"
         self.features_dir = self.base_dir / "features"
@@ -55,14 +59,12 @@ class FeatureMaker:
             medians = {}
             cats = {}
             
-            if medians_file.exists():
-                with open(medians_file, 'r', encoding='utf-8') as f:
-                    medians = json.load(f)
+            if self.handoff.available(medians_file):
+                medians = self.handoff.fetch(medians_file, lambda: read_json(medians_file))
                 logger.info(f"✅ Médianes chargées: {len(medians)} variables")
             
-            if cats_file.exists():
-                with open(cats_file, 'r', encoding='utf-8') as f:
-                    cats = json.load(f)
+            if self.handoff.available(cats_file):
+                cats = self.handoff.fetch(cats_file, lambda: read_json(cats_file))
                 logger.info(f"✅ Catégories chargées: {len(cats)} variables")
             
             return df, medians, cats
@@ -295,17 +297,24 @@ class FeatureMaker:
         logger.info("=" * 50)
         
         try:
-            # Sauvegarder les features
-            features_df.to_parquet(self.features_path, index=False)
+            # Sauvegarder les features, avec leur copie float32 en ordre colonne
+            # mappée par l'entraînement et la prédiction
+            # (en mémoire, les étapes suivantes reçoivent cette même matrice float32)
+            matrix_df = as_feature_matrix(features_df) if self.handoff.in_memory else features_df
+            def write_features():
+                features_df.to_parquet(self.features_path, index=False, row_group_size=ROW_GROUP_SIZE)
+                save_feature_matrix(matrix_df, self.features_path)
+            self.handoff.publish(self.features_path, matrix_df, write_features)
             logger.info(f"✅ Features sauvegardées: {self.features_path}")
             
             # Sauvegarder la target
-            target_df.to_parquet(self.target_path, index=False)
+            self.handoff.publish(self.target_path, target_df, lambda: target_df.to_parquet(
+                self.target_path, index=False, row_group_size=ROW_GROUP_SIZE))
             logger.info(f"✅ Target sauvegardée: {self.target_path}")
             
             # Sauvegarder la liste des features
-            with open(self.feature_list_path, 'w', encoding='utf-8') as f:
-                json.dump(feature_list, f, indent=2, ensure_ascii=False)
+            self.handoff.publish(self.feature_list_path, feature_list,
+                                 lambda: write_json(feature_list, self.feature_list_path))
             logger.info(f"✅ Liste des features sauvegardée: {self.feature_list_path}")
             
             return True
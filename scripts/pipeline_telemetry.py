@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Télémétrie des étapes du pipeline et historique des exécutions.
+
+Chaque étape mesure son temps réel, son temps CPU (processus et workers
+enfants), son pic de mémoire résidente, ses octets lus/écrits et ses lignes
+en entrée/sortie. Les mesures sont ajoutées à data/pipeline_history.jsonl (une
+ligne JSON par étape et par exécution) et comparées à une exécution de
+référence pour repérer les régressions.
+
+Les étapes partagent le processus : CPU, RSS et octets sont des compteurs du
+processus, attribués à chaque étape pendant sa durée. Ils ne sont enregistrés
+que pour une étape qui a tourné seule (--max-workers 1 pour toutes les
+étapes) ; en mode --in-memory, les écritures différées se font pendant les
+étapes suivantes et les octets ne sont pas enregistrés par étape. Une
+exécution n'est comparée qu'aux exécutions de même mode (in_memory,
+max_workers).
+"""
+
+import os
+import json
+import time
+import logging
+import resource
+import threading
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Période d'échantillonnage de la mémoire résidente (secondes)
+RSS_SAMPLE_INTERVAL = 0.05
+
+# Compteurs du processus, sans objet pour une étape qui en a partagé la durée avec une autre
+PROCESS_METRICS = ["cpu_s", "peak_rss_mb", "bytes_read", "bytes_written"]
+IO_METRICS = ["bytes_read", "bytes_written"]
+
+# Mesures comparées : (champ, sens de la régression, écart absolu minimal signalé)
+COMPARED_METRICS = [
+    ("wall_s", "higher", 0.5),
+    ("cpu_s", "higher", 0.5),
+    ("peak_rss_mb", "higher", 50.0),
+    ("bytes_written", "higher", 10 * 1024 * 1024),
+    ("rows_per_s", "lower", 0.0)
+]
+
+
+def current_rss():
+    """Mémoire résidente du processus en octets (/proc, sinon pic getrusage)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss est en Ko sous Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def io_counters():
+    """Octets lus/écrits par le processus (rchar/wchar), None si indisponible"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(':') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def cpu_seconds():
+    """Temps CPU du processus et de ses enfants terminés (workers de process pools)"""
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def parquet_rows(path):
+    """Nombre de lignes d'un fichier Parquet d'après ses métadonnées"""
+    if path is None or not Path(path).exists():
+        return None
+    return pq.read_metadata(path).num_rows
+
+
+class ResourceSampler:
+    """Thread d'échantillonnage de la RSS, partagé par les étapes en cours"""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peaks = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='rss-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = current_rss()
+            with self.lock:
+                for name in self.peaks:
+                    self.peaks[name] = max(self.peaks[name], rss)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def begin(self, name):
+        with self.lock:
+            self.peaks[name] = current_rss()
+
+    def end(self, name):
+        rss = current_rss()
+        with self.lock:
+            return max(self.peaks.pop(name, rss), rss)
+
+
+class StageMonitor:
+    """Mesures d'une étape entre start() et stop()"""
+
+    def __init__(self, name, sampler):
+        self.name = name
+        self.sampler = sampler
+
+    def start(self):
+        self.started_at = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = cpu_seconds()
+        self.io_start = io_counters()
+        self.sampler.begin(self.name)
+
+    def stop(self):
+        wall = time.perf_counter() - self.wall_start
+        io_end = io_counters()
+        record = {
+            "started_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu_seconds() - self.cpu_start, 3),
+            "peak_rss_mb": round(self.sampler.end(self.name) / 1e6, 1),
+            "bytes_read": None,
+            "bytes_written": None
+        }
+        if self.io_start and io_end:
+            record["bytes_read"] = io_end[0] - self.io_start[0]
+            record["bytes_written"] = io_end[1] - self.io_start[1]
+        return record
+
+
+class RunHistory:
+    """Historique JSONL des exécutions du pipeline (une ligne par étape et par exécution)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def append(self, records):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        logger.info(f"📈 Télémétrie ajoutée: {self.path} ({len(records)} étapes)")
+
+    def load(self):
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def runs(self):
+        """Identifiants d'exécution dans l'ordre chronologique"""
+        return list(dict.fromkeys(record['run_id'] for record in self.load()))
+
+    @staticmethod
+    def same_mode(record, other):
+        """Deux mesures prises dans le même mode d'exécution (mémoire ou disque, étapes en parallèle)"""
+        return all(record.get(key) == other.get(key) for key in ('in_memory', 'max_workers'))
+
+    def compare(self, run_id=None, baseline_id=None, threshold=0.2):
+        """
+        Compare les étapes exécutées de run_id (dernière exécution par défaut) à
+        baseline_id (par défaut, la dernière exécution précédente de chaque étape
+        dans le même mode : in_memory et max_workers).
+        Renvoie la liste des régressions : écart relatif > threshold et écart
+        absolu au-dessus du minimum de la mesure.
+        """
+        records = self.load()
+        runs = list(dict.fromkeys(record['run_id'] for record in records))
+        if not runs:
+            raise ValueError(f"Historique vide: {self.path}")
+        run_id = run_id or runs[-1]
+        if run_id not in runs:
+            raise ValueError(f"Exécution inconnue: {run_id}")
+        if baseline_id is not None and baseline_id not in runs:
+            raise ValueError(f"Exécution de référence inconnue: {baseline_id}")
+
+        executed = [r for r in records if r['status'] == 'success']
+        current = {r['stage']: r for r in executed if r['run_id'] == run_id}
+        earlier = runs[:runs.index(run_id)]
+
+        logger.info(f"📊 COMPARAISON {run_id} / {baseline_id or 'exécution précédente de chaque étape'}")
+        logger.info("=" * 80)
+
+        regressions = []
+        for stage, record in current.items():
+            if baseline_id is not None:
+                candidates = [r for r in executed if r['run_id'] == baseline_id and r['stage'] == stage]
+            else:
+                candidates = [r for r in executed if r['run_id'] in earlier and r['stage'] == stage]
+            candidates = [r for r in candidates if self.same_mode(r, record)]
+            if not candidates:
+                logger.info(f"  {stage}: pas de référence (même mode in_memory={record.get('in_memory')}, "
+                            f"max_workers={record.get('max_workers')})")
+                continue
+            baseline = candidates[-1]
+
+            changes = []
+            for field, direction, min_delta in COMPARED_METRICS:
+                value, reference = record.get(field), baseline.get(field)
+                if value is None or not reference:
+                    continue
+                delta = value - reference if direction == "higher" else reference - value
+                ratio = delta / reference
+                flagged = ratio > threshold and delta > min_delta
+                changes.append(f"{field} {reference:g} → {value:g} ({(value - reference) / reference:+.0%})"
+                               + (" ⚠️" if flagged else ""))
+                if flagged:
+                    regressions.append({
+                        "stage": stage,
+                        "metric": field,
+                        "baseline_run": baseline['run_id'],
+                        "baseline": reference,
+                        "value": value,
+                        "change": round((value - reference) / reference, 3)
+                    })
+            logger.info(f"  {stage} (réf. {baseline['run_id']}): " + ", ".join(changes))
+
+        if regressions:
+            logger.warning(f"⚠️ {len(regressions)} régression(s) au-delà de {threshold:.0%}")
+        else:
+            logger.info(f"✅ Aucune régression au-delà de {threshold:.0%}")
+        return regressions
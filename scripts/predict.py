@@ -9,7 +9,17 @@ from pathlib import Path
 import logging
 import json
 import joblib
+import shutil
+import re
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
+from forest_inference import ForestInference
+from feature_matrix import load_feature_matrix, iter_aligned_rows, model_feature_paths, ROW_GROUP_SIZE
+from prediction_aggregates import PredictionAggregates, link_or_copy, swap_directory
+from stage_handoff import StageHandoff, read_json
+import os
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -17,9 +27,277 @@ warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# predictions.parquet est trié par date en row groups d'environ cette taille, coupés entre
+# deux dates : un lecteur filtré sur une période (dashboard) ne lit que les row groups
+# dont les statistiques de date la recoupent
+PREDICTIONS_ROW_GROUP_SIZE = 16384
+
+# Quantiles des prédictions par arbre exportés pour les bandes d'incertitude
+PREDICTION_QUANTILES = (0.1, 0.5, 0.9)
+
+def quantile_column(q):
+    """Nom de colonne d'un quantile de prédiction (0.1 -> prediction_p10)"""
+    return f"prediction_p{int(round(q * 100))}"
+
+def model_column(name):
+    """Colonne de prédiction d'un modèle challenger (candidate -> prediction_candidate)"""
+    return f"prediction_{name}"
+
+def r2_from_sums(sq_error, ss_tot):
+    """R² à partir des sommes, None s'il n'est pas défini (cible constante) : JSON valide, sans NaN"""
+    return 1 - sq_error / ss_tot if ss_tot > 0 else None
+
+def format_r2(r2):
+    return f"{r2:.3f}" if r2 is not None else "n/d"
+
+def date_row_group_bounds(dates, size=PREDICTIONS_ROW_GROUP_SIZE):
+    """
+    Bornes des row groups (environ size lignes) d'un tableau trié par date, coupés
+    au début d'une date : deux row groups ne partagent jamais une date
+    """
+    dates = np.asarray(dates)
+    date_starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]]) if len(dates) else np.zeros(1, dtype=np.int64)
+    bounds = [0]
+    while len(dates) - bounds[-1] > size:
+        # Dernière date commençant avant la taille visée, sinon la suivante (date de plus de size lignes)
+        i = np.searchsorted(date_starts, bounds[-1] + size, side='right') - 1
+        if date_starts[i] <= bounds[-1]:
+            i = np.searchsorted(date_starts, bounds[-1], side='right')
+            if i == len(date_starts):
+                break
+        bounds.append(int(date_starts[i]))
+    bounds.append(len(dates))
+    return bounds
+
+def write_date_row_groups(writer, table):
+    """Écrit une table triée par date, un row group par tranche de date_row_group_bounds"""
+    bounds = date_row_group_bounds(table.column('date').to_numpy())
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            writer.write_table(table.slice(start, stop - start))
+
+def date_row_groups_disjoint(path):
+    """Vrai si les row groups de path couvrent des périodes croissantes et disjointes (statistiques de date)"""
+    metadata = pq.ParquetFile(path).metadata
+    column = metadata.schema.to_arrow_schema().get_field_index('date')
+    previous_max = None
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max:
+            return False
+        if previous_max is not None and stats.min <= previous_max:
+            return False
+        previous_max = stats.max
+    return True
+
+def date_buckets(target_file, bucket_rows):
+    """
+    Numéro de seau de chaque date (Series indexée par date) : dates consécutives
+    regroupées par environ bucket_rows lignes. Seule la colonne date est lue,
+    row group par row group
+    """
+    counts = None
+    for group in range(target_file.num_row_groups):
+        group_counts = target_file.read_row_group(group, columns=['date']).column('date').to_pandas().value_counts()
+        counts = group_counts if counts is None else counts.add(group_counts, fill_value=0)
+    counts = counts.sort_index()
+    rows_before = counts.cumsum() - counts
+    return (rows_before // bucket_rows).astype(np.int64)
+
+def load_prediction_dataset(predictions_path, dataset_dir, **kwargs):
+    """
+    Relit tout l'historique : predictions.parquet (dernière prédiction complète)
+    puis les partitions ajoutées par le mode incrémental (la colonne date revient
+    du nom des partitions)
+    """
+    frames = [pd.read_parquet(predictions_path, **kwargs)]
+    if Path(dataset_dir).exists():
+        frames.append(pd.read_parquet(dataset_dir, **kwargs))
+    df = pd.concat(frames, ignore_index=True)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'].astype(str))
+    return df.sort_values(['department', 'date']).reset_index(drop=True)
+
+class RunningMetrics:
+    """
+    Sommes additives des erreurs de prédiction, globales et par département.
+
+    Le résumé (MAE, RMSE, MAPE, R², moyennes/écarts-types) se recalcule à partir
+    des sommes : un lot de nouvelles lignes met à jour le résumé sans relire
+    l'historique.
+    """
+    
+    SUM_FIELDS = ['n', 'abs_error', 'sq_error', 'relative_error', 'y_target', 'sq_y_target',
+                  'prediction', 'sq_prediction', 'in_interval', 'interval_width']
+    # Sommes par challenger, avec celles du champion sur les mêmes lignes
+    MODEL_FIELDS = ['n', 'abs_error', 'sq_error', 'relative_error', 'y_target', 'sq_y_target',
+                    'champion_abs_error', 'champion_sq_error', 'wins']
+    RECORD_COLUMNS = ['date', 'department', 'y_target', 'prediction', 'abs_error']
+    TOP_K = 10
+    
+    def __init__(self, state=None, models=()):
+        state = state or {}
+        self.totals = state.get('totals', dict.fromkeys(self.SUM_FIELDS, 0.0))
+        self.departments = state.get('departments', {})
+        self.models = state.get('models', {})
+        for name in models:
+            self.models.setdefault(name, dict.fromkeys(self.MODEL_FIELDS, 0.0))
+        self.best = state.get('best_predictions', [])
+        self.worst = state.get('worst_predictions', [])
+    
+    @staticmethod
+    def _row_sums(pred_df):
+        """Colonnes dont on cumule les sommes, calculées ligne à ligne"""
+        lower = pred_df[quantile_column(PREDICTION_QUANTILES[0])]
+        upper = pred_df[quantile_column(PREDICTION_QUANTILES[-1])]
+        return pd.DataFrame({
+            'n': 1.0,
+            'abs_error': pred_df['abs_error'],
+            'sq_error': pred_df['error'] ** 2,
+            'relative_error': pred_df['relative_error'],
+            'y_target': pred_df['y_target'],
+            'sq_y_target': pred_df['y_target'] ** 2,
+            'prediction': pred_df['prediction'],
+            'sq_prediction': pred_df['prediction'] ** 2,
+            'in_interval': ((pred_df['y_target'] >= lower) & (pred_df['y_target'] <= upper)).astype(float),
+            'interval_width': upper - lower,
+            'department': pred_df['department'].astype(str)
+        })
+    
+    def _records(self, df):
+        records = df[self.RECORD_COLUMNS].copy()
+        records['date'] = records['date'].dt.strftime('%Y-%m-%d')
+        return records.to_dict('records')
+    
+    def update(self, pred_df):
+        """Ajoute un lot de prédictions aux sommes"""
+        sums = self._row_sums(pred_df)
+        for field, value in sums[self.SUM_FIELDS].sum().items():
+            self.totals[field] += float(value)
+        for dept, row in sums.groupby('department')[self.SUM_FIELDS].sum().iterrows():
+            dept_totals = self.departments.setdefault(dept, dict.fromkeys(self.SUM_FIELDS, 0.0))
+            for field in self.SUM_FIELDS:
+                dept_totals[field] += float(row[field])
+        
+        # Challengers présents dans le lot
+        for name, model_totals in self.models.items():
+            column = model_column(name)
+            if column not in pred_df.columns:
+                continue
+            abs_error = (pred_df['y_target'] - pred_df[column]).abs()
+            model_sums = {
+                'n': len(pred_df),
+                'abs_error': abs_error.sum(),
+                'sq_error': (abs_error ** 2).sum(),
+                'relative_error': (abs_error / (pred_df['y_target'] + 1e-6) * 100).sum(),
+                'y_target': pred_df['y_target'].sum(),
+                'sq_y_target': (pred_df['y_target'] ** 2).sum(),
+                'champion_abs_error': pred_df['abs_error'].sum(),
+                'champion_sq_error': (pred_df['error'] ** 2).sum(),
+                'wins': (abs_error < pred_df['abs_error']).sum()
+            }
+            for field, value in model_sums.items():
+                model_totals[field] += float(value)
+        
+        # Meilleures / pires prédictions : fusion des top-k existants avec ceux du lot
+        best = pd.DataFrame(self.best + self._records(pred_df.nsmallest(self.TOP_K, 'abs_error')))
+        worst = pd.DataFrame(self.worst + self._records(pred_df.nlargest(self.TOP_K, 'abs_error')))
+        self.best = best.nsmallest(self.TOP_K, 'abs_error').to_dict('records')
+        self.worst = worst.nlargest(self.TOP_K, 'abs_error').to_dict('records')
+    
+    @staticmethod
+    def _mean_std(total, sq_total, n):
+        """Moyenne et écart-type (ddof=1, comme pandas) à partir des sommes, écart-type None pour une seule ligne"""
+        mean = total / n
+        if n <= 1:
+            return mean, None
+        var = (sq_total - n * mean ** 2) / (n - 1)
+        return mean, float(np.sqrt(max(var, 0.0)))
+    
+    def summary(self):
+        """Résumé au format de predictions_summary.json"""
+        t = self.totals
+        n = t['n']
+        mean_target, std_target = self._mean_std(t['y_target'], t['sq_y_target'], n)
+        mean_prediction, std_prediction = self._mean_std(t['prediction'], t['sq_prediction'], n)
+        ss_tot = t['sq_y_target'] - n * mean_target ** 2
+        
+        department_metrics = {}
+        for dept, d in sorted(self.departments.items()):
+            y_mean, y_std = self._mean_std(d['y_target'], d['sq_y_target'], d['n'])
+            p_mean, p_std = self._mean_std(d['prediction'], d['sq_prediction'], d['n'])
+            department_metrics[dept] = {
+                "abs_error_mean": round(d['abs_error'] / d['n'], 2),
+                "relative_error_mean": round(d['relative_error'] / d['n'], 2),
+                "y_target_mean": round(y_mean, 2),
+                "y_target_std": round(y_std, 2) if y_std is not None else None,
+                "prediction_mean": round(p_mean, 2),
+                "prediction_std": round(p_std, 2) if p_std is not None else None,
+                "count": int(d['n'])
+            }
+        
+        summary = {
+            "global_metrics": {
+                "mae": t['abs_error'] / n,
+                "rmse": float(np.sqrt(t['sq_error'] / n)),
+                "mape": t['relative_error'] / n,
+                "r2": r2_from_sums(t['sq_error'], ss_tot),
+                "total_predictions": int(n)
+            },
+            "interval_metrics": {
+                "quantiles": list(PREDICTION_QUANTILES),
+                "coverage": t['in_interval'] / n,
+                "mean_width": t['interval_width'] / n
+            },
+            "department_metrics": department_metrics,
+            "best_predictions": self.best,
+            "worst_predictions": self.worst,
+            "prediction_stats": {
+                "mean_target": mean_target,
+                "mean_prediction": mean_prediction,
+                "std_target": std_target,
+                "std_prediction": std_prediction
+            }
+        }
+        
+        comparison = {}
+        for name, m in sorted(self.models.items()):
+            if not m['n']:
+                continue
+            ss_tot = m['sq_y_target'] - m['y_target'] ** 2 / m['n']
+            mae = m['abs_error'] / m['n']
+            champion_mae = m['champion_abs_error'] / m['n']
+            comparison[name] = {
+                "column": model_column(name),
+                "rows": int(m['n']),
+                "mae": mae,
+                "rmse": float(np.sqrt(m['sq_error'] / m['n'])),
+                "mape": m['relative_error'] / m['n'],
+                "r2": r2_from_sums(m['sq_error'], ss_tot),
+                "champion_mae": champion_mae,
+                "champion_rmse": float(np.sqrt(m['champion_sq_error'] / m['n'])),
+                "champion_r2": r2_from_sums(m['champion_sq_error'], ss_tot),
+                "mae_delta": mae - champion_mae,
+                "win_rate": m['wins'] / m['n']
+            }
+        if comparison:
+            summary["model_comparison"] = comparison
+        return summary
+    
+    def to_dict(self):
+        return {
+            "totals": self.totals,
+            "departments": self.departments,
+            "models": self.models,
+            "best_predictions": self.best,
+            "worst_predictions": self.worst
+        }
+
 class Predictor:
-    def __init__(self):
+    def __init__(self, challengers=None, handoff=None):
         self.base_dir = Path("data")
+        # Modèle et features reçus des étapes amont (mode pipeline --in-memory)
+        self.handoff = handoff or StageHandoff()
         self.features_dir = self.base_dir / "features"
         self.artifacts_dir = self.base_dir / "artifacts"
         self.predictions_dir = self.base_dir / "predictions"
@@ -27,13 +305,23 @@ class Predictor:
         
         # Fichiers d'entrée
         self.model_path = self.artifacts_dir / "rf.joblib"
-        self.features_path = self.features_dir / "features.parquet"
+        # Modèles challengers {nom: chemin} évalués dans la même passe que rf.joblib
+        self.model_registry_path = self.artifacts_dir / "model_registry.json"
+        self.challenger_paths = challengers
+        self.challengers = {}
+        # Matrice réduite par select_features.py si elle est à jour (mêmes colonnes que le modèle)
+        self.features_path, self.feature_list_path = model_feature_paths(self.features_dir, self.handoff)
         self.target_path = self.features_dir / "y_target.parquet"
-        self.feature_list_path = self.features_dir / "feature_list.json"
         
         # Fichiers de sortie
         self.predictions_path = self.predictions_dir / "predictions.parquet"
         self.predictions_summary_path = self.predictions_dir / "predictions_summary.json"
+        # Partitions par date ajoutées par le mode incrémental depuis la dernière prédiction complète
+        # (predictions.parquet reste la base de l'historique) et agrégats courants
+        self.predictions_dataset_dir = self.predictions_dir / "dataset"
+        self.prediction_state_path = self.predictions_dir / "prediction_state.json"
+        # Tables d'agrégats lues par le dashboard
+        self.aggregates = PredictionAggregates(self.predictions_dir / "aggregates")
     
     def load_model_and_data(self):
         """Charge le modèle et les données"""
@@ -42,30 +330,30 @@ class Predictor:
         
         try:
             # Charger le modèle
-            if not self.model_path.exists():
+            if not self.handoff.available(self.model_path):
                 logger.error(f"❌ Modèle non trouvé: {self.model_path}")
                 return None, None, None, None
             
-            model = joblib.load(self.model_path)
+            model = self.handoff.fetch(self.model_path, lambda: joblib.load(self.model_path))
             logger.info(f"✅ Modèle chargé: {type(model).__name__}")
+            self.load_challengers()
             
             # Charger les features
-            if not self.features_path.exists():
+            if not self.handoff.available(self.features_path):
                 logger.error(f"❌ Features non trouvées: {self.features_path}")
                 return None, None, None, None
             
-            X = pd.read_parquet(self.features_path)
+            X = self.handoff.fetch(self.features_path, lambda: load_feature_matrix(self.features_path))
             logger.info(f"✅ Features chargées: {X.shape}")
             
             # Charger la target (pour comparaison)
-            y_df = pd.read_parquet(self.target_path)
+            y_df = self.handoff.fetch(self.target_path, lambda: pd.read_parquet(self.target_path))
             logger.info(f"✅ Target chargée: {y_df.shape}")
             
             # Charger la liste des features
             feature_list = {}
-            if self.feature_list_path.exists():
-                with open(self.feature_list_path, 'r', encoding='utf-8') as f:
-                    feature_list = json.load(f)
+            if self.handoff.available(self.feature_list_path):
+                feature_list = self.handoff.fetch(self.feature_list_path, lambda: read_json(self.feature_list_path))
                 logger.info(f"✅ Liste des features chargée: {len(feature_list.get('feature_names', []))} features")
             
             return model, X, y_df, feature_list
@@ -74,25 +362,48 @@ class Predictor:
             logger.error(f"❌ Erreur chargement: {e}")
             return None, None, None, None
     
-    def make_predictions(self, model, X, y_df):
-        """Fait les prédictions"""
-        logger.info("🔮 GÉNÉRATION DES PRÉDICTIONS")
-        logger.info("=" * 50)
+    def load_challengers(self):
+        """Charge les challengers (argument du constructeur, sinon model_registry.json)"""
+        paths = self.challenger_paths
+        if paths is None and self.model_registry_path.exists():
+            with open(self.model_registry_path, 'r', encoding='utf-8') as f:
+                paths = json.load(f).get('challengers', {})
+        
+        self.challengers = {}
+        for name, path in (paths or {}).items():
+            if not re.fullmatch(r'[a-z][a-z0-9_]*', name) or re.fullmatch(r'p\d+', name):
+                raise ValueError(f"Nom de challenger invalide: {name}")
+            self.challengers[name] = ForestInference(joblib.load(path))
+            logger.info(f"🥊 Challenger chargé: {name} ({path}, {self.challengers[name].n_trees} arbres)")
+        return self.challengers
+    
+    def make_predictions(self, model, X, y_df, engine=None, log=True):
+        """Fait les prédictions (engine réutilisable d'un bloc à l'autre, log=False pour les blocs)"""
+        if log:
+            logger.info("🔮 GÉNÉRATION DES PRÉDICTIONS")
+            logger.info("=" * 50)
         
         try:
-            # Prédictions
-            predictions = model.predict(X)
+            # Prédictions et quantiles par arbre (moteur vectorisé, une seule passe)
+            engine = engine or ForestInference(model)
+            predictions, bands = engine.predict_with_quantiles(X, PREDICTION_QUANTILES)
             
             # Créer le DataFrame de prédictions
             pred_df = y_df.copy()
             pred_df['prediction'] = predictions
+            for i, q in enumerate(PREDICTION_QUANTILES):
+                pred_df[quantile_column(q)] = bands[:, i]
+            # Challengers : une inférence de plus sur le même bloc de features
+            for name, challenger in self.challengers.items():
+                pred_df[model_column(name)] = challenger.predict(X)
             pred_df['prediction_date'] = pred_df['date'] + timedelta(days=7)
             pred_df['error'] = pred_df['y_target'] - pred_df['prediction']
             pred_df['abs_error'] = np.abs(pred_df['error'])
             pred_df['relative_error'] = pred_df['abs_error'] / (pred_df['y_target'] + 1e-6) * 100
             
-            logger.info(f"✅ Prédictions générées: {len(predictions)} échantillons")
-            logger.info(f"📅 Période des prédictions: {pred_df['date'].min()} à {pred_df['date'].max()}")
+            if log:
+                logger.info(f"✅ Prédictions générées: {len(predictions)} échantillons")
+                logger.info(f"📅 Période des prédictions: {pred_df['date'].min()} à {pred_df['date'].max()}")
             
             return pred_df
             
@@ -100,56 +411,27 @@ class Predictor:
             logger.error(f"❌ Erreur prédictions: {e}")
             return None
     
-    def analyze_predictions(self, pred_df):
-        """Analyse les prédictions"""
+    def analyze_predictions(self, pred_df, running=None):
+        """Analyse les prédictions (cumulées dans running si fourni)"""
         logger.info("📊 ANALYSE DES PRÉDICTIONS")
         logger.info("=" * 50)
         
         try:
-            # Métriques globales
-            mae = pred_df['abs_error'].mean()
-            rmse = np.sqrt((pred_df['error'] ** 2).mean())
-            mape = pred_df['relative_error'].mean()
-            r2 = 1 - (pred_df['error'] ** 2).sum() / ((pred_df['y_target'] - pred_df['y_target'].mean()) ** 2).sum()
-            
-            # Métriques par département
-            dept_metrics = pred_df.groupby('department').agg({
-                'abs_error': 'mean',
-                'relative_error': 'mean',
-                'y_target': ['mean', 'std'],
-                'prediction': ['mean', 'std']
-            }).round(2)
-            
-            # Top 10 meilleures prédictions
-            best_predictions = pred_df.nsmallest(10, 'abs_error')[['date', 'department', 'y_target', 'prediction', 'abs_error']]
-            
-            # Top 10 pires prédictions
-            worst_predictions = pred_df.nlargest(10, 'abs_error')[['date', 'department', 'y_target', 'prediction', 'abs_error']]
-            
-            analysis = {
-                "global_metrics": {
-                    "mae": float(mae),
-                    "rmse": float(rmse),
-                    "mape": float(mape),
-                    "r2": float(r2),
-                    "total_predictions": len(pred_df)
-                },
-                "department_metrics": dept_metrics.to_dict(),
-                "best_predictions": best_predictions.to_dict('records'),
-                "worst_predictions": worst_predictions.to_dict('records'),
-                "prediction_stats": {
-                    "mean_target": float(pred_df['y_target'].mean()),
-                    "mean_prediction": float(pred_df['prediction'].mean()),
-                    "std_target": float(pred_df['y_target'].std()),
-                    "std_prediction": float(pred_df['prediction'].std())
-                }
-            }
+            running = running if running is not None else RunningMetrics(models=self.challengers)
+            running.update(pred_df)
+            analysis = running.summary()
             
+            metrics = analysis['global_metrics']
             logger.info(f"📊 MÉTRIQUES GLOBALES:")
-            logger.info(f"  - MAE: {mae:.2f}")
-            logger.info(f"  - RMSE: {rmse:.2f}")
-            logger.info(f"  - MAPE: {mape:.1f}%")
-            logger.info(f"  - R²: {r2:.3f}")
+            logger.info(f"  - MAE: {metrics['mae']:.2f}")
+            logger.info(f"  - RMSE: {metrics['rmse']:.2f}")
+            logger.info(f"  - MAPE: {metrics['mape']:.1f}%")
+            logger.info(f"  - R²: {format_r2(metrics['r2'])}")
+            logger.info(f"  - Couverture P{int(PREDICTION_QUANTILES[0] * 100)}-P{int(PREDICTION_QUANTILES[-1] * 100)}: "
+                        f"{analysis['interval_metrics']['coverage']:.1%}")
+            for name, comparison in analysis.get('model_comparison', {}).items():
+                logger.info(f"  - 🥊 {name}: MAE {comparison['mae']:.2f} vs champion {comparison['champion_mae']:.2f} "
+                            f"(Δ {comparison['mae_delta']:+.2f}, meilleur sur {comparison['win_rate']:.0%} des lignes)")
             
             return analysis
             
@@ -157,26 +439,217 @@ class Predictor:
             logger.error(f"❌ Erreur analyse: {e}")
             return None
     
-    def save_predictions(self, pred_df, analysis):
-        """Sauvegarde les prédictions et l'analyse"""
+    def save_predictions(self, pred_df, path):
+        """Écrit les prédictions dans path (fichier temporaire, mis en place par publish_full_run)"""
         logger.info("💾 SAUVEGARDE DES PRÉDICTIONS")
         logger.info("=" * 50)
         
         try:
-            # Sauvegarder les prédictions
-            pred_df.to_parquet(self.predictions_path, index=False)
-            logger.info(f"✅ Prédictions sauvegardées: {self.predictions_path}")
+            # Prédictions triées par date pour le filtrage par row group
+            table = pa.Table.from_pandas(pred_df.sort_values(['date', 'department'], kind='stable'),
+                                         preserve_index=False)
+            with pq.ParquetWriter(path, table.schema) as writer:
+                write_date_row_groups(writer, table)
+            logger.info(f"✅ Prédictions écrites: {path}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur sauvegarde: {e}")
+            return False
+    
+    def publish_full_run(self, tmp_path, staged, running, run_id, first_date, last_date, rows):
+        """
+        Met en place les sorties d'une prédiction complète, une fois toutes écrites :
+        predictions.parquet, agrégats, suppression des partitions incrémentales
+        (couvertes), puis état et résumé
+        """
+        if not date_row_groups_disjoint(tmp_path):
+            raise ValueError(f"row groups de {tmp_path.name} non disjoints par date")
+        os.replace(tmp_path, self.predictions_path)
+        logger.info(f"✅ Prédictions sauvegardées: {self.predictions_path}")
+        self.aggregates.swap_in(staged)
+        if self.predictions_dataset_dir.exists():
+            shutil.rmtree(self.predictions_dataset_dir)
+        self.save_state(running, run_id, 'full', first_date, last_date, rows)
+    
+    def run_streaming_prediction(self):
+        """
+        Prédiction complète bloc par bloc : mémoire bornée par un row group, quelle que soit la taille des données.
+        Les blocs (ordre département, date) sont répartis en seaux de dates consécutives, puis chaque seau
+        est trié et écrit : predictions.parquet sort trié par date, comme en prédiction complète
+        """
+        logger.info("🚀 DÉBUT DE LA PRÉDICTION EN FLUX")
+        logger.info("=" * 60)
+        
+        if not self.model_path.exists() or not self.features_path.exists():
+            logger.error(f"❌ Modèle ou features non trouvés: {self.model_path}, {self.features_path}")
+            return False
+        
+        tmp_path = self.predictions_path.with_name(self.predictions_path.name + '.tmp')
+        spill_dir = self.predictions_path.with_name(self.predictions_path.name + '.spill.tmp')
+        writer = None
+        spill_writers = {}
+        staged = None
+        try:
+            model = joblib.load(self.model_path)
+            engine = ForestInference(model)
+            self.load_challengers()
+            features_file = pq.ParquetFile(self.features_path)
+            target_file = pq.ParquetFile(self.target_path)
+            logger.info(f"📊 {features_file.metadata.num_rows} lignes en {features_file.num_row_groups} row groups")
+            
+            # Agrégats construits à part : les tables en place ne sont remplacées qu'en fin de run réussi
+            run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+            staged = self.aggregates.staging()
+            
+            # Seaux de dates d'environ un row group de features : un seau tient en mémoire
+            buckets = date_buckets(target_file, ROW_GROUP_SIZE)
+            if spill_dir.exists():
+                shutil.rmtree(spill_dir)
+            spill_dir.mkdir(parents=True)
+            
+            running = RunningMetrics(models=self.challengers)
+            schema = None
+            first_date = last_date = None
+            for chunk_id, (offset, X_chunk, y_chunk) in enumerate(iter_aligned_rows(features_file, target_file)):
+                pred_chunk = self.make_predictions(model, X_chunk, y_chunk, engine=engine, log=False)
+                if pred_chunk is None:
+                    return False
+                
+                for bucket, part in pred_chunk.groupby(buckets.reindex(pred_chunk['date']).values, sort=False):
+                    table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+                    schema = table.schema
+                    if bucket not in spill_writers:
+                        spill_writers[bucket] = pq.ParquetWriter(spill_dir / f"bucket-{bucket:06d}.parquet", schema)
+                    spill_writers[bucket].write_table(table)
+                staged.add_chunk(pred_chunk, f"{run_id}-{chunk_id}")
+                running.update(pred_chunk)
+                
+                chunk_min, chunk_max = pred_chunk['date'].min(), pred_chunk['date'].max()
+                first_date = chunk_min if first_date is None else min(first_date, chunk_min)
+                last_date = chunk_max if last_date is None else max(last_date, chunk_max)
+                logger.info(f"  - Bloc {chunk_id + 1}/{features_file.num_row_groups}: "
+                            f"lignes {offset} à {offset + len(pred_chunk)}")
+            
             
-            # Sauvegarder l'analyse
-            with open(self.predictions_summary_path, 'w', encoding='utf-8') as f:
-                json.dump(analysis, f, indent=2, ensure_ascii=False)
-            logger.info(f"✅ Analyse sauvegardée: {self.predictions_summary_path}")
+            # Seaux relus dans l'ordre des dates, triés (date, département) et écrits en row groups disjoints
+            for spill_writer in spill_writers.values():
+                spill_writer.close()
+            for bucket in sorted(spill_writers):
+                part = pq.read_table(spill_dir / f"bucket-{bucket:06d}.parquet").to_pandas()
+                table = pa.Table.from_pandas(part.sort_values(['date', 'department'], kind='stable'),
+                                             schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                write_date_row_groups(writer, table)
+            spill_writers = {}
+            writer.close()
+            writer = None
+            staged.finalize(running, run_id)
+            self.publish_full_run(tmp_path, staged, running, run_id, first_date, last_date, running.totals['n'])
             
+            metrics = running.summary()['global_metrics']
+            logger.info("✅ PRÉDICTION EN FLUX TERMINÉE")
+            logger.info("=" * 60)
+            logger.info(f"🎯 MAE: {metrics['mae']:.2f}")
+            logger.info(f"📊 R²: {format_r2(metrics['r2'])}")
             return True
             
         except Exception as e:
-            logger.error(f"❌ Erreur sauvegarde: {e}")
+            logger.error(f"❌ Erreur prédiction en flux: {e}")
             return False
+        finally:
+            for spill_writer in spill_writers.values():
+                spill_writer.close()
+            if spill_dir.exists():
+                shutil.rmtree(spill_dir)
+            if writer is not None:
+                writer.close()
+            if tmp_path.exists():
+                tmp_path.unlink()
+            if staged is not None:
+                staged.discard()
+    
+    def stage_partitions(self, pred_df, run_id):
+        """
+        Dataset incrémental augmenté des nouvelles partitions, préparé dans dataset.tmp
+        (parts existantes liées, pas copiées) : le dataset en place n'est remplacé
+        qu'une fois l'ajout complet
+        """
+        staged_dir = self.predictions_dataset_dir.with_name(self.predictions_dataset_dir.name + '.tmp')
+        if staged_dir.exists():
+            shutil.rmtree(staged_dir)
+        if self.predictions_dataset_dir.exists():
+            shutil.copytree(self.predictions_dataset_dir, staged_dir, copy_function=link_or_copy)
+
+        table = pa.Table.from_pandas(pred_df.assign(date=pred_df['date'].dt.strftime('%Y-%m-%d')),
+                                     preserve_index=False)
+        pq.write_to_dataset(
+            table,
+            root_path=staged_dir,
+            partition_cols=['date'],
+            basename_template=f"part-{run_id}-{{i}}.parquet",
+            # Une date déjà présente est remplacée, jamais dupliquée
+            existing_data_behavior='delete_matching',
+            max_partitions=100000
+        )
+        logger.info(f"✅ {pred_df['date'].nunique()} partitions préparées: {staged_dir}")
+        return staged_dir
+    
+    def load_state(self):
+        """État du mode incrémental (dernière date prédite, agrégats), None si absent"""
+        if not self.prediction_state_path.exists() or not self.predictions_path.exists():
+            return None
+        with open(self.prediction_state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_state(self, running, run_id, mode, first_date, last_date, rows, state=None):
+        """Met à jour l'état et le résumé à partir des agrégats courants"""
+        state = state or {"runs": []}
+        last_date = last_date.strftime('%Y-%m-%d')
+        state.update({
+            "last_scored_date": max(last_date, state.get('last_scored_date') or last_date),
+            "total_rows": int(running.totals['n']),
+            "model_mtime": self.model_path.stat().st_mtime,
+            "updated_at": datetime.now().isoformat(),
+            "aggregates": running.to_dict()
+        })
+        state['runs'] = (state.get('runs', []) + [{
+            "run_id": run_id,
+            "mode": mode,
+            "rows": int(rows),
+            "first_date": first_date.strftime('%Y-%m-%d'),
+            "last_date": last_date
+        }])[-50:]
+        
+        with open(self.prediction_state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        with open(self.predictions_summary_path, 'w', encoding='utf-8') as f:
+            json.dump(running.summary(), f, indent=2, ensure_ascii=False)
+        logger.info(f"✅ État incrémental sauvegardé: {self.prediction_state_path} (jusqu'au {state['last_scored_date']})")
+    
+    def load_new_rows(self, last_scored_date):
+        """Charge uniquement les lignes dont la date est postérieure à last_scored_date"""
+        logger.info("📊 CHARGEMENT DES NOUVELLES DATES")
+        logger.info("=" * 50)
+        
+        try:
+            # La colonne date suffit pour repérer les lignes (features et target sont alignées)
+            dates = pd.read_parquet(self.target_path, columns=['date'])['date']
+            rows = np.flatnonzero((dates > pd.Timestamp(last_scored_date)).values)
+            if len(rows) == 0:
+                return None, None
+            
+            y_df = pd.read_parquet(self.target_path, filters=[('date', '>', pd.Timestamp(last_scored_date))])
+            # Matrice mappée : seules les lignes sélectionnées sont lues
+            X = load_feature_matrix(self.features_path).iloc[rows]
+            logger.info(f"✅ {len(rows)} nouvelles lignes sur {len(dates)} "
+                        f"({y_df['date'].min().date()} à {y_df['date'].max().date()})")
+            return X, y_df.reset_index(drop=True)
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement nouvelles dates: {e}")
+            return None, None
     
     def run_prediction(self):
         """Lance la prédiction complète"""
@@ -194,24 +667,128 @@ class Predictor:
             return False
         
         # Analyser les prédictions
-        analysis = self.analyze_predictions(pred_df)
+        running = RunningMetrics(models=self.challengers)
+        analysis = self.analyze_predictions(pred_df, running)
         if analysis is None:
             return False
         
-        # Sauvegarder
-        success = self.save_predictions(pred_df, analysis)
+        # Écrire prédictions et agrégats à part, puis les mettre en place ensemble :
+        # un échec laisse les sorties de la prédiction précédente intactes
+        tmp_path = self.predictions_path.with_name(self.predictions_path.name + '.tmp')
+        staged = None
+        success = self.save_predictions(pred_df, tmp_path)
+        if success:
+            try:
+                # L'état référence la date de rf.joblib : écritures amont différées terminées
+                if not self.handoff.flush():
+                    raise IOError("écritures différées des étapes amont en échec")
+                run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+                staged = self.aggregates.staging()
+                staged.add_chunk(pred_df, run_id)
+                staged.finalize(running, run_id)
+                self.publish_full_run(tmp_path, staged, running, run_id, pred_df['date'].min(), pred_df['date'].max(),
+                                      len(pred_df))
+            except Exception as e:
+                logger.error(f"❌ Erreur écriture de l'état et des agrégats: {e}")
+                success = False
+        if tmp_path.exists():
+            tmp_path.unlink()
+        if staged is not None:
+            staged.discard()
         
         if success:
             logger.info("✅ PRÉDICTION TERMINÉE AVEC SUCCÈS")
             logger.info("=" * 60)
             logger.info(f"🎯 MAE: {analysis['global_metrics']['mae']:.2f}")
-            logger.info(f"📊 R²: {analysis['global_metrics']['r2']:.3f}")
+            logger.info(f"📊 R²: {format_r2(analysis['global_metrics']['r2'])}")
             logger.info(f"💾 Prédictions sauvegardées: {self.predictions_path}")
             return True
         else:
             logger.error("❌ ÉCHEC DE LA PRÉDICTION")
             return False
 
+    def run_incremental_prediction(self):
+        """Prédit uniquement les dates postérieures à la dernière date prédite et les ajoute au dataset"""
+        logger.info("🚀 DÉBUT DE LA PRÉDICTION INCRÉMENTALE")
+        logger.info("=" * 60)
+        
+        state = self.load_state()
+        if state is None:
+            logger.info("ℹ️ Aucun état incrémental, prédiction complète initiale")
+            return self.run_prediction()
+        
+        if state.get('model_mtime') != self.model_path.stat().st_mtime:
+            logger.warning("⚠️ Le modèle a changé depuis la dernière prédiction complète : "
+                           "l'historique reste celui de l'ancien modèle (relancer sans --incremental pour le recalculer)")
+        
+        X, y_df = self.load_new_rows(state['last_scored_date'])
+        if X is None:
+            logger.info(f"✅ Aucune nouvelle date après le {state['last_scored_date']}")
+            return True
+        
+        try:
+            model = joblib.load(self.model_path)
+            self.load_challengers()
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement des modèles: {e}")
+            return False
+        
+        pred_df = self.make_predictions(model, X, y_df)
+        if pred_df is None:
+            return False
+        
+        staged_dir = None
+        staged = None
+        try:
+            run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+            running = RunningMetrics(state.get('aggregates'), models=self.challengers)
+            running.update(pred_df)
+            
+            # Partitions et agrégats préparés à part : en cas d'échec, dataset, tables et état
+            # restent ceux du run précédent et une reprise repart du même last_scored_date
+            staged_dir = self.stage_partitions(pred_df, run_id)
+            staged = self.aggregates.staging(copy=True)
+            staged.add_chunk(pred_df, run_id)
+            staged.finalize(running, run_id, since=pred_df['date'].min())
+            
+            swap_directory(staged_dir, self.predictions_dataset_dir)
+            self.aggregates.swap_in(staged)
+            self.save_state(running, run_id, 'incremental', pred_df['date'].min(), pred_df['date'].max(),
+                            len(pred_df), state)
+            
+            metrics = running.summary()['global_metrics']
+            logger.info("✅ PRÉDICTION INCRÉMENTALE TERMINÉE")
+            logger.info("=" * 60)
+            logger.info(f"🆕 {len(pred_df)} lignes prédites, {metrics['total_predictions']} au total")
+            logger.info(f"🎯 MAE cumulée: {metrics['mae']:.2f}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur sauvegarde incrémentale: {e}")
+            return False
+        finally:
+            if staged_dir is not None and staged_dir.exists():
+                shutil.rmtree(staged_dir)
+            if staged is not None:
+                staged.discard()
+
 if __name__ == "__main__":
-    predictor = Predictor()
-    predictor.run_prediction()
+    parser = argparse.ArgumentParser(description="Prédictions du modèle RandomForest")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Ne prédit que les dates postérieures à la dernière date prédite (partitions ajoutées à côté de predictions.parquet)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Prédiction complète bloc par bloc (row groups Parquet), mémoire bornée")
+    parser.add_argument("--challenger", action="append", default=None, metavar="NOM=CHEMIN",
+                        help="Modèle comparé au champion rf.joblib (répétable, remplace model_registry.json)")
+    args = parser.parse_args()
+    
+    challengers = None
+    if args.challenger:
+        challengers = dict(item.split('=', 1) for item in args.challenger)
+    predictor = Predictor(challengers)
+    if args.streaming:
+        predictor.run_streaming_prediction()
+    elif args.incremental:
+        predictor.run_incremental_prediction()
+    else:
+        predictor.run_prediction()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tables d'agrégats Parquet maintenues à chaque prédiction, pour que le dashboard
+et les autres consommateurs n'aient pas à relire toutes les prédictions :
+
+- national_daily.parquet : sommes nationales par date (cas, prédictions, erreurs,
+  départements par niveau d'alerte)
+- department_alerts/ : niveau d'alerte par date × département (parts ajoutées)
+- department_errors/ : MAE glissante 7 et 30 jours par département (parts ajoutées)
+- sufficient_stats.parquet : sommes suffisantes (n, Σy, Σy², Σŷ, Σe², ...) globales
+  et par département, d'où MAE, RMSE et R² se déduisent
+"""
+
+import os
+import sys
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Niveaux d'alerte définis une fois, dans dashboard_data.py (à la racine du dépôt, à côté d'app.py) :
+# les alertes écrites ici et celles recalculées par le dashboard utilisent les mêmes seuils
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+from dashboard_data import ALERT_THRESHOLDS, ALERT_LEVELS, RED_ALERT, alert_codes
+
+logger = logging.getLogger(__name__)
+
+# Fenêtres (jours) des MAE glissantes par département
+ROLLING_WINDOWS = (7, 30)
+
+def link_or_copy(src, dst):
+    """Lien physique vers un fichier jamais réécrit (part Parquet), copie si le système de fichiers le refuse"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def swap_directory(staged_dir, target_dir):
+    """Remplace target_dir par staged_dir (renommages), l'ancienne version est supprimée ensuite"""
+    staged_dir, target_dir = Path(staged_dir), Path(target_dir)
+    previous = target_dir.with_name(target_dir.name + '.old')
+    if previous.exists():
+        shutil.rmtree(previous)
+    if target_dir.exists():
+        target_dir.rename(previous)
+    staged_dir.rename(target_dir)
+    if previous.exists():
+        shutil.rmtree(previous)
+
+class PredictionAggregates:
+    def __init__(self, aggregates_dir):
+        self.aggregates_dir = Path(aggregates_dir)
+        self.national_path = self.aggregates_dir / "national_daily.parquet"
+        self.alerts_dir = self.aggregates_dir / "department_alerts"
+        self.errors_dir = self.aggregates_dir / "department_errors"
+        self.stats_path = self.aggregates_dir / "sufficient_stats.parquet"
+
+        # Sommes nationales partielles des blocs du run en cours
+        self.national_parts = []
+
+    def staging(self, copy=False):
+        """
+        Tables dans un dossier voisin (aggregates.tmp) : vides pour une prédiction
+        complète, copie des tables en place pour un ajout incrémental (copy=True ; les
+        parts, jamais réécrites, sont liées). Les tables en place restent lisibles et
+        intactes si le run échoue
+        """
+        staged = PredictionAggregates(self.aggregates_dir.with_name(self.aggregates_dir.name + '.tmp'))
+        staged.discard()
+        if copy and self.aggregates_dir.exists():
+            staged.aggregates_dir.mkdir(parents=True)
+            for parts_dir, staged_parts in ((self.alerts_dir, staged.alerts_dir), (self.errors_dir, staged.errors_dir)):
+                if parts_dir.exists():
+                    shutil.copytree(parts_dir, staged_parts, copy_function=link_or_copy)
+            # Tables réécrites par finalize : copiées, jamais liées
+            for path, staged_path in ((self.national_path, staged.national_path), (self.stats_path, staged.stats_path)):
+                if path.exists():
+                    shutil.copy2(path, staged_path)
+        return staged
+
+    def discard(self):
+        """Supprime les tables (run abandonné)"""
+        if self.aggregates_dir.exists():
+            shutil.rmtree(self.aggregates_dir)
+
+    def swap_in(self, staged):
+        """Remplace les tables par celles d'un run terminé (staging())"""
+        swap_directory(staged.aggregates_dir, self.aggregates_dir)
+
+    def add_chunk(self, pred_df, part_id):
+        """Enregistre un bloc de prédictions : alertes par département et sommes nationales partielles"""
+        self.alerts_dir.mkdir(parents=True, exist_ok=True)
+
+        alerts = pd.DataFrame({
+            'date': pred_df['date'].values,
+            'department': pred_df['department'].astype(str).values,
+            'y_target': pred_df['y_target'].astype(np.float32).values,
+            'prediction': pred_df['prediction'].astype(np.float32).values,
+            'abs_error': pred_df['abs_error'].astype(np.float32).values,
+            'alert_level': alert_codes(pred_df['y_target']),
+            'predicted_alert_level': alert_codes(pred_df['prediction'])
+        })
+        if 'prediction_p90' in pred_df.columns:
+            alerts['upper_alert_level'] = alert_codes(pred_df['prediction_p90'])
+        alerts.to_parquet(self.alerts_dir / f"part-{part_id}.parquet", index=False)
+
+        sums = pd.DataFrame({
+            'date': alerts['date'],
+            'n_departments': 1,
+            'total_target': pred_df['y_target'].values,
+            'total_prediction': pred_df['prediction'].values,
+            'sum_abs_error': pred_df['abs_error'].values,
+            'sum_sq_error': pred_df['error'].values ** 2,
+            'red_alert_count': (alerts['alert_level'] == RED_ALERT).astype(np.int64),
+            'predicted_red_count': (alerts['predicted_alert_level'] == RED_ALERT).astype(np.int64)
+        })
+        self.national_parts.append(sums.groupby('date').sum())
+
+    def _write_national(self):
+        """Fusionne les sommes du run avec la table existante (les sommes sont additives par date)"""
+        parts = self.national_parts
+        if self.national_path.exists():
+            parts = [pd.read_parquet(self.national_path).set_index('date')] + parts
+        national = pd.concat(parts).groupby(level=0).sum().sort_index()
+        national['mae'] = national['sum_abs_error'] / national['n_departments']
+        national.reset_index().to_parquet(self.national_path, index=False)
+        self.national_parts = []
+        return len(national)
+
+    def _write_rolling_errors(self, part_id, since=None):
+        """MAE glissantes par département pour les dates >= since (historique relu sur la fenêtre seulement)"""
+        self.errors_dir.mkdir(parents=True, exist_ok=True)
+        filters = None
+        if since is not None:
+            filters = [('date', '>=', since - pd.Timedelta(days=max(ROLLING_WINDOWS) - 1))]
+        history = pd.read_parquet(self.alerts_dir, columns=['date', 'department', 'abs_error'], filters=filters)
+        history = history.sort_values(['department', 'date'])
+
+        errors = history[['date', 'department']].reset_index(drop=True)
+        grouped = history.set_index('date').groupby('department', sort=False)['abs_error']
+        for window in ROLLING_WINDOWS:
+            errors[f'mae_{window}d'] = grouped.rolling(f'{window}D').mean().values.astype(np.float32)
+        if since is not None:
+            errors = errors[errors['date'] >= since]
+        errors.to_parquet(self.errors_dir / f"part-{part_id}.parquet", index=False)
+        return len(errors)
+
+    def _write_stats(self, running):
+        """Sommes suffisantes globales (department='ALL') et par département"""
+        rows = [{'department': 'ALL', **running.totals}]
+        rows += [{'department': dept, **totals} for dept, totals in sorted(running.departments.items())]
+        pd.DataFrame(rows).to_parquet(self.stats_path, index=False)
+
+    def finalize(self, running, part_id, since=None):
+        """Écrit les tables après le dernier bloc du run (since : première date nouvelle en incrémental)"""
+        n_dates = self._write_national()
+        n_errors = self._write_rolling_errors(part_id, since)
+        self._write_stats(running)
+        logger.info(f"✅ Agrégats mis à jour: {self.aggregates_dir} "
+                    f"({n_dates} dates nationales, {n_errors} lignes d'erreurs glissantes)")
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Service de prédiction résident : charge rf.joblib une seule fois et répond en
+HTTP (localhost ou socket Unix). Les requêtes concurrentes sont regroupées en
+micro-lots, avec une attente bornée par --max-wait-ms.
+
+Endpoints :
+  POST /predict  {"rows": [{feature: valeur, ...}] | [[valeurs...]]}
+                 {"keys": [{"department": "75", "date": "2024-01-15"}]}
+  GET  /metrics  compteurs de latence et de débit
+  GET  /health   état du modèle chargé
+"""
+
+import asyncio
+import json
+import logging
+import argparse
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from forest_inference import ForestInference
+from feature_matrix import load_feature_matrix, model_feature_paths
+from predict import PREDICTION_QUANTILES, quantile_column
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+
+# Nombre de latences conservées pour les percentiles de /metrics
+LATENCY_WINDOW = 2048
+
+
+class PredictionServer:
+    def __init__(self, max_batch_size=1024, max_wait_ms=2.0):
+        self.base_dir = Path("data")
+        self.model_path = self.base_dir / "artifacts" / "rf.joblib"
+        self.features_path, self.feature_list_path = model_feature_paths(self.base_dir / "features")
+        self.target_path = self.base_dir / "features" / "y_target.parquet"
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.queue = None
+        self.started_at = time.time()
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        # Temps passé à prédire des micro-lots : base du débit, indépendante de l'inactivité
+        self.busy_s = 0.0
+        self.counters = {"requests": 0, "rows": 0, "batches": 0, "errors": 0}
+
+    def load(self):
+        """Charge le modèle, la matrice de features mappée et l'index (département, date) -> ligne"""
+        logger.info("📦 CHARGEMENT DU SERVICE DE PRÉDICTION")
+        logger.info("=" * 50)
+
+        try:
+            model = joblib.load(self.model_path)
+            # Un seul groupe d'arbres : les micro-lots sont petits et déjà sérialisés par le worker
+            self.engine = ForestInference(model, n_jobs=1)
+            self.feature_names = self.engine.feature_names
+            if not self.feature_names and self.feature_list_path.exists():
+                with open(self.feature_list_path, 'r', encoding='utf-8') as f:
+                    self.feature_names = json.load(f).get('feature_names', [])
+            logger.info(f"✅ Modèle chargé: {self.engine.n_trees} arbres, {self.engine.n_features} features")
+
+            # Recherche par clé : lignes de la matrice de features mappée en mémoire
+            self.features = None
+            self.key_index = {}
+            if self.features_path.exists() and self.target_path.exists():
+                X = load_feature_matrix(self.features_path)
+                if self.feature_names and list(X.columns) != self.feature_names:
+                    X = X[self.feature_names]
+                # Vue sur le mapping (pas de copie) quand les colonnes sont déjà dans l'ordre du modèle
+                self.features = X.to_numpy(dtype=np.float32)
+                keys = pd.read_parquet(self.target_path, columns=['department', 'date'])
+                self.key_index = {
+                    (str(dept), date): i
+                    for i, (dept, date) in enumerate(zip(keys['department'], keys['date'].dt.strftime('%Y-%m-%d')))
+                }
+                logger.info(f"✅ Index (département, date): {len(self.key_index)} clés")
+
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement: {e}")
+            return False
+
+    def rows_to_matrix(self, rows):
+        """Convertit des lignes JSON (dicts nommés ou listes ordonnées) en matrice float32"""
+        if all(isinstance(row, dict) for row in rows):
+            missing = sorted({name for row in rows for name in self.feature_names if name not in row})
+            if missing:
+                raise ValueError(f"Features manquantes: {missing[:10]}")
+            return np.array([[row[name] for name in self.feature_names] for row in rows], dtype=np.float32)
+
+        X = np.array(rows, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.engine.n_features:
+            raise ValueError(f"Chaque ligne doit avoir {self.engine.n_features} valeurs")
+        return X
+
+    def keys_to_matrix(self, keys):
+        """Lignes de features pour des clés (département, date)"""
+        if self.features is None:
+            raise ValueError("Aucune matrice de features chargée pour la recherche par clé")
+        idx, unknown = [], []
+        for key in keys:
+            row = self.key_index.get((str(key.get('department')), str(key.get('date'))[:10]))
+            if row is None:
+                unknown.append(key)
+            else:
+                idx.append(row)
+        if unknown:
+            raise KeyError(unknown[:10])
+        return self.features[idx]
+
+    async def submit(self, X):
+        """Place une requête dans la file du micro-batcher et attend son résultat"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((X, future))
+        return await future
+
+    async def batch_worker(self):
+        """Regroupe les requêtes en attente jusqu'à max_batch_size lignes ou max_wait secondes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            n_rows = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self.queue.get_nowait()
+                batch.append(item)
+                n_rows += len(item[0])
+
+            X = batch[0][0] if len(batch) == 1 else np.concatenate([x for x, _ in batch])
+            started = time.perf_counter()
+            try:
+                # Calcul hors de la boucle d'événements : les connexions restent servies
+                predictions, bands = await loop.run_in_executor(
+                    None, self.engine.predict_with_quantiles, X, PREDICTION_QUANTILES)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.busy_s += time.perf_counter() - started
+
+            self.counters["batches"] += 1
+            offset = 0
+            for x, future in batch:
+                stop = offset + len(x)
+                if not future.done():
+                    future.set_result((predictions[offset:stop], bands[offset:stop]))
+                offset = stop
+
+    def metrics(self):
+        """Compteurs de débit et percentiles de latence (ms) sur les dernières requêtes
+
+        rows_per_s rapporte les lignes servies au temps de calcul des micro-lots (busy_s) :
+        les périodes sans requête ne font pas baisser le débit mesuré.
+        """
+        uptime = time.time() - self.started_at
+        latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            **self.counters,
+            "uptime_s": round(uptime, 1),
+            "busy_s": round(self.busy_s, 3),
+            "rows_per_s": round(self.counters["rows"] / self.busy_s, 1) if self.busy_s > 0 else 0.0,
+            "mean_batch_rows": round(self.counters["rows"] / self.counters["batches"], 1) if self.counters["batches"] else 0.0,
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p95": round(float(np.percentile(latencies, 95)), 3),
+                "p99": round(float(np.percentile(latencies, 99)), 3),
+                "max": round(float(latencies.max()), 3)
+            },
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+    async def predict(self, body):
+        """Traite un POST /predict, renvoie (statut HTTP, réponse JSON)"""
+        started = time.perf_counter()
+        try:
+            payload = json.loads(body or b'{}')
+            if payload.get('rows'):
+                X = self.rows_to_matrix(payload['rows'])
+            elif payload.get('keys'):
+                X = self.keys_to_matrix(payload['keys'])
+            else:
+                return 400, {"error": "Corps attendu: {'rows': [...]} ou {'keys': [...]}"}
+        except KeyError as e:
+            return 404, {"error": "Clés (département, date) inconnues", "keys": e.args[0]}
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, {"error": str(e)}
+
+        predictions, bands = await self.submit(X)
+
+        self.counters["requests"] += 1
+        self.counters["rows"] += len(X)
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+        results = []
+        for i in range(len(X)):
+            result = {"prediction": float(predictions[i])}
+            for j, q in enumerate(PREDICTION_QUANTILES):
+                result[quantile_column(q)] = float(bands[i, j])
+            results.append(result)
+        return 200, {"predictions": results}
+
+    async def route(self, method, path, body):
+        if path == '/predict':
+            if method != 'POST':
+                return 405, {"error": "POST attendu"}
+            return await self.predict(body)
+        if path == '/metrics' and method == 'GET':
+            return 200, self.metrics()
+        if path == '/health' and method == 'GET':
+            return 200, {"status": "ok", "n_estimators": self.engine.n_trees,
+                         "n_features": self.engine.n_features, "keys": len(self.key_index)}
+        return 404, {"error": f"Route inconnue: {method} {path}"}
+
+    async def handle_connection(self, reader, writer):
+        """Boucle HTTP/1.1 minimale avec keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = await self.route(method, target.split('?')[0], body)
+                except Exception as e:
+                    logger.error(f"❌ Erreur requête {method} {target}: {e}")
+                    self.counters["errors"] += 1
+                    status, payload = 500, {"error": str(e)}
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_socket=None):
+        """Démarre le micro-batcher et le serveur HTTP"""
+        self.queue = asyncio.Queue()
+        worker = asyncio.create_task(self.batch_worker())
+
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+            logger.info(f"🚀 Service de prédiction sur unix:{unix_socket}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            logger.info(f"🚀 Service de prédiction sur http://{host}:{port}")
+        logger.info(f"📦 Micro-lots: {self.max_batch_size} lignes max, attente max {self.max_wait * 1000:.1f} ms")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service de prédiction résident avec micro-lots")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute")
+    parser.add_argument("--port", type=int, default=8765, help="Port HTTP")
+    parser.add_argument("--unix-socket", default=None, help="Écoute sur un socket Unix au lieu de TCP")
+    parser.add_argument("--max-batch-size", type=int, default=1024, help="Lignes max par micro-lot")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Attente max pour compléter un micro-lot")
+    args = parser.parse_args()
+
+    server = PredictionServer(args.max_batch_size, args.max_wait_ms)
+    if server.load():
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+        except KeyboardInterrupt:
+            logger.info("🛑 Service arrêté")
@@ -1,97 +1,344 @@
 #!/usr/bin/env python3
 """
 Script principal pour exécuter tout le pipeline ML
+
+Les étapes sont exécutées dans le même processus (classes importées) selon leur
+graphe de dépendances : les étapes indépendantes tournent en parallèle et une
+étape dont le code, les entrées et les étapes amont n'ont pas changé depuis sa
+dernière exécution réussie est sautée.
+
+Avec --in-memory, les étapes se passent leurs sorties (DataFrames, config,
+modèle) en mémoire et l'écriture sur disque se fait en arrière-plan.
+
+Chaque exécution ajoute la télémétrie de ses étapes à data/pipeline_history.jsonl ;
+--compare la compare à une exécution de référence du même mode. CPU, RSS et
+octets ne sont enregistrés que pour les étapes qui ont tourné seules : lancer
+avec --max-workers 1 pour les mesurer toutes.
 """
 
-import subprocess
-import sys
+import hashlib
+import json
+import argparse
 from pathlib import Path
 import logging
+import sys
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from clean_data import DataCleaner
+from fit_stats import StatsFitter
+from make_features import FeatureMaker
+from select_features import FeatureSelector
+from train_random_forest import RandomForestTrainer
+from predict import Predictor
+from stage_handoff import StageHandoff
+from pipeline_telemetry import ResourceSampler, StageMonitor, RunHistory, parquet_rows, PROCESS_METRICS, IO_METRICS
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+class Stage:
+    """Étape du pipeline : fonction à exécuter, entrées externes, code et étapes amont"""
+
+    def __init__(self, name, description, run, inputs=(), code=(), deps=(), outputs=(), optional=False,
+                 rows_in=None, rows_out=None):
+        self.name = name
+        self.description = description
+        self.run = run
+        self.inputs = [Path(p) for p in inputs]
+        self.code = [SCRIPTS_DIR / c for c in code]
+        self.deps = list(deps)
+        self.outputs = [Path(p) for p in outputs]
+        # Une étape optionnelle en échec n'arrête pas le pipeline (ex. données brutes non tirées de DVC)
+        self.optional = optional
+        # Parquet dont le nombre de lignes est relevé en entrée/sortie (télémétrie)
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+
 class MLPipeline:
-    def __init__(self):
-        self.scripts_dir = Path("scripts")
-        self.pipeline_steps = [
-            ("fit_stats.py", "Calcul des statistiques de référence"),
-            ("make_features.py", "Création des features"),
-            ("train_random_forest.py", "Entraînement du modèle"),
-            ("predict.py", "Génération des prédictions")
+    def __init__(self, max_workers=2, force=False, in_memory=False):
+        self.base_dir = Path("data")
+        self.state_path = self.base_dir / "pipeline_state.json"
+        self.history = RunHistory(self.base_dir / "pipeline_history.jsonl")
+        self.max_workers = max_workers
+        self.force = force
+        self.handoff = StageHandoff(in_memory=in_memory)
+        self.pipeline_steps = self.build_stages()
+
+        # Empreintes des fichiers déjà hachés : {chemin: [taille, mtime_ns, empreinte]}
+        self.file_digests = {}
+
+        # Étapes en cours, et celles qui ont partagé le processus avec une autre (télémétrie non attribuable)
+        self.active_stages = set()
+        self.overlapped_stages = set()
+        self.stages_lock = threading.Lock()
+
+    def build_stages(self):
+        """Graphe des étapes (les étapes amont de chaque étape sont dans deps)"""
+        timeseries = self.base_dir / "processed" / "timeseries" / "daily_emergency_series_simple.parquet"
+        features_dir = self.base_dir / "features"
+        stages = [
+            Stage("clean_data", "Nettoyage des données brutes",
+                  lambda: not DataCleaner().run_cleaning().empty,
+                  inputs=[self.base_dir / "raw"], code=["clean_data.py"],
+                  outputs=[self.base_dir / "processed" / "lumen_merged_clean.parquet"], optional=True,
+                  rows_out=self.base_dir / "processed" / "lumen_merged_clean.parquet"),
+            Stage("fit_stats", "Calcul des statistiques de référence",
+                  lambda: StatsFitter(handoff=self.handoff).run_fit_stats(),
+                  inputs=[timeseries], code=["fit_stats.py"],
+                  outputs=[self.base_dir / "config" / "medians.json", self.base_dir / "config" / "cats.json"],
+                  rows_in=timeseries),
+            Stage("make_features", "Création des features",
+                  lambda: FeatureMaker(handoff=self.handoff).run_make_features(),
+                  inputs=[timeseries], code=["make_features.py", "feature_matrix.py"], deps=["fit_stats"],
+                  outputs=[features_dir / "features.parquet", features_dir / "y_target.parquet"],
+                  rows_in=timeseries, rows_out=features_dir / "features.parquet"),
+            Stage("select_features", "Sélection des features",
+                  lambda: FeatureSelector(handoff=self.handoff).run_selection(),
+                  code=["select_features.py", "train_random_forest.py", "forest_inference.py", "feature_matrix.py"],
+                  deps=["make_features"],
+                  outputs=[features_dir / "features_selected.parquet", features_dir / "feature_list_selected.json"],
+                  rows_in=features_dir / "features.parquet", rows_out=features_dir / "features_selected.parquet"),
+            Stage("train", "Entraînement du modèle",
+                  lambda: RandomForestTrainer(handoff=self.handoff).run_training(),
+                  code=["train_random_forest.py", "forest_inference.py", "feature_matrix.py"], deps=["select_features"],
+                  outputs=[self.base_dir / "artifacts" / "rf.joblib"],
+                  rows_in=features_dir / "features_selected.parquet"),
+            Stage("predict", "Génération des prédictions",
+                  lambda: Predictor(handoff=self.handoff).run_prediction(),
+                  code=["predict.py", "forest_inference.py", "feature_matrix.py", "prediction_aggregates.py"],
+                  deps=["train"],
+                  outputs=[self.base_dir / "predictions" / "predictions.parquet"],
+                  rows_in=features_dir / "features_selected.parquet",
+                  rows_out=self.base_dir / "predictions" / "predictions.parquet")
         ]
-    
-    def run_script(self, script_name, description):
-        """Exécute un script du pipeline"""
-        logger.info(f"🚀 {description}")
+        return {stage.name: stage for stage in stages}
+
+    def load_state(self):
+        if self.state_path.exists():
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.file_digests = state.get('files', {})
+            return state
+        return {"stages": {}, "files": {}}
+
+    def save_state(self, state):
+        state['files'] = self.file_digests
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+
+    def file_digest(self, path):
+        """Empreinte du contenu d'un fichier, recalculée seulement si sa taille ou sa date change"""
+        stat = path.stat()
+        cached = self.file_digests.get(str(path))
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        self.file_digests[str(path)] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def fingerprint(self, stage, fingerprints):
+        """Empreinte d'une étape : code, entrées externes et empreintes des étapes amont"""
+        h = hashlib.sha256(stage.name.encode())
+        for path in stage.code + stage.inputs:
+            files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+            for file in files:
+                h.update(str(file).encode())
+                h.update(self.file_digest(file).encode() if file.exists() else b'absent')
+        for dep in stage.deps:
+            h.update(fingerprints[dep].encode())
+        return h.hexdigest()
+
+    def run_stage(self, stage, sampler):
+        """Exécute une étape dans le processus courant, renvoie (succès, télémétrie)"""
+        logger.info(f"🚀 {stage.description}")
         logger.info("=" * 60)
-        
+        with self.stages_lock:
+            if self.active_stages:
+                self.overlapped_stages.update(self.active_stages | {stage.name})
+            self.active_stages.add(stage.name)
+        monitor = StageMonitor(stage.name, sampler)
+        monitor.start()
+
         try:
-            script_path = self.scripts_dir / script_name
-            if not script_path.exists():
-                logger.error(f"❌ Script non trouvé: {script_path}")
-                return False
-            
-            # Exécuter le script
-            result = subprocess.run([sys.executable, str(script_path)], 
-                                  capture_output=True, text=True, cwd=Path.cwd())
-            
-            if result.returncode == 0:
-                logger.info(f"✅ {description} - SUCCÈS")
-                if result.stdout:
-                    logger.info(f"📊 Sortie: {result.stdout[-500:]}")  # Dernières 500 caractères
-                return True
+            missing = [str(p) for p in stage.inputs if not p.exists()]
+            if missing:
+                logger.error(f"❌ Entrées manquantes pour {stage.name}: {missing}")
+                return False, monitor.stop()
+
+            success = bool(stage.run())
+            telemetry = monitor.stop()
+            if success:
+                logger.info(f"✅ {stage.description} - SUCCÈS ({telemetry['wall_s']:.1f}s, "
+                            f"CPU {telemetry['cpu_s']:.1f}s, pic RSS {telemetry['peak_rss_mb']:.0f} Mo)")
             else:
-                logger.error(f"❌ {description} - ÉCHEC")
-                logger.error(f"Erreur: {result.stderr}")
-                return False
-                
+                logger.error(f"❌ {stage.description} - ÉCHEC")
+            return success, telemetry
+
         except Exception as e:
-            logger.error(f"❌ Erreur exécution {script_name}: {e}")
-            return False
-    
+            logger.error(f"❌ Erreur exécution {stage.name}: {e}")
+            return False, monitor.stop()
+
+        finally:
+            with self.stages_lock:
+                self.active_stages.discard(stage.name)
+
+    def record_run(self, run_id, results, telemetry, fingerprints):
+        """Ajoute une ligne par étape à l'historique (lignes relevées une fois les fichiers écrits)"""
+        records = []
+        for name, result in results.items():
+            stage = self.pipeline_steps[name]
+            record = {
+                "run_id": run_id,
+                "stage": name,
+                "status": result,
+                "in_memory": self.handoff.in_memory,
+                "max_workers": self.max_workers,
+                "fingerprint": fingerprints.get(name)
+            }
+            if name in telemetry:
+                record.update(telemetry[name])
+                # Compteurs du processus : non attribuables si une autre étape tournait en même temps,
+                # octets non attribuables en mode mémoire (écritures différées pendant les étapes suivantes)
+                record["exclusive"] = name not in self.overlapped_stages
+                unattributed = PROCESS_METRICS if not record["exclusive"] else []
+                if self.handoff.in_memory:
+                    unattributed = unattributed + IO_METRICS
+                for field in unattributed:
+                    record[field] = None
+                rows_in, rows_out = parquet_rows(stage.rows_in), parquet_rows(stage.rows_out)
+                rows = rows_in if rows_in is not None else rows_out
+                record.update({
+                    "rows_in": rows_in,
+                    "rows_out": rows_out,
+                    "rows_per_s": round(rows / record['wall_s'], 1) if rows and record['wall_s'] > 0 else None
+                })
+            records.append(record)
+        try:
+            self.history.append(records)
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture de l'historique: {e}")
+
     def run_full_pipeline(self):
         """Exécute le pipeline complet"""
         logger.info("🚀 DÉBUT DU PIPELINE ML COMPLET")
         logger.info("=" * 80)
         logger.info(f"⏰ Heure de début: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info("=" * 80)
-        
-        success_count = 0
-        total_steps = len(self.pipeline_steps)
-        
-        for i, (script_name, description) in enumerate(self.pipeline_steps, 1):
-            logger.info(f"📋 ÉTAPE {i}/{total_steps}: {description}")
-            logger.info("-" * 60)
-            
-            success = self.run_script(script_name, description)
-            
-            if success:
-                success_count += 1
-                logger.info(f"✅ Étape {i} terminée avec succès")
-            else:
-                logger.error(f"❌ Étape {i} échouée - Arrêt du pipeline")
-                break
-            
-            logger.info("")
-        
+
+        state = self.load_state()
+        stages = self.pipeline_steps
+        pending = dict(stages)
+        running = {}
+        fingerprints = {}
+        results = {}
+        telemetry = {}
+        run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        sampler = ResourceSampler()
+        sampler.start()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Lancer toutes les étapes dont les dépendances sont résolues
+                for name, stage in list(pending.items()):
+                    if any(dep in pending or dep in running.values() for dep in stage.deps):
+                        continue
+                    del pending[name]
+
+                    if any(results[dep] in ('failed', 'blocked') for dep in stage.deps):
+                        results[name] = 'blocked'
+                        logger.error(f"⛔ {stage.description} - non exécutée (étape amont en échec)")
+                        continue
+
+                    fingerprints[name] = self.fingerprint(stage, fingerprints)
+                    previous = state['stages'].get(name, {})
+                    # Une étape amont réexécutée a pu réécrire les entrées de l'étape
+                    if (not self.force and previous.get('fingerprint') == fingerprints[name]
+                            and all(results[dep] == 'skipped' for dep in stage.deps)
+                            and all(p.exists() for p in stage.outputs)):
+                        results[name] = 'skipped'
+                        logger.info(f"⏭️ {stage.description} - inchangée, sautée")
+                        continue
+
+                    running[executor.submit(self.run_stage, stage, sampler)] = name
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    success, telemetry[name] = future.result()
+                    results[name] = 'success' if success else 'failed'
+                    if success:
+                        state['stages'][name] = {
+                            "fingerprint": fingerprints[name],
+                            "completed_at": datetime.now().isoformat(),
+                            "duration_s": round(telemetry[name]['wall_s'], 2)
+                        }
+                        if not self.handoff.in_memory:
+                            self.save_state(state)
+
+        # Mode mémoire : l'état n'est enregistré qu'une fois les écritures différées terminées
+        persisted = True
+        if self.handoff.in_memory:
+            persisted = self.handoff.close()
+            if persisted:
+                self.save_state(state)
+        sampler.stop()
+        self.record_run(run_id, results, telemetry, fingerprints)
+
         # Résumé final
+        failed = [name for name, result in results.items()
+                  if result in ('failed', 'blocked') and not stages[name].optional]
         logger.info("=" * 80)
         logger.info(f"📊 RÉSUMÉ DU PIPELINE")
-        logger.info(f"✅ Étapes réussies: {success_count}/{total_steps}")
+        for name, result in results.items():
+            icon = {'success': '✅', 'skipped': '⏭️', 'failed': '❌', 'blocked': '⛔'}[result]
+            optional = " (optionnelle)" if stages[name].optional and result == 'failed' else ""
+            logger.info(f"  {icon} {stages[name].description}: {result}{optional}")
         logger.info(f"⏰ Heure de fin: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        if success_count == total_steps:
+
+        if not persisted:
+            logger.error("❌ Écritures différées en échec, état du pipeline non enregistré")
+
+        if not failed and persisted:
             logger.info("🎉 PIPELINE COMPLET TERMINÉ AVEC SUCCÈS !")
             logger.info("=" * 80)
             return True
         else:
-            logger.error(f"❌ PIPELINE ÉCHOUÉ - {total_steps - success_count} étape(s) échouée(s)")
+            logger.error(f"❌ PIPELINE ÉCHOUÉ - {len(failed)} étape(s) échouée(s)")
             logger.error("=" * 80)
             return False
 
 if __name__ == "__main__":
-    pipeline = MLPipeline()
+    parser = argparse.ArgumentParser(description="Pipeline ML complet (graphe d'étapes en processus unique)")
+    parser.add_argument("--force", action="store_true", help="Réexécute toutes les étapes même inchangées")
+    parser.add_argument("--max-workers", type=int, default=2,
+                        help="Étapes indépendantes exécutées en parallèle (1 : télémétrie complète de chaque étape)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Passe les sorties entre étapes en mémoire, écriture disque en arrière-plan")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare la télémétrie d'une exécution à une référence au lieu de lancer le pipeline")
+    parser.add_argument("--run", default=None, help="Exécution comparée (défaut : la dernière)")
+    parser.add_argument("--baseline", default=None,
+                        help="Exécution de référence (défaut : exécution précédente de chaque étape)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Écart relatif signalé comme régression")
+    args = parser.parse_args()
+
+    pipeline = MLPipeline(max_workers=args.max_workers, force=args.force, in_memory=args.in_memory)
+    if args.compare:
+        try:
+            regressions = pipeline.history.compare(args.run, args.baseline, args.threshold)
+        except ValueError as e:
+            logger.error(f"❌ {e}")
+            sys.exit(2)
+        sys.exit(1 if regressions else 0)
     pipeline.run_full_pipeline()
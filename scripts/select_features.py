@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Script pour réduire la matrice de features entre make_features et l'entraînement :
+suppression des colonnes quasi constantes, fortement corrélées ou peu importantes,
+puis mesure du gain de temps et de l'écart de précision
+
+Toutes les décisions sont prises sur la partie entraînement du split temporel
+(importance mesurée sur une tranche de validation prise à sa fin) : la partie
+test ne sert qu'à la comparaison finale entre matrice complète et réduite.
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import logging
+import time
+import argparse
+from datetime import datetime
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+from forest_inference import ForestInference
+from feature_matrix import (load_feature_matrix, save_feature_matrix, ROW_GROUP_SIZE,
+                            SELECTED_FEATURES_NAME, SELECTED_FEATURE_LIST_NAME)
+from train_random_forest import RandomForestTrainer, build_feature_groups
+from stage_handoff import StageHandoff, read_json, write_json
+import warnings
+warnings.filterwarnings('ignore')
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class FeatureSelector:
+    def __init__(self, near_constant_ratio=0.995, max_correlation=0.98, min_importance_share=0.001,
+                 eval_trees=30, correlation_sample=20000, validation_size=0.2, handoff=None):
+        self.base_dir = Path("data")
+        # Features reçues de make_features et sélection publiées en mémoire (mode pipeline --in-memory)
+        self.handoff = handoff or StageHandoff()
+        self.features_dir = self.base_dir / "features"
+        self.artifacts_dir = self.base_dir / "artifacts"
+
+        # Fichiers d'entrée : sorties de make_features, jamais réécrites ici
+        self.features_path = self.features_dir / "features.parquet"
+        self.target_path = self.features_dir / "y_target.parquet"
+        self.feature_list_path = self.features_dir / "feature_list.json"
+        # Fichiers de sortie, lus par l'entraînement et la prédiction
+        self.selected_features_path = self.features_dir / SELECTED_FEATURES_NAME
+        self.selected_feature_list_path = self.features_dir / SELECTED_FEATURE_LIST_NAME
+        self.report_path = self.features_dir / "feature_selection_report.json"
+
+        # Seuils
+        self.near_constant_ratio = near_constant_ratio
+        self.max_correlation = max_correlation
+        self.min_importance_share = min_importance_share
+        self.eval_trees = eval_trees
+        self.correlation_sample = correlation_sample
+        self.validation_size = validation_size
+
+        self.trainer = RandomForestTrainer()
+
+    def load_data(self):
+        """Charge la matrice complète (avant toute sélection) et la target"""
+        logger.info("📊 CHARGEMENT DES DONNÉES")
+        logger.info("=" * 50)
+
+        try:
+            if not self.handoff.available(self.feature_list_path) or not self.handoff.available(self.features_path):
+                logger.error(f"❌ Features non trouvées: {self.features_path}")
+                return None, None, None
+
+            feature_list = self.handoff.fetch(self.feature_list_path, lambda: read_json(self.feature_list_path))
+            X = self.handoff.fetch(self.features_path, lambda: load_feature_matrix(self.features_path))
+            y_df = self.handoff.fetch(self.target_path, lambda: pd.read_parquet(self.target_path, columns=['y_target']))
+            y = y_df['y_target'].values
+            logger.info(f"✅ Features chargées: {X.shape}")
+
+            return X, y, feature_list
+
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement: {e}")
+            return None, None, None
+
+    def find_near_constant(self, X, groups):
+        """Groupes dont toutes les colonnes ont une valeur dominante au-delà du seuil"""
+        logger.info("🧊 RECHERCHE DES FEATURES QUASI CONSTANTES")
+        logger.info("=" * 50)
+
+        dominant = {}
+        for col in X.columns:
+            counts = X[col].value_counts(normalize=True, dropna=False)
+            dominant[col] = float(counts.iloc[0]) if len(counts) else 1.0
+
+        dropped = [name for name, cols in groups.items()
+                   if all(dominant[X.columns[i]] >= self.near_constant_ratio for i in cols)]
+
+        logger.info(f"✅ {len(dropped)} groupes quasi constants: {dropped}")
+        return dropped
+
+    def compute_group_importance(self, X_train, y_train, groups):
+        """
+        Part d'importance de chaque groupe : forêt sonde entraînée sur le début de
+        X_train, permutation sur la tranche de validation qui le termine (sans
+        toucher au jeu de test), sinon importance d'impureté de la sonde
+        """
+        logger.info("🔍 IMPORTANCE DES GROUPES DE FEATURES")
+        logger.info("=" * 50)
+
+        X_fit, X_val, y_fit, y_val = self.trainer.create_temporal_split(X_train, y_train, self.validation_size)
+        params = self.trainer.get_rf_params()
+        params['n_estimators'] = self.eval_trees
+        probe = RandomForestRegressor(**params).fit(X_fit, y_fit)
+
+        permutation = self.trainer.compute_permutation_importance(probe, X_val, y_val, list(X_train.columns))
+        if permutation is not None:
+            scores = {record['group']: max(record['importance_mean'], 0.0) for record in permutation['groups']}
+            total = sum(scores.get(name, 0.0) for name in groups) or 1.0
+            logger.info(f"✅ Importance par permutation sur la validation ({len(y_val)} lignes de X_train)")
+            return {name: scores.get(name, 0.0) / total for name in groups}, "permutation_validation"
+
+        importance = probe.feature_importances_
+        logger.info(f"✅ Importance d'impureté d'une forêt sonde ({self.eval_trees} arbres)")
+        return {name: float(importance[cols].sum()) for name, cols in groups.items()}, "impurity"
+
+    def find_correlated(self, X, groups, shares, candidates):
+        """Parmi les features isolées, écarte celles trop corrélées à une feature plus importante"""
+        logger.info("🔗 RECHERCHE DES FEATURES CORRÉLÉES")
+        logger.info("=" * 50)
+
+        # Les blocs One-Hot restent entiers : seules les features à une colonne sont comparées
+        singles = [name for name in candidates if len(groups[name]) == 1]
+        singles.sort(key=lambda name: shares.get(name, 0.0), reverse=True)
+        if len(singles) < 2:
+            return {}
+
+        sample = X[singles]
+        if len(sample) > self.correlation_sample:
+            step = int(np.ceil(len(sample) / self.correlation_sample))
+            sample = sample.iloc[::step]
+
+        values = sample.to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.abs(np.corrcoef(values, rowvar=False))
+        corr = np.nan_to_num(corr)
+
+        # Glouton par importance décroissante
+        kept, dropped = [], {}
+        for i, name in enumerate(singles):
+            partner = next((singles[j] for j in kept if corr[i, j] >= self.max_correlation), None)
+            if partner is None:
+                kept.append(i)
+            else:
+                dropped[name] = partner
+
+        logger.info(f"✅ {len(dropped)} features corrélées à |r| ≥ {self.max_correlation}")
+        for name, partner in dropped.items():
+            logger.info(f"  - {name} ~ {partner}")
+        return dropped
+
+    def evaluate_selection(self, X_train, X_test, y_train, y_test, selected_columns):
+        """Compare temps d'entraînement/inférence et MAE (jeu de test, jamais vu par la sélection)"""
+        logger.info("⏱️ ÉVALUATION DE LA SÉLECTION")
+        logger.info("=" * 50)
+
+        try:
+            params = self.trainer.get_rf_params()
+            params['n_estimators'] = self.eval_trees
+
+            results = {}
+            for label, columns in (("full", list(X_train.columns)), ("pruned", selected_columns)):
+                start = time.perf_counter()
+                model = RandomForestRegressor(**params).fit(X_train[columns], y_train)
+                fit_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                y_pred = ForestInference(model).predict(X_test[columns])
+                predict_time = time.perf_counter() - start
+
+                results[label] = {
+                    "features": len(columns),
+                    "fit_seconds": fit_time,
+                    "predict_seconds": predict_time,
+                    "mae": float(mean_absolute_error(y_test, y_pred))
+                }
+                logger.info(f"  - {label}: {len(columns)} features, fit {fit_time:.2f}s, "
+                            f"predict {predict_time:.3f}s, MAE {results[label]['mae']:.4f}")
+
+            results["fit_speedup"] = results["full"]["fit_seconds"] / max(results["pruned"]["fit_seconds"], 1e-9)
+            results["predict_speedup"] = results["full"]["predict_seconds"] / max(results["pruned"]["predict_seconds"], 1e-9)
+            results["mae_delta"] = results["pruned"]["mae"] - results["full"]["mae"]
+
+            logger.info(f"📊 Accélération fit: x{results['fit_speedup']:.2f}, predict: x{results['predict_speedup']:.2f}")
+            logger.info(f"📊 Écart de MAE: {results['mae_delta']:+.4f}")
+            return results
+
+        except Exception as e:
+            logger.error(f"❌ Erreur évaluation: {e}")
+            return None
+
+    def save_selection(self, X, feature_list, selected_columns, dropped, evaluation, importance_source):
+        """Écrit la matrice réduite et sa liste de features à côté de la matrice complète"""
+        logger.info("💾 SAUVEGARDE DE LA SÉLECTION")
+        logger.info("=" * 50)
+
+        try:
+            X_selected = X[selected_columns]
+            def write_selected():
+                X_selected.to_parquet(self.selected_features_path, index=False, row_group_size=ROW_GROUP_SIZE)
+                save_feature_matrix(X_selected, self.selected_features_path)
+            self.handoff.publish(self.selected_features_path, X_selected, write_selected)
+            logger.info(f"✅ Features réduites sauvegardées: {self.selected_features_path}")
+
+            selected = set(selected_columns)
+            reduced_list = {
+                "feature_names": selected_columns,
+                "total_features": len(selected_columns),
+                "feature_categories": {
+                    category: [col for col in cols if col in selected]
+                    for category, cols in feature_list.get('feature_categories', {}).items()
+                },
+                "selection": {
+                    "source_features": X.shape[1],
+                    "importance_source": importance_source,
+                    "dropped": dropped,
+                    "report": str(self.report_path),
+                    "selected_at": datetime.now().isoformat()
+                }
+            }
+            self.handoff.publish(self.selected_feature_list_path, reduced_list,
+                                 lambda: write_json(reduced_list, self.selected_feature_list_path))
+            logger.info(f"✅ Liste des features sauvegardée: {self.selected_feature_list_path}")
+
+            report = {
+                "thresholds": {
+                    "near_constant_ratio": self.near_constant_ratio,
+                    "max_correlation": self.max_correlation,
+                    "min_importance_share": self.min_importance_share
+                },
+                "features_before": X.shape[1],
+                "features_after": len(selected_columns),
+                "dropped": dropped,
+                "evaluation": evaluation
+            }
+            # Tailles relevées après l'écriture de la matrice réduite (même file d'écriture)
+            def write_report():
+                report["file_size_before"] = self.features_path.stat().st_size
+                report["file_size_after"] = self.selected_features_path.stat().st_size
+                write_json(report, self.report_path)
+            self.handoff.persist(write_report, self.report_path)
+            logger.info(f"📋 Rapport sauvegardé: {self.report_path}")
+
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Erreur sauvegarde: {e}")
+            return False
+
+    def run_selection(self):
+        """Lance la sélection des features"""
+        logger.info("🚀 DÉBUT DE LA SÉLECTION DES FEATURES")
+        logger.info("=" * 60)
+
+        X, y, feature_list = self.load_data()
+        if X is None:
+            return False
+
+        try:
+            groups = build_feature_groups(list(X.columns))
+            X_train, X_test, y_train, y_test = self.trainer.create_temporal_split(X, y)
+            if X_train is None:
+                return False
+
+            # 1. Quasi constantes
+            near_constant = self.find_near_constant(X_train, groups)
+            candidates = [name for name in groups if name not in near_constant]
+
+            # 2. Importance par groupe
+            shares, importance_source = self.compute_group_importance(X_train, y_train, groups)
+            low_importance = [name for name in candidates if shares.get(name, 0.0) < self.min_importance_share]
+            # Toujours garder au moins le groupe le plus important
+            if len(low_importance) == len(candidates) and candidates:
+                low_importance.remove(max(candidates, key=lambda name: shares.get(name, 0.0)))
+            candidates = [name for name in candidates if name not in low_importance]
+            logger.info(f"✅ {len(low_importance)} groupes sous {self.min_importance_share:.2%} d'importance")
+
+            # 3. Corrélations
+            correlated = self.find_correlated(X_train, groups, shares, candidates)
+            candidates = [name for name in candidates if name not in correlated]
+
+        except Exception as e:
+            logger.error(f"❌ Erreur sélection: {e}")
+            return False
+
+        selected_columns = [X.columns[i] for name in candidates for i in groups[name]]
+        selected_columns = [col for col in X.columns if col in set(selected_columns)]
+        dropped = {
+            "near_constant": [X.columns[i] for name in near_constant for i in groups[name]],
+            "low_importance": [X.columns[i] for name in low_importance for i in groups[name]],
+            "correlated": correlated
+        }
+        logger.info(f"📊 Features: {X.shape[1]} → {len(selected_columns)}")
+
+        evaluation = self.evaluate_selection(X_train, X_test, y_train, y_test, selected_columns)
+        if evaluation is None:
+            return False
+
+        success = self.save_selection(X, feature_list, selected_columns, dropped, evaluation, importance_source)
+
+        if success:
+            logger.info("✅ SÉLECTION DES FEATURES TERMINÉE")
+            logger.info("=" * 60)
+            return True
+        else:
+            logger.error("❌ ÉCHEC DE LA SÉLECTION DES FEATURES")
+            return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sélection des features avant entraînement")
+    parser.add_argument("--near-constant-ratio", type=float, default=0.995,
+                        help="Part de la valeur dominante au-delà de laquelle une feature est quasi constante")
+    parser.add_argument("--max-correlation", type=float, default=0.98, help="Corrélation absolue maximale tolérée")
+    parser.add_argument("--min-importance-share", type=float, default=0.001,
+                        help="Part d'importance minimale d'un groupe de features")
+    parser.add_argument("--eval-trees", type=int, default=30, help="Arbres des forêts d'évaluation")
+    args = parser.parse_args()
+
+    selector = FeatureSelector(args.near_constant_ratio, args.max_correlation, args.min_importance_share,
+                               args.eval_trees)
+    selector.run_selection()
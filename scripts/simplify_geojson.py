@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Simplification du GeoJSON des départements pour la carte du dashboard.
+
+Produit plusieurs niveaux de détail (data/geojson/departements_<niveau>.geojson)
+à partir de data/departements.geojson :
+- les contours sont découpés en arcs aux points de jonction (points où les
+  voisins diffèrent d'un département à l'autre), comme en TopoJSON ;
+- chaque arc est simplifié une seule fois (Douglas-Peucker) et réutilisé par
+  les deux départements qui le partagent : les frontières restent communes,
+  sans trou ni chevauchement ;
+- les coordonnées sont arrondies à la précision du niveau et le JSON est
+  écrit sans espaces.
+"""
+
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Niveaux de détail : (tolérance en degrés, décimales conservées)
+# À l'échelle nationale (France ≈ 10° sur ~700 px), 1 px ≈ 0,015°
+TIERS = {
+    'high': (0.001, 4),
+    'medium': (0.005, 3),
+    'low': (0.015, 3)
+}
+
+
+def douglas_peucker(points, tolerance):
+    """Indices des points conservés d'une polyligne (extrémités toujours conservées)"""
+    coords = np.asarray(points, dtype=np.float64)
+    n = len(coords)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = coords[first], coords[last]
+        inner = coords[first + 1:last]
+        dx, dy = end - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            # Arc fermé : distance au point de départ
+            distances = np.hypot(inner[:, 0] - start[0], inner[:, 1] - start[1])
+        else:
+            distances = np.abs(dx * (inner[:, 1] - start[1]) - dy * (inner[:, 0] - start[0])) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+class GeoJSONSimplifier:
+    def __init__(self, input_path="data/departements.geojson", output_dir="data/geojson", tiers=None):
+        self.input_path = Path(input_path)
+        self.output_dir = Path(output_dir)
+        self.tiers = tiers or TIERS
+
+    def load(self):
+        """Charge le GeoJSON source"""
+        try:
+            with open(self.input_path, 'r', encoding='utf-8') as f:
+                geojson = json.load(f)
+            logger.info(f"✅ GeoJSON chargé: {self.input_path} ({len(geojson['features'])} départements)")
+            return geojson
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement GeoJSON: {e}")
+            return None
+
+    @staticmethod
+    def polygons(geometry):
+        """Polygones d'une géométrie (Polygon ou MultiPolygon)"""
+        if geometry['type'] == 'Polygon':
+            return [geometry['coordinates']]
+        return geometry['coordinates']
+
+    def find_junctions(self, geojson):
+        """Points partagés dont les voisins diffèrent d'un contour à l'autre"""
+        neighbors = {}
+        junctions = set()
+        for feature in geojson['features']:
+            for polygon in self.polygons(feature['geometry']):
+                for ring in polygon:
+                    points = [tuple(p) for p in ring[:-1]]
+                    n = len(points)
+                    for i, point in enumerate(points):
+                        pair = frozenset((points[i - 1], points[(i + 1) % n]))
+                        seen = neighbors.setdefault(point, pair)
+                        if seen != pair:
+                            junctions.add(point)
+        return junctions
+
+    @staticmethod
+    def canonical(arc, closed):
+        """Orientation (et rotation pour un contour sans jonction) commune aux deux départements voisins"""
+        if closed:
+            start = arc.index(min(arc[:-1]))
+            arc = arc[start:-1] + arc[:start + 1]
+        arc = tuple(arc)
+        reverse = arc[::-1]
+        return (reverse, True) if reverse < arc else (arc, False)
+
+    def simplify_arc(self, arc, closed, tolerance, cache):
+        """Arc simplifié, calculé une fois par arc partagé"""
+        key, flipped = self.canonical(arc, closed)
+        if key not in cache:
+            cache[key] = [key[i] for i in douglas_peucker(key, tolerance)]
+        simplified = cache[key]
+        return simplified[::-1] if flipped else simplified
+
+    def simplify_ring(self, ring, junctions, tolerance, decimals, cache):
+        """Contour simplifié et arrondi (le contour d'origine s'il dégénère)"""
+        points = [tuple(p) for p in ring[:-1]]
+        cuts = [i for i, point in enumerate(points) if point in junctions]
+
+        if not cuts:
+            result = self.simplify_arc(points + [points[0]], True, tolerance, cache)
+        else:
+            # Rotation sur la première jonction puis découpage en arcs de jonction à jonction
+            points = points[cuts[0]:] + points[:cuts[0]]
+            offsets = [i - cuts[0] for i in cuts] + [len(points)]
+            points = points + [points[0]]
+            result = [points[0]]
+            for first, last in zip(offsets[:-1], offsets[1:]):
+                result.extend(self.simplify_arc(points[first:last + 1], False, tolerance, cache)[1:])
+
+        rounded = []
+        for x, y in result:
+            point = [round(x, decimals), round(y, decimals)]
+            if not rounded or rounded[-1] != point:
+                rounded.append(point)
+        if len(rounded) < 4:
+            return [[round(x, decimals), round(y, decimals)] for x, y in ring]
+        return rounded
+
+    def simplify(self, geojson, tolerance, decimals):
+        """GeoJSON simplifié pour une tolérance et une précision"""
+        junctions = self.find_junctions(geojson)
+        cache = {}
+        features = []
+        for feature in geojson['features']:
+            polygons = [
+                [self.simplify_ring(ring, junctions, tolerance, decimals, cache) for ring in polygon]
+                for polygon in self.polygons(feature['geometry'])
+            ]
+            geometry = ({'type': 'Polygon', 'coordinates': polygons[0]} if feature['geometry']['type'] == 'Polygon'
+                        else {'type': 'MultiPolygon', 'coordinates': polygons})
+            features.append({'type': 'Feature', 'properties': feature['properties'], 'geometry': geometry})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    @staticmethod
+    def count_points(geojson):
+        return sum(len(ring) for feature in geojson['features']
+                   for polygon in GeoJSONSimplifier.polygons(feature['geometry']) for ring in polygon)
+
+    def run(self):
+        """Écrit un GeoJSON par niveau de détail"""
+        logger.info("🗺️ SIMPLIFICATION DU GEOJSON")
+        logger.info("=" * 50)
+        geojson = self.load()
+        if geojson is None:
+            return False
+
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            source_size = self.input_path.stat().st_size
+            source_points = self.count_points(geojson)
+            for tier, (tolerance, decimals) in self.tiers.items():
+                simplified = self.simplify(geojson, tolerance, decimals)
+                output_path = self.output_dir / f"departements_{tier}.geojson"
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(simplified, f, ensure_ascii=False, separators=(',', ':'))
+                size = output_path.stat().st_size
+                logger.info(f"✅ {tier}: {self.count_points(simplified):,} points / {source_points:,}, "
+                            f"{size / 1e3:,.0f} Ko ({source_size / size:.1f}x plus léger) → {output_path}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erreur simplification: {e}")
+            return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Niveaux de détail du GeoJSON des départements")
+    parser.add_argument("--input", default="data/departements.geojson", help="GeoJSON source")
+    parser.add_argument("--output-dir", default="data/geojson", help="Dossier des GeoJSON simplifiés")
+    args = parser.parse_args()
+
+    simplifier = GeoJSONSimplifier(args.input, args.output_dir)
+    if not simplifier.run():
+        sys.exit(1)
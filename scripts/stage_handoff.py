@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Passage en mémoire des sorties entre étapes du pipeline.
+
+En mode mémoire (run_pipeline.py --in-memory), une étape publie ses sorties
+(DataFrames, dicts de configuration, modèle) sous le chemin de leur fichier :
+les étapes suivantes les reçoivent directement, sans relecture, et l'écriture
+sur disque est faite par un thread d'arrière-plan dans l'ordre de publication.
+Hors mode mémoire, publish écrit immédiatement et fetch relit le fichier : les
+scripts lancés seuls gardent leur comportement.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def read_json(path):
+    """Lit un fichier JSON de configuration ou d'artefact"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(data, path):
+    """Écrit un fichier JSON de configuration ou d'artefact"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+class StageHandoff:
+    def __init__(self, in_memory=False):
+        self.in_memory = in_memory
+        self.objects = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        # Un seul thread d'écriture : un fichier réécrit par une étape aval l'est après la version amont
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='handoff-writer') if in_memory else None
+
+    def publish(self, path, obj, write):
+        """Rend obj disponible sous path et écrit le fichier (en arrière-plan en mode mémoire)"""
+        if not self.in_memory:
+            write()
+            return
+        with self.lock:
+            self.objects[str(path)] = obj
+        self.persist(write, path)
+
+    def persist(self, write, path):
+        """Écriture sans objet partagé (rapports, résumés)"""
+        if not self.in_memory:
+            write()
+            return
+        with self.lock:
+            self.pending.append((Path(path), self.writer.submit(write)))
+
+    def fetch(self, path, load):
+        """Objet publié sous path, sinon load() (lecture disque)"""
+        with self.lock:
+            obj = self.objects.get(str(path))
+        if obj is None:
+            return load()
+        logger.info(f"🧠 {Path(path).name} reçu en mémoire")
+        return obj
+
+    def available(self, path):
+        with self.lock:
+            return str(path) in self.objects or Path(path).exists()
+
+    def flush(self):
+        """Attend la fin des écritures en cours, renvoie False si l'une a échoué"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        success = True
+        for path, future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"❌ Erreur écriture différée {path}: {e}")
+                success = False
+        if pending:
+            logger.info(f"💾 {len(pending)} écriture(s) différée(s) terminée(s)")
+        return success
+
+    def close(self):
+        """Termine les écritures et libère les objets partagés"""
+        success = self.flush()
+        if self.writer is not None:
+            self.writer.shutdown()
+        with self.lock:
+            self.objects.clear()
+        return success
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Générateur vectorisé de charge synthétique pour les benchmarks LUMEN.
+
+Produit, dans un dossier de travail séparé de data/, les entrées du pipeline
+à l'échelle voulue (départements × années × features supplémentaires) :
+- data/raw/data_gouv_fr/*.json : passages aux urgences par département et par jour
+- data/raw/other/donnees_meteo.json et wikipedia_sante.json
+- data/processed/timeseries/daily_emergency_series_simple.parquet : série
+  quotidienne au schéma de la série réelle
+
+Les séries sont calculées par blocs de départements (matrice département ×
+date, sans boucle par jour) et écrites au fil de l'eau : la mémoire reste
+bornée par un bloc. Chaque bloc a son propre générateur aléatoire, dérivé de
+(seed, numéro de bloc) : le résultat ne dépend que de la graine.
+"""
+
+import json
+import logging
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from feature_matrix import ROW_GROUP_SIZE
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Départements de la série réelle (01 à 95 hors 20, plus la Corse)
+DEPARTMENTS = [f"{i:02d}" for i in range(1, 96) if i != 20] + ['2A', '2B']
+REGIONS = ['Île-de-France', 'Auvergne-Rhône-Alpes', 'Provence-Alpes-Côte d\'Azur', 'Occitanie',
+           'Nouvelle-Aquitaine', 'Grand Est', 'Hauts-de-France', 'Bretagne', 'Normandie',
+           'Pays de la Loire', 'Centre-Val de Loire', 'Bourgogne-Franche-Comté', 'Corse']
+
+# Départements générés ensemble (unité de tirage aléatoire et d'écriture)
+DEPARTMENT_BLOCK = 16
+
+# Niveaux de base (cas/jour), variabilité et probabilité de chaque profil
+PROFILES = np.array([[30, 15], [60, 25], [120, 40]], dtype=np.float64)
+PROFILE_WEIGHTS = [0.85, 0.08, 0.07]
+
+# Pics épidémiques : nombre par an, demi-largeur (jours) et décroissance
+PEAKS_PER_YEAR = (1, 3)
+PEAK_HALF_WIDTH = 14
+PEAK_DECAY = 5.0
+
+PEAK_MONTHS = [10, 11, 12, 1, 2, 3]
+
+
+class SyntheticWorkload:
+    def __init__(self, output_dir, n_departments=len(DEPARTMENTS), years=2, extra_features=0, seed=42,
+                 end_date='2024-12-30'):
+        self.output_dir = Path(output_dir)
+        self.data_dir = self.output_dir / "data"
+        self.raw_dir = self.data_dir / "raw"
+        self.timeseries_path = self.data_dir / "processed" / "timeseries" / "daily_emergency_series_simple.parquet"
+
+        self.n_departments = n_departments
+        self.years = years
+        self.extra_features = extra_features
+        self.seed = seed
+        self.dates = pd.date_range(end=pd.Timestamp(end_date), periods=int(round(years * 365.25)), freq='D')
+
+    def departments(self):
+        """Codes réels, puis codes synthétiques à trois chiffres au-delà de 96 départements"""
+        extra = [f"{i:03d}" for i in range(101, 101 + max(0, self.n_departments - len(DEPARTMENTS)))]
+        return (DEPARTMENTS + extra)[:self.n_departments]
+
+    def calendar(self):
+        """Colonnes calendaires communes à tous les départements (une valeur par date)"""
+        dates = self.dates
+        month = dates.month.to_numpy()
+        return {
+            'year': dates.year.to_numpy().astype(np.int64),
+            'month': month.astype(np.int64),
+            'day_of_week': dates.dayofweek.to_numpy().astype(np.int64),
+            'week_of_year': dates.isocalendar().week.to_numpy().astype(np.uint32),  # UInt32 dans la série réelle
+            'quarter': dates.quarter.to_numpy().astype(np.int64),
+            'is_weekend': (dates.dayofweek.to_numpy() >= 5).astype(np.int64),
+            'is_peak_season': np.isin(month, PEAK_MONTHS).astype(np.int64)
+        }
+
+    def block_cases(self, block):
+        """Cas quotidiens (n_départements_bloc × n_dates) d'un bloc, générateur propre au bloc"""
+        rng = np.random.default_rng([self.seed, block])
+        n_dept = min(DEPARTMENT_BLOCK, self.n_departments - block * DEPARTMENT_BLOCK)
+        n_dates = len(self.dates)
+
+        profile = PROFILES[rng.choice(len(PROFILES), size=n_dept, p=PROFILE_WEIGHTS)]
+        base, variability = profile[:, :1], profile[:, 1:]
+
+        # Saisonnalité : pic en janvier/février, creux en été
+        day_of_year = self.dates.dayofyear.to_numpy()
+        seasonal = -np.sin((day_of_year - 45) * 2 * np.pi / 365) * 0.5 + 0.5
+        cases = base * (0.5 + seasonal) + rng.normal(0, 1, (n_dept, n_dates)) * variability * 0.2
+
+        # Pics : impulsions aux centres, étalées par décalages successifs du noyau exponentiel
+        n_peaks = rng.integers(*PEAKS_PER_YEAR, size=n_dept, endpoint=True) * max(1, round(self.years))
+        rows = np.repeat(np.arange(n_dept), n_peaks)
+        impulses = np.zeros((n_dept, n_dates))
+        np.add.at(impulses, (rows, rng.integers(0, n_dates, size=len(rows))),
+                  rng.uniform(0.5, 1.5, size=len(rows)) * base[rows, 0])
+        for offset in range(-PEAK_HALF_WIDTH + 1, PEAK_HALF_WIDTH + 1):
+            weight = np.exp(-abs(offset) / PEAK_DECAY)
+            if offset >= 0:
+                cases[:, offset:] += weight * impulses[:, :n_dates - offset]
+            else:
+                cases[:, :offset] += weight * impulses[:, -offset:]
+
+        return np.maximum(10, np.round(cases)), rng
+
+    @staticmethod
+    def rolling_mean(values, window):
+        """Moyenne glissante par ligne (min_periods=1) par sommes cumulées"""
+        cumsum = np.cumsum(values, axis=1)
+        shifted = np.zeros_like(cumsum)
+        shifted[:, window:] = cumsum[:, :-window]
+        counts = np.minimum(np.arange(1, values.shape[1] + 1), window)
+        return (cumsum - shifted) / counts
+
+    def iter_blocks(self):
+        """Parcourt les blocs : (codes, cas, DataFrame de série quotidienne)"""
+        codes = self.departments()
+        calendar = self.calendar()
+        n_dates = len(self.dates)
+
+        for block in range(-(-self.n_departments // DEPARTMENT_BLOCK)):
+            block_codes = codes[block * DEPARTMENT_BLOCK:(block + 1) * DEPARTMENT_BLOCK]
+            cases, rng = self.block_cases(block)
+            n_rows = cases.size
+
+            columns = {
+                'date': np.tile(self.dates.to_numpy().astype('datetime64[ns]'), len(block_codes)),
+                'department': np.repeat(np.array(block_codes, dtype=object), n_dates),
+                'covid_cases': cases.ravel()
+            }
+            for name, values in calendar.items():
+                columns[name] = np.tile(values, len(block_codes))
+            columns['week_of_year'] = pd.array(columns['week_of_year'], dtype='UInt32')
+            columns['covid_cases_ma7'] = self.rolling_mean(cases, 7).ravel()
+            columns['covid_cases_ma30'] = self.rolling_mean(cases, 30).ravel()
+            for i in range(self.extra_features):
+                columns[f'extra_feature_{i}'] = rng.normal(0, 1, n_rows)
+
+            yield block_codes, cases, pd.DataFrame(columns)
+
+    def write_timeseries_and_raw(self):
+        """Écrit la série quotidienne (Parquet, bloc par bloc) et les passages data.gouv.fr (JSON par bloc)"""
+        self.timeseries_path.parent.mkdir(parents=True, exist_ok=True)
+        data_gouv_dir = self.raw_dir / "data_gouv_fr"
+        data_gouv_dir.mkdir(parents=True, exist_ok=True)
+
+        date_strings = self.dates.strftime('%Y-%m-%d').to_numpy()
+        writer = None
+        n_rows = 0
+        try:
+            for block, (block_codes, cases, series) in enumerate(self.iter_blocks()):
+                first = block * DEPARTMENT_BLOCK
+                table = pa.Table.from_pandas(series, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(self.timeseries_path, table.schema)
+                writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+                n_rows += len(series)
+
+                raw = pd.DataFrame({
+                    'date': np.tile(date_strings, len(block_codes)),
+                    'region': np.repeat([REGIONS[(first + i) % len(REGIONS)] for i in range(len(block_codes))],
+                                        len(self.dates)),
+                    'departement': series['department'].to_numpy(),
+                    'valeur': cases.ravel().astype(np.int64)
+                })
+                with open(data_gouv_dir / f"passages_urgences_{block:04d}.json", 'w', encoding='utf-8') as f:
+                    f.write('{"data": ' + raw.to_json(orient='records', force_ascii=False) + '}')
+        finally:
+            if writer is not None:
+                writer.close()
+        return n_rows
+
+    def write_other_raw(self):
+        """Météo horaire des 7 derniers jours par département et pages Wikipedia"""
+        other_dir = self.raw_dir / "other"
+        other_dir.mkdir(parents=True, exist_ok=True)
+        # Flux aléatoire suivant ceux des blocs de départements
+        rng = np.random.default_rng([self.seed, -(-self.n_departments // DEPARTMENT_BLOCK)])
+
+        hours = pd.date_range(end=self.dates[-1] + pd.Timedelta(hours=23), periods=7 * 24, freq='h')
+        times = hours.strftime('%Y-%m-%dT%H:%M').tolist()
+        codes = self.departments()
+        temperature = 8 + 6 * np.sin(np.arange(len(hours)) * 2 * np.pi / 24) + rng.normal(0, 2, (len(codes), len(hours)))
+        humidity = np.clip(rng.normal(75, 10, (len(codes), len(hours))), 20, 100)
+        precipitation = np.maximum(0, rng.normal(0, 0.5, (len(codes), len(hours))))
+
+        weather = {
+            code: {
+                "current": {"time": times[-1], "temperature_2m": round(float(temperature[i, -1]), 1)},
+                "hourly": {
+                    "time": times,
+                    "temperature_2m": np.round(temperature[i], 1).tolist(),
+                    "relative_humidity_2m": np.round(humidity[i]).tolist(),
+                    "precipitation": np.round(precipitation[i], 1).tolist()
+                }
+            }
+            for i, code in enumerate(codes)
+        }
+        with open(other_dir / "donnees_meteo.json", 'w', encoding='utf-8') as f:
+            json.dump(weather, f, ensure_ascii=False)
+
+        pages = {
+            title: {"summary": f"{title} : page synthétique.", "text": f"{title}. " * 200}
+            for title in ["Grippe", "Bronchiolite", "Urgences hospitalières", "Épidémie", "Vaccination"]
+        }
+        with open(other_dir / "wikipedia_sante.json", 'w', encoding='utf-8') as f:
+            json.dump(pages, f, ensure_ascii=False)
+
+    def generate(self):
+        """Génère toutes les entrées, renvoie un résumé (lignes, durée, débit)"""
+        logger.info("🎲 GÉNÉRATION DE LA CHARGE SYNTHÉTIQUE")
+        logger.info("=" * 50)
+        logger.info(f"📊 {self.n_departments} départements × {len(self.dates)} jours "
+                    f"({self.years} ans), {self.extra_features} features supplémentaires")
+
+        started = time.perf_counter()
+        n_rows = self.write_timeseries_and_raw()
+        self.write_other_raw()
+        duration = time.perf_counter() - started
+
+        summary = {
+            "departments": self.n_departments,
+            "years": self.years,
+            "dates": len(self.dates),
+            "extra_features": self.extra_features,
+            "seed": self.seed,
+            "rows": n_rows,
+            "wall_s": round(duration, 3),
+            "rows_per_s": round(n_rows / duration, 1) if duration > 0 else None,
+            "timeseries_bytes": self.timeseries_path.stat().st_size
+        }
+        logger.info(f"✅ {n_rows:,} lignes en {duration:.1f}s ({summary['rows_per_s']:,.0f} lignes/s): {self.data_dir}")
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère les entrées synthétiques du pipeline à l'échelle voulue")
+    parser.add_argument("--output-dir", default="bench/workload", help="Dossier de travail (contiendra data/)")
+    parser.add_argument("--departments", type=int, default=len(DEPARTMENTS), help="Nombre de départements")
+    parser.add_argument("--years", type=float, default=2, help="Années de données quotidiennes")
+    parser.add_argument("--extra-features", type=int, default=0, help="Colonnes numériques supplémentaires")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    args = parser.parse_args()
+
+    workload = SyntheticWorkload(args.output_dir, args.departments, args.years, args.extra_features, args.seed)
+    workload.generate()
@@ -10,33 +10,93 @@ from pathlib import Path
 import logging
 import json
 import joblib
-from datetime import datetime
+import argparse
+from datetime import datetime, timedelta
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import TimeSeriesSplit
+from concurrent.futures import ProcessPoolExecutor
+from forest_inference import ForestInference
+import pyarrow.parquet as pq
+from feature_matrix import load_feature_matrix, gather_parquet_rows, iter_parquet_rows, model_feature_paths
+from stage_handoff import StageHandoff, read_json, write_json
+import os
 import warnings
+import threading
+import multiprocessing
 warnings.filterwarnings('ignore')
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Variables catégorielles dont les colonnes One-Hot sont permutées ensemble
+ONE_HOT_PREFIXES = ['department', 'is_weekend', 'is_peak_season', 'month', 'quarter']
+
+def build_feature_groups(feature_names):
+    """Regroupe les colonnes One-Hot d'une même variable, les autres features restent seules"""
+    groups = {}
+    for idx, name in enumerate(feature_names):
+        group = name
+        for prefix in ONE_HOT_PREFIXES:
+            suffix = name[len(prefix) + 1:]
+            if name.startswith(prefix + '_') and suffix and '_' not in suffix:
+                group = f"{prefix}_*"
+                break
+        groups.setdefault(group, []).append(idx)
+    return groups
+
+# État des workers de permutation (initialisé une fois par processus)
+_permutation_state = {}
+
+def _init_permutation_worker(model, X, y, n_repeats, seed):
+    engine = ForestInference(model, n_jobs=1)
+    _permutation_state.update({
+        'engine': engine,
+        'X': X,
+        'y': y,
+        'n_repeats': n_repeats,
+        'seed': seed,
+        'baseline_mae': float(np.mean(np.abs(y - engine.predict(X))))
+    })
+
+def _permute_group(task):
+    """Permute un bloc de colonnes (même permutation de lignes) et mesure la hausse de MAE"""
+    group_id, name, columns = task
+    state = _permutation_state
+    X, y, engine = state['X'], state['y'], state['engine']
+    rng = np.random.default_rng(state['seed'] + group_id)
+    
+    original = X[:, columns].copy()
+    increases = []
+    try:
+        for _ in range(state['n_repeats']):
+            X[:, columns] = original[rng.permutation(len(y))]
+            mae = float(np.mean(np.abs(y - engine.predict(X))))
+            increases.append(mae - state['baseline_mae'])
+    finally:
+        X[:, columns] = original
+    
+    return name, float(np.mean(increases)), float(np.std(increases))
+
 class RandomForestTrainer:
-    def __init__(self):
+    def __init__(self, handoff=None):
         self.base_dir = Path("data")
+        # Features reçues des étapes amont et modèle publié en mémoire (mode pipeline --in-memory)
+        self.handoff = handoff or StageHandoff()
         self.features_dir = self.base_dir / "features"
         self.artifacts_dir = self.base_dir / "artifacts"
         self.artifacts_dir.mkdir(parents=True, exist_ok=True)
         
-        # Fichiers d'entrée
-        self.features_path = self.features_dir / "features.parquet"
+        # Fichiers d'entrée (matrice réduite par select_features.py si elle est à jour)
+        self.features_path, self.feature_list_path = model_feature_paths(self.features_dir, self.handoff)
         self.target_path = self.features_dir / "y_target.parquet"
-        self.feature_list_path = self.features_dir / "feature_list.json"
         
         # Fichiers de sortie
         self.model_path = self.artifacts_dir / "rf.joblib"
         self.feature_importance_path = self.artifacts_dir / "feature_importance.json"
         self.metrics_path = self.artifacts_dir / "metrics.json"
+        self.summary_path = self.artifacts_dir / "model_summary.json"
     
     def load_data(self):
         """Charge les features et la target"""
@@ -45,27 +105,26 @@ class RandomForestTrainer:
         
         try:
             # Charger les features
-            if not self.features_path.exists():
+            if not self.handoff.available(self.features_path):
                 logger.error(f"❌ Fichier features non trouvé: {self.features_path}")
                 return None, None, None
             
-            X = pd.read_parquet(self.features_path)
+            X = self.handoff.fetch(self.features_path, lambda: load_feature_matrix(self.features_path))
             logger.info(f"✅ Features chargées: {X.shape}")
             
             # Charger la target
-            if not self.target_path.exists():
+            if not self.handoff.available(self.target_path):
                 logger.error(f"❌ Fichier target non trouvé: {self.target_path}")
                 return None, None, None
             
-            y_df = pd.read_parquet(self.target_path)
+            y_df = self.handoff.fetch(self.target_path, lambda: pd.read_parquet(self.target_path))
             y = y_df['y_target'].values
             logger.info(f"✅ Target chargée: {len(y)} échantillons")
             
             # Charger la liste des features
             feature_list = {}
-            if self.feature_list_path.exists():
-                with open(self.feature_list_path, 'r', encoding='utf-8') as f:
-                    feature_list = json.load(f)
+            if self.handoff.available(self.feature_list_path):
+                feature_list = self.handoff.fetch(self.feature_list_path, lambda: read_json(self.feature_list_path))
                 logger.info(f"✅ Liste des features chargée: {len(feature_list.get('feature_names', []))} features")
             
             return X, y, feature_list
@@ -100,6 +159,18 @@ class RandomForestTrainer:
             logger.error(f"❌ Erreur split temporel: {e}")
             return None, None, None, None
     
+    def get_rf_params(self):
+        """Configuration du modèle RandomForest"""
+        return {
+            'n_estimators': 100,
+            'max_depth': 20,
+            'min_samples_split': 5,
+            'min_samples_leaf': 2,
+            'max_features': 'sqrt',
+            'random_state': 42,
+            'n_jobs': -1
+        }
+    
     def train_model(self, X_train, y_train):
         """Entraîne le modèle RandomForest"""
         logger.info("🤖 ENTRAÎNEMENT DU MODÈLE RANDOM FOREST")
@@ -107,15 +178,7 @@ class RandomForestTrainer:
         
         try:
             # Configuration du modèle
-            rf_params = {
-                'n_estimators': 100,
-                'max_depth': 20,
-                'min_samples_split': 5,
-                'min_samples_leaf': 2,
-                'max_features': 'sqrt',
-                'random_state': 42,
-                'n_jobs': -1
-            }
+            rf_params = self.get_rf_params()
             
             logger.info(f"📊 Paramètres du modèle: {rf_params}")
             
@@ -130,6 +193,181 @@ class RandomForestTrainer:
             logger.error(f"❌ Erreur entraînement: {e}")
             return None
     
+    def load_target_dates(self):
+        """Charge uniquement les dates de la target (alignées sur les lignes de features)"""
+        return pd.read_parquet(self.target_path, columns=['date'])['date']
+    
+    def load_existing_model(self):
+        """Charge le modèle existant et la lignée enregistrée dans le résumé"""
+        logger.info("📦 CHARGEMENT DU MODÈLE EXISTANT")
+        logger.info("=" * 50)
+        
+        try:
+            if not self.model_path.exists():
+                logger.error(f"❌ Modèle non trouvé: {self.model_path}")
+                return None, None
+            
+            model = joblib.load(self.model_path)
+            logger.info(f"✅ Modèle chargé: {len(model.estimators_)} arbres")
+            
+            lineage = []
+            if self.summary_path.exists():
+                with open(self.summary_path, 'r', encoding='utf-8') as f:
+                    lineage = json.load(f).get('lineage', [])
+            
+            # Modèle entraîné avant le suivi de la lignée : une génération initiale complète
+            if not lineage:
+                lineage = [{
+                    "generation": 0,
+                    "mode": "full",
+                    "trees_added": len(model.estimators_),
+                    "trees_retired": 0,
+                    "n_estimators": len(model.estimators_),
+                    "trained_at": None
+                }]
+            
+            return model, lineage
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement modèle: {e}")
+            return None, None
+    
+    def select_recent_window(self, X, y, dates, window_days=30, sample_size=None):
+        """Sélectionne les lignes des window_days derniers jours, éventuellement sous-échantillonnées"""
+        logger.info("🪟 SÉLECTION DE LA FENÊTRE RÉCENTE")
+        logger.info("=" * 50)
+        
+        try:
+            window_start = dates.max() - timedelta(days=window_days)
+            window_idx = np.flatnonzero((dates >= window_start).values)
+            
+            if sample_size and sample_size < len(window_idx):
+                rng = np.random.default_rng(len(window_idx))
+                window_idx = np.sort(rng.choice(window_idx, size=sample_size, replace=False))
+            
+            X_window = X.iloc[window_idx]
+            y_window = y[window_idx]
+            
+            logger.info(f"✅ Fenêtre: {window_start.date()} à {dates.max().date()}")
+            logger.info(f"  - Échantillons: {len(window_idx)}")
+            
+            return X_window, y_window, window_start
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur sélection fenêtre: {e}")
+            return None, None, None
+    
+    def train_incremental(self, model, X_window, y_window, n_new_trees, max_trees=None, generation=1):
+        """Ajoute n_new_trees arbres via warm_start puis retire les plus anciens au-delà de max_trees"""
+        logger.info("🌱 ENTRAÎNEMENT INCRÉMENTAL (WARM START)")
+        logger.info("=" * 50)
+        
+        try:
+            n_before = len(model.estimators_)
+            
+            # Graine propre à chaque génération pour ne pas rejouer les bootstraps précédents
+            model.set_params(
+                warm_start=True,
+                n_estimators=n_before + n_new_trees,
+                random_state=self.get_rf_params()['random_state'] + generation
+            )
+            model.fit(X_window, y_window)
+            logger.info(f"✅ {n_new_trees} arbres ajoutés ({n_before} → {len(model.estimators_)})")
+            
+            # Forêt glissante : les arbres sont dans l'ordre d'ajout, les plus anciens en tête
+            n_retired = 0
+            if max_trees and len(model.estimators_) > max_trees:
+                n_retired = len(model.estimators_) - max_trees
+                model.estimators_ = model.estimators_[n_retired:]
+                logger.info(f"♻️ {n_retired} arbres les plus anciens retirés")
+            
+            model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+            return model, n_retired
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur entraînement incrémental: {e}")
+            return None, 0
+    
+    def train_out_of_core(self, n_trees, trees_per_batch=10, sample_size=200000, test_size=0.2):
+        """
+        Entraîne la forêt par lots d'arbres, chaque lot sur un échantillon lu
+        dans les row groups Parquet : la mémoire est bornée par sample_size lignes.
+        """
+        logger.info("🧱 ENTRAÎNEMENT HORS MÉMOIRE (ROW GROUPS PARQUET)")
+        logger.info("=" * 50)
+        
+        try:
+            features_file = pq.ParquetFile(self.features_path)
+            target_file = pq.ParquetFile(self.target_path)
+            n_rows = features_file.metadata.num_rows
+            split_idx = int(n_rows * (1 - test_size))
+            sample_size = min(sample_size, split_idx)
+            
+            rf_params = self.get_rf_params()
+            logger.info(f"📊 {split_idx} lignes d'entraînement, {features_file.num_row_groups} row groups, "
+                        f"échantillon de {sample_size} lignes par lot de {trees_per_batch} arbres")
+            
+            model = None
+            for batch, first_tree in enumerate(range(0, n_trees, trees_per_batch)):
+                batch_trees = min(trees_per_batch, n_trees - first_tree)
+                seed = rf_params['random_state'] + batch
+                
+                # Échantillon propre au lot ; chaque arbre y tire ensuite son bootstrap
+                rng = np.random.default_rng(seed)
+                rows = np.sort(rng.choice(split_idx, size=sample_size, replace=False))
+                X_sample = gather_parquet_rows(features_file, rows)
+                y_sample = gather_parquet_rows(target_file, rows, ['y_target'], dtype=np.float64)['y_target'].to_numpy()
+                
+                batch_model = RandomForestRegressor(**{**rf_params, 'n_estimators': batch_trees, 'random_state': seed})
+                batch_model.fit(X_sample, y_sample)
+                
+                if model is None:
+                    model = batch_model
+                else:
+                    model.estimators_.extend(batch_model.estimators_)
+                logger.info(f"  - Lot {batch + 1}: {len(model.estimators_)}/{n_trees} arbres "
+                            f"({X_sample.to_numpy().nbytes / 1e6:.1f} Mo d'échantillon)")
+                del X_sample, y_sample, batch_model
+            
+            model.set_params(n_estimators=len(model.estimators_))
+            logger.info(f"✅ Forêt assemblée: {len(model.estimators_)} arbres")
+            return model, split_idx
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur entraînement hors mémoire: {e}")
+            return None, None
+    
+    def evaluate_out_of_core(self, model, split_idx, sample_size=200000):
+        """Évalue sur la période de test en parcourant les row groups, renvoie aussi un échantillon de test"""
+        logger.info("📊 ÉVALUATION DU MODÈLE (ROW GROUPS)")
+        logger.info("=" * 50)
+        
+        try:
+            features_file = pq.ParquetFile(self.features_path)
+            target_file = pq.ParquetFile(self.target_path)
+            n_rows = features_file.metadata.num_rows
+            
+            engine = ForestInference(model)
+            y_pred = np.concatenate([
+                engine.predict(chunk) for _, chunk in iter_parquet_rows(features_file, split_idx, n_rows)
+            ])
+            y_test = np.concatenate([
+                chunk['y_target'].to_numpy(dtype=np.float64)
+                for _, chunk in iter_parquet_rows(target_file, split_idx, n_rows, ['y_target'])
+            ])
+            metrics = self.score_predictions(y_test, y_pred)
+            
+            # Échantillon de test en mémoire pour l'importance par permutation
+            rng = np.random.default_rng(self.get_rf_params()['random_state'])
+            test_rows = np.sort(rng.choice(n_rows - split_idx, size=min(sample_size, n_rows - split_idx), replace=False))
+            X_test_sample = gather_parquet_rows(features_file, test_rows + split_idx)
+            
+            return metrics, X_test_sample, y_test[test_rows]
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur évaluation: {e}")
+            return None, None, None
+    
     def evaluate_model(self, model, X_test, y_test):
         """Évalue le modèle"""
         logger.info("📊 ÉVALUATION DU MODÈLE")
@@ -138,41 +376,44 @@ class RandomForestTrainer:
         try:
             # Prédictions
             y_pred = model.predict(X_test)
-            
-            # Métriques
-            mae = mean_absolute_error(y_test, y_pred)
-            mse = mean_squared_error(y_test, y_pred)
-            rmse = np.sqrt(mse)
-            r2 = r2_score(y_test, y_pred)
-            
-            # Métriques relatives
-            mae_relative = mae / np.mean(y_test) * 100
-            rmse_relative = rmse / np.mean(y_test) * 100
-            
-            metrics = {
-                "mae": float(mae),
-                "mse": float(mse),
-                "rmse": float(rmse),
-                "r2": float(r2),
-                "mae_relative": float(mae_relative),
-                "rmse_relative": float(rmse_relative),
-                "mean_target": float(np.mean(y_test)),
-                "std_target": float(np.std(y_test))
-            }
-            
-            logger.info(f"📊 MÉTRIQUES DU MODÈLE:")
-            logger.info(f"  - MAE: {mae:.2f} ({mae_relative:.1f}%)")
-            logger.info(f"  - RMSE: {rmse:.2f} ({rmse_relative:.1f}%)")
-            logger.info(f"  - R²: {r2:.3f}")
-            logger.info(f"  - Moyenne target: {np.mean(y_test):.2f}")
-            logger.info(f"  - Écart-type target: {np.std(y_test):.2f}")
-            
-            return metrics, y_pred
+            return self.score_predictions(y_test, y_pred), y_pred
             
         except Exception as e:
             logger.error(f"❌ Erreur évaluation: {e}")
             return None, None
     
+    def score_predictions(self, y_test, y_pred):
+        """Métriques de régression sur la période de test"""
+        # Métriques
+        mae = mean_absolute_error(y_test, y_pred)
+        mse = mean_squared_error(y_test, y_pred)
+        rmse = np.sqrt(mse)
+        r2 = r2_score(y_test, y_pred)
+        
+        # Métriques relatives
+        mae_relative = mae / np.mean(y_test) * 100
+        rmse_relative = rmse / np.mean(y_test) * 100
+        
+        metrics = {
+            "mae": float(mae),
+            "mse": float(mse),
+            "rmse": float(rmse),
+            "r2": float(r2),
+            "mae_relative": float(mae_relative),
+            "rmse_relative": float(rmse_relative),
+            "mean_target": float(np.mean(y_test)),
+            "std_target": float(np.std(y_test))
+        }
+        
+        logger.info(f"📊 MÉTRIQUES DU MODÈLE:")
+        logger.info(f"  - MAE: {mae:.2f} ({mae_relative:.1f}%)")
+        logger.info(f"  - RMSE: {rmse:.2f} ({rmse_relative:.1f}%)")
+        logger.info(f"  - R²: {r2:.3f}")
+        logger.info(f"  - Moyenne target: {np.mean(y_test):.2f}")
+        logger.info(f"  - Écart-type target: {np.std(y_test):.2f}")
+        
+        return metrics
+    
     def analyze_feature_importance(self, model, feature_names):
         """Analyse l'importance des features"""
         logger.info("🔍 ANALYSE DE L'IMPORTANCE DES FEATURES")
@@ -210,31 +451,85 @@ class RandomForestTrainer:
             logger.error(f"❌ Erreur analyse importance: {e}")
             return None
     
-    def save_artifacts(self, model, metrics, feature_importance, feature_list):
+    def compute_permutation_importance(self, model, X_test, y_test, feature_names,
+                                       sample_size=5000, n_repeats=3, n_jobs=None):
+        """Importance par permutation (hausse de MAE), un groupe de features par tâche"""
+        logger.info("🔀 IMPORTANCE PAR PERMUTATION")
+        logger.info("=" * 50)
+        
+        try:
+            # Sous-échantillon stratifié sur la distribution de la target (quantiles réguliers)
+            y_test = np.asarray(y_test, dtype=np.float64)
+            sample_size = min(sample_size, len(y_test))
+            order = np.argsort(y_test, kind='stable')
+            sample_idx = np.sort(order[np.linspace(0, len(y_test) - 1, sample_size).astype(int)])
+            
+            X_rows = X_test.iloc[sample_idx] if isinstance(X_test, pd.DataFrame) else X_test[sample_idx]
+            X_sample = ForestInference(model).prepare_input(X_rows).copy(order='F')
+            y_sample = y_test[sample_idx]
+            
+            groups = build_feature_groups(feature_names)
+            tasks = [(i, name, columns) for i, (name, columns) in enumerate(groups.items())]
+            n_workers = max(1, min(n_jobs or os.cpu_count() or 1, len(tasks)))
+            logger.info(f"📊 {len(tasks)} groupes, {sample_size} échantillons, {n_repeats} répétitions, {n_workers} processus")
+            
+            seed = self.get_rf_params()['random_state']
+            # fork n'est sûr que sans autre thread actif (pipeline en processus unique : spawn)
+            mp_context = None if threading.active_count() == 1 else multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_permutation_worker,
+                                     initargs=(model, X_sample, y_sample, n_repeats, seed)) as executor:
+                results = list(executor.map(_permute_group, tasks, chunksize=max(1, len(tasks) // (4 * n_workers))))
+            
+            names = list(feature_names)
+            records = sorted([
+                {
+                    "group": name,
+                    "features": [names[i] for i in groups[name]],
+                    "importance_mean": mean,
+                    "importance_std": std
+                }
+                for name, mean, std in results
+            ], key=lambda r: r['importance_mean'], reverse=True)
+            
+            logger.info("🏆 TOP 10 GROUPES (PERMUTATION):")
+            for record in records[:10]:
+                logger.info(f"  {record['group']}: {record['importance_mean']:.4f} ± {record['importance_std']:.4f}")
+            
+            return {
+                "metric": "mae_increase",
+                "sample_size": int(sample_size),
+                "n_repeats": n_repeats,
+                "groups": records
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Erreur importance par permutation: {e}")
+            return None
+    
+    def save_artifacts(self, model, metrics, feature_importance, feature_list, lineage=None):
         """Sauvegarde les artefacts du modèle"""
         logger.info("💾 SAUVEGARDE DES ARTEFACTS")
         logger.info("=" * 50)
         
         try:
             # Sauvegarder le modèle
-            joblib.dump(model, self.model_path)
+            self.handoff.publish(self.model_path, model, lambda: joblib.dump(model, self.model_path))
             logger.info(f"✅ Modèle sauvegardé: {self.model_path}")
             
             # Sauvegarder les métriques
-            with open(self.metrics_path, 'w', encoding='utf-8') as f:
-                json.dump(metrics, f, indent=2, ensure_ascii=False)
+            self.handoff.persist(lambda: write_json(metrics, self.metrics_path), self.metrics_path)
             logger.info(f"✅ Métriques sauvegardées: {self.metrics_path}")
             
             # Sauvegarder l'importance des features
-            with open(self.feature_importance_path, 'w', encoding='utf-8') as f:
-                json.dump(feature_importance, f, indent=2, ensure_ascii=False)
+            self.handoff.persist(lambda: write_json(feature_importance, self.feature_importance_path),
+                                 self.feature_importance_path)
             logger.info(f"✅ Importance des features sauvegardée: {self.feature_importance_path}")
             
             # Créer un résumé
             summary = {
                 "model_info": {
                     "type": "RandomForestRegressor",
-                    "n_estimators": model.n_estimators,
+                    "n_estimators": len(model.estimators_),
                     "max_depth": model.max_depth,
                     "features_count": len(feature_list.get('feature_names', [])),
                     "trained_at": datetime.now().isoformat()
@@ -243,21 +538,20 @@ class RandomForestTrainer:
                 "feature_importance": {
                     "top_5_features": feature_importance.get('top_10_features', [])[:5],
                     "total_features": feature_importance.get('total_features', 0)
-                }
+                },
+                "lineage": lineage or []
             }
             
-            summary_path = self.artifacts_dir / "model_summary.json"
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                json.dump(summary, f, indent=2, ensure_ascii=False)
+            self.handoff.persist(lambda: write_json(summary, self.summary_path), self.summary_path)
             
-            logger.info(f"📋 Résumé du modèle sauvegardé: {summary_path}")
+            logger.info(f"📋 Résumé du modèle sauvegardé: {self.summary_path}")
             return True
             
         except Exception as e:
             logger.error(f"❌ Erreur sauvegarde: {e}")
             return False
     
-    def run_training(self):
+    def run_training(self, permutation=True):
         """Lance l'entraînement complet"""
         logger.info("🚀 DÉBUT DE L'ENTRAÎNEMENT DU MODÈLE")
         logger.info("=" * 60)
@@ -288,8 +582,23 @@ class RandomForestTrainer:
         if feature_importance is None:
             return False
         
-        # Sauvegarder les artefacts
-        success = self.save_artifacts(model, metrics, feature_importance, feature_list)
+        # Importance par permutation (non bloquante)
+        if permutation:
+            permutation_importance = self.compute_permutation_importance(model, X_test, y_test, feature_names)
+            if permutation_importance is not None:
+                feature_importance['permutation_importance'] = permutation_importance
+        
+        # Sauvegarder les artefacts (un entraînement complet démarre une nouvelle lignée)
+        lineage = [{
+            "generation": 0,
+            "mode": "full",
+            "trees_added": len(model.estimators_),
+            "trees_retired": 0,
+            "n_estimators": len(model.estimators_),
+            "training_rows": len(y_train),
+            "trained_at": datetime.now().isoformat()
+        }]
+        success = self.save_artifacts(model, metrics, feature_importance, feature_list, lineage)
         
         if success:
             logger.info("✅ ENTRAÎNEMENT TERMINÉ AVEC SUCCÈS")
@@ -302,6 +611,161 @@ class RandomForestTrainer:
             logger.error("❌ ÉCHEC DE L'ENTRAÎNEMENT")
             return False
 
+    def run_incremental_training(self, n_new_trees=10, window_days=30, max_trees=None, sample_size=None,
+                                 permutation=True):
+        """Rafraîchit le modèle existant avec quelques arbres entraînés sur les données récentes"""
+        logger.info("🚀 DÉBUT DU RÉENTRAÎNEMENT INCRÉMENTAL")
+        logger.info("=" * 60)
+        
+        # Charger le modèle existant et les données
+        model, lineage = self.load_existing_model()
+        if model is None:
+            return False
+        
+        X, y, feature_list = self.load_data()
+        if X is None:
+            return False
+        dates = self.load_target_dates()
+        
+        # Fenêtre récente pour les nouveaux arbres
+        X_window, y_window, window_start = self.select_recent_window(X, y, dates, window_days, sample_size)
+        if X_window is None:
+            return False
+        
+        generation = max(entry['generation'] for entry in lineage) + 1
+        model, n_retired = self.train_incremental(model, X_window, y_window, n_new_trees, max_trees, generation)
+        if model is None:
+            return False
+        
+        # Évaluer sur le jeu de test de l'entraînement complet (jamais vu par les anciens arbres),
+        # privé des lignes de la fenêtre sur laquelle les nouveaux arbres viennent d'être entraînés
+        _, X_test, _, y_test = self.create_temporal_split(X, y)
+        if X_test is None:
+            return False
+        outside_window = (dates.iloc[len(X) - len(X_test):] < window_start).values
+        X_test, y_test = X_test[outside_window], y_test[outside_window]
+        logger.info(f"  - Test hors fenêtre: {len(y_test)} échantillons "
+                    f"({(~outside_window).sum()} lignes de la fenêtre retirées)")
+        if len(y_test) == 0:
+            logger.error("❌ Aucune ligne de test hors de la fenêtre récente")
+            return False
+        
+        metrics, y_pred = self.evaluate_model(model, X_test, y_test)
+        if metrics is None:
+            return False
+        
+        feature_names = feature_list.get('feature_names', X.columns.tolist())
+        feature_importance = self.analyze_feature_importance(model, feature_names)
+        if feature_importance is None:
+            return False
+        
+        if permutation:
+            permutation_importance = self.compute_permutation_importance(model, X_test, y_test, feature_names)
+            if permutation_importance is not None:
+                feature_importance['permutation_importance'] = permutation_importance
+        
+        lineage.append({
+            "generation": generation,
+            "mode": "incremental",
+            "trees_added": n_new_trees,
+            "trees_retired": n_retired,
+            "n_estimators": len(model.estimators_),
+            "training_rows": len(y_window),
+            "window_start": window_start.isoformat(),
+            "window_end": dates.max().isoformat(),
+            "trained_at": datetime.now().isoformat()
+        })
+        success = self.save_artifacts(model, metrics, feature_importance, feature_list, lineage)
+        
+        if success:
+            logger.info("✅ RÉENTRAÎNEMENT INCRÉMENTAL TERMINÉ")
+            logger.info("=" * 60)
+            logger.info(f"🌲 Génération {generation}: +{n_new_trees} / -{n_retired} arbres, {len(model.estimators_)} au total")
+            logger.info(f"🎯 MAE: {metrics['mae']:.2f} ({metrics['mae_relative']:.1f}%)")
+            return True
+        else:
+            logger.error("❌ ÉCHEC DU RÉENTRAÎNEMENT INCRÉMENTAL")
+            return False
+
+    def run_out_of_core_training(self, n_trees=None, trees_per_batch=10, sample_size=None, permutation=True):
+        """Entraînement complet sans charger la matrice de features en mémoire"""
+        logger.info("🚀 DÉBUT DE L'ENTRAÎNEMENT HORS MÉMOIRE")
+        logger.info("=" * 60)
+        
+        if not self.features_path.exists() or not self.target_path.exists():
+            logger.error(f"❌ Fichiers d'entrée non trouvés: {self.features_path}, {self.target_path}")
+            return False
+        
+        feature_list = {}
+        if self.feature_list_path.exists():
+            with open(self.feature_list_path, 'r', encoding='utf-8') as f:
+                feature_list = json.load(f)
+        
+        n_trees = n_trees or self.get_rf_params()['n_estimators']
+        sample_size = sample_size or 200000
+        model, split_idx = self.train_out_of_core(n_trees, trees_per_batch, sample_size)
+        if model is None:
+            return False
+        
+        metrics, X_test, y_test = self.evaluate_out_of_core(model, split_idx, sample_size)
+        if metrics is None:
+            return False
+        
+        feature_names = feature_list.get('feature_names', X_test.columns.tolist())
+        feature_importance = self.analyze_feature_importance(model, feature_names)
+        if feature_importance is None:
+            return False
+        
+        if permutation:
+            permutation_importance = self.compute_permutation_importance(model, X_test, y_test, feature_names)
+            if permutation_importance is not None:
+                feature_importance['permutation_importance'] = permutation_importance
+        
+        lineage = [{
+            "generation": 0,
+            "mode": "out_of_core",
+            "trees_added": len(model.estimators_),
+            "trees_retired": 0,
+            "n_estimators": len(model.estimators_),
+            "training_rows": split_idx,
+            "sample_size": sample_size,
+            "trees_per_batch": trees_per_batch,
+            "trained_at": datetime.now().isoformat()
+        }]
+        success = self.save_artifacts(model, metrics, feature_importance, feature_list, lineage)
+        
+        if success:
+            logger.info("✅ ENTRAÎNEMENT HORS MÉMOIRE TERMINÉ")
+            logger.info("=" * 60)
+            logger.info(f"🎯 MAE Final: {metrics['mae']:.2f} ({metrics['mae_relative']:.1f}%)")
+            logger.info(f"💾 Modèle sauvegardé: {self.model_path}")
+            return True
+        else:
+            logger.error("❌ ÉCHEC DE L'ENTRAÎNEMENT HORS MÉMOIRE")
+            return False
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement du modèle RandomForest")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Ajoute des arbres au modèle existant au lieu de tout réentraîner")
+    parser.add_argument("--new-trees", type=int, default=10, help="Nombre d'arbres ajoutés (mode incrémental)")
+    parser.add_argument("--window-days", type=int, default=30, help="Fenêtre récente utilisée pour les nouveaux arbres")
+    parser.add_argument("--max-trees", type=int, default=None, help="Taille max de la forêt (retire les plus anciens)")
+    parser.add_argument("--sample-size", type=int, default=None,
+                        help="Sous-échantillon de la fenêtre récente, ou lignes par lot en mode hors mémoire")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Entraîne par lots d'arbres en lisant les row groups Parquet (mémoire bornée)")
+    parser.add_argument("--trees", type=int, default=None, help="Nombre total d'arbres (mode hors mémoire)")
+    parser.add_argument("--trees-per-batch", type=int, default=10, help="Arbres entraînés par échantillon (mode hors mémoire)")
+    parser.add_argument("--skip-permutation", action="store_true", help="Ne calcule pas l'importance par permutation")
+    args = parser.parse_args()
+    
     trainer = RandomForestTrainer()
-    trainer.run_training()
+    if args.out_of_core:
+        trainer.run_out_of_core_training(args.trees, args.trees_per_batch, args.sample_size,
+                                         permutation=not args.skip_permutation)
+    elif args.incremental:
+        trainer.run_incremental_training(args.new_trees, args.window_days, args.max_trees, args.sample_size,
+                                         permutation=not args.skip_permutation)
+    else:
+        trainer.run_training(permutation=not args.skip_permutation)